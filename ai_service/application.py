@@ -1,5 +1,7 @@
+import hmac
+import json
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
 
 app = Flask(__name__)
 
@@ -10,6 +12,8 @@ try:
 except ImportError:
     pass
 
+from idempotency import idempotent
+
 def _check_api_keys():
     """Return which API keys are configured (for diagnostics; never log actual keys)."""
     keys = {}
@@ -29,6 +33,15 @@ _api_keys = _check_api_keys()
 _configured = [k for k, v in _api_keys.items() if v]
 print(f"[AI] Startup: API keys configured: {_configured or 'NONE (will use template fallback)'}")
 
+# Open pooled keep-alive connections to configured providers in the background
+if os.environ.get("LLM_PREWARM", "1") == "1":
+    try:
+        import llm_transport
+        from llm_client import configured_provider_names
+        llm_transport.prewarm_async(configured_provider_names())
+    except Exception as e:
+        print(f"[AI] Prewarm skipped: {e}")
+
 LEVELS = ["beginner", "intermediate", "advanced"]
 MCQS_PER_CHAPTER = 5
 MAX_MCQS_PER_CHAPTER = 5
@@ -144,19 +157,83 @@ def _ensure_unit_format(unit, domain):
     u["mcqs"] = [_ensure_mcq_format(m) for m in mcqs[:MAX_MCQS_PER_CHAPTER]]
     return u
 
+NODE_COLORS = ["#3B82F6", "#10B981", "#F59E0B", "#8B5CF6", "#EC4899", "#06B6D4", "#EF4444", "#84CC16"]
+
+def _node_config(unit):
+    """UI node placement for one unit (alternating sides, colour cycles by unit number)."""
+    n = unit["unit_number"]
+    return {"unit": n, "offset": "left" if (n - 1) % 2 == 0 else "right", "color": NODE_COLORS[(n - 1) % len(NODE_COLORS)]}
+
 def _build_payload_from_ai(ai_result, domain):
     """Convert AI result to full roadmap payload."""
     units = ai_result.get("units") or []
     units = [_ensure_unit_format(u, domain) for u in units]
     units = normalize_units_mcqs(units, domain)
-    colors = ["#3B82F6", "#10B981", "#F59E0B", "#8B5CF6", "#EC4899", "#06B6D4", "#EF4444", "#84CC16"]
-    node_config = [{"unit": u["unit_number"], "offset": "left" if (u["unit_number"] - 1) % 2 == 0 else "right", "color": colors[(u["unit_number"] - 1) % len(colors)]} for u in units]
+    node_config = [_node_config(u) for u in units]
     return {
         "roadmap": {"domain": domain, "units": units},
         "ui_metadata": {"node_config": node_config},
         "gamification": {"daily_streak_goal_xp": 50},
     }
 
+def _flag(value):
+    """Parse an optional boolean request flag; None when absent."""
+    if value is None:
+        return None
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def _hedge_requested(data):
+    """Per-request opt-in to hedged provider calls; None defers to LLM_HEDGE."""
+    value = data.get("hedge")
+    if value is None and has_request_context():
+        value = request.headers.get("X-LLM-Hedge")
+    return _flag(value)
+
+OVERLOADED_BODY = {"error": "AI providers are at capacity, retry later"}
+
+
+def _retry_after(seconds):
+    return str(max(1, int(seconds + 0.999)))
+
+
+def _overloaded(retry_after_s):
+    """503 with Retry-After: shed the request instead of queueing it behind saturated providers."""
+    return jsonify(OVERLOADED_BODY), 503, {"Retry-After": _retry_after(retry_after_s)}
+
+
+def _shed_stream():
+    """Reject a streaming request up front; once a stream starts its status can no longer change."""
+    from llm_client import would_shed
+    import llm_transport
+    return _overloaded(llm_transport.QUEUE_BUDGET_S) if would_shed() else None
+
+
+from llm_client import LLMOverloaded
+
+
+@app.errorhandler(LLMOverloaded)
+def handle_llm_overloaded(e):
+    return _overloaded(e.retry_after_s)
+
+
+import deadline as _deadline
+
+
+@app.before_request
+def _start_deadline():
+    """Request deadline from X-Request-Timeout-Ms: LLM calls give up in time for the template fallback."""
+    g.deadline_token = _deadline.set_current(_deadline.parse(request.headers.get(_deadline.HEADER)))
+
+
+@app.teardown_request
+def _end_deadline(_exc=None):
+    token = g.pop("deadline_token", None)
+    if token is not None:
+        try:
+            _deadline.reset(token)
+        except ValueError:
+            pass  # streamed response finished in another context
+
 # ========== API Endpoints ==========
 @app.route("/health", methods=["GET"])
 def health():
@@ -170,86 +247,387 @@ def health():
     }), 200
 
 
+@app.route("/llm/connections", methods=["GET"])
+def llm_connections():
+    """Per-provider pooled connection stats (requests, errors, reuse ratio)."""
+    import llm_transport
+    return jsonify({"providers": llm_transport.connection_stats()}), 200
+
+
+@app.route("/llm/routing", methods=["GET"])
+def llm_routing():
+    """Provider routing decisions: current try-order, breaker state, success rate, p50/p95."""
+    from llm_client import routing_snapshot
+    return jsonify(routing_snapshot()), 200
+
+
+NO_LLM_ANSWER = (
+    "No LLM is available (no API keys on this service or all providers failed). "
+    "In Render, add GEMINI_API_KEY, GROQ_API_KEY, or OPENAI_API_KEY to **this** Python web service "
+    "(not only the Node backend), then redeploy."
+)
+
+
+def _ask_prompt(question):
+    return (
+        "You are a concise career and learning coach for EduRoute. "
+        "Answer in clear plain text. Prefer short paragraphs and bullet points when helpful. "
+        "Stay under about 400 words unless the user explicitly asks for depth.\n\n"
+        f"User: {question}"
+    )
+
+
+def _sse(data, event=None):
+    """Format one server-sent event."""
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data)}\n\n"
+
+
 @app.route("/ask_ai", methods=["POST"])
+@idempotent
 def ask_ai():
     """Chat Q&A — same contract as backend `aiController.chat` (expects `answer` in JSON)."""
+    if "text/event-stream" in (request.headers.get("Accept") or ""):
+        return ask_ai_stream()
     data = request.get_json() or {}
     question = (data.get("question") or "").strip()
     if not question:
         return jsonify({"error": "question required"}), 400
     from llm_client import call_llm
 
-    prompt = (
-        "You are a concise career and learning coach for EduRoute. "
-        "Answer in clear plain text. Prefer short paragraphs and bullet points when helpful. "
-        "Stay under about 400 words unless the user explicitly asks for depth.\n\n"
-        f"User: {question}"
-    )
-    answer = call_llm(prompt)
+    answer = call_llm(_ask_prompt(question), hedge=_hedge_requested(data))
     if not answer:
-        answer = (
-            "No LLM is available (no API keys on this service or all providers failed). "
-            "In Render, add GEMINI_API_KEY, GROQ_API_KEY, or OPENAI_API_KEY to **this** Python web service "
-            "(not only the Node backend), then redeploy."
-        )
+        answer = NO_LLM_ANSWER
     return jsonify({"answer": answer}), 200
 
 
+@app.route("/ask_ai/stream", methods=["POST"])
+def ask_ai_stream():
+    """
+    Streaming chat Q&A over Server-Sent Events.
+    Emits `data: {"token": ...}` per chunk, then `event: done` with provider and time-to-first-token.
+    """
+    data = request.get_json() or {}
+    question = (data.get("question") or "").strip()
+    if not question:
+        return jsonify({"error": "question required"}), 400
+    shed = _shed_stream()
+    if shed:
+        return shed
+    from llm_client import stream_llm
+
+    def events():
+        meta = {}
+        sent = False
+        for chunk in stream_llm(_ask_prompt(question), meta):
+            sent = True
+            yield _sse({"token": chunk})
+        if not sent:
+            yield _sse({"token": NO_LLM_ANSWER})
+        yield _sse({"provider": meta.get("provider"), "ttft_ms": meta.get("ttft_ms")}, event="done")
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _schedule_prefetch(domain, units):
+    """Speculatively generate the chapters after the last unit just served (see chapter_prefetch)."""
+    numbers = [u.get("unit_number") for u in units if isinstance(u.get("unit_number"), int)]
+    if numbers:
+        from chapter_prefetch import prefetcher
+        prefetcher.schedule(domain, max(numbers))
+
+
+@app.route("/llm/idempotency", methods=["GET"])
+def llm_idempotency():
+    """Idempotency-Key store: executed vs replayed/attached retries."""
+    from idempotency import store
+    return jsonify(store.describe()), 200
+
+
+@app.route("/llm/prefetch", methods=["GET"])
+def llm_prefetch():
+    """Speculative chapter prefetch: queue depth, provider budget usage and hit rate."""
+    from chapter_prefetch import prefetcher
+    return jsonify(prefetcher.describe()), 200
+
+
+@app.route("/llm/jobs", methods=["GET"])
+def llm_jobs():
+    """Async job queue: worker threads and jobs per status."""
+    from jobs import job_queue
+    return jsonify(job_queue.describe()), 200
+
+
+@app.route("/llm/brownout", methods=["GET"])
+def llm_brownout():
+    """Brownout controller: whether roadmap requests are being degraded, and the SLO signals."""
+    from brownout import brownout
+    return jsonify(brownout.describe()), 200
+
+
 @app.route("/generate-roadmap", methods=["POST"])
+@idempotent
 def generate_roadmap():
     """Generate roadmap using AI (Gemini/Groq/OpenAI). Falls back to templates if AI fails."""
     data = request.get_json() or {}
+    if _flag(request.args.get("async")):
+        return _submit_roadmap_job(data)
+    payload, cache_status = _roadmap_payload(data)
+    return jsonify(payload), 200, {"X-Cache": cache_status}
+
+
+def _roadmap_payload(data, degrade=True):
+    """Build the /generate-roadmap response body. Returns (payload, cache_status)."""
     domain = (data.get("domain") or "General").strip()
     proficiency = data.get("proficiency_level") or ""
     goal = data.get("professional_goal") or ""
     status = data.get("current_status") or ""
 
-    # Try AI first
-    from llm_client import generate_roadmap_via_ai
-    ai_result = generate_roadmap_via_ai(domain, proficiency, goal, status, start_unit=1, count=8)
+    # Try AI first (served from the roadmap cache when an identical request was generated recently)
+    from roadmap_cache import get_roadmap
+    ai_result, cache_status = get_roadmap(domain, proficiency, goal, status, start_unit=1, count=8,
+                                        hedge=_hedge_requested(data), fanout=_flag(data.get("fanout")), degrade=degrade)
+    return _roadmap_payload_from(domain, ai_result, cache_status), cache_status
+
+
+def _degraded(cache_status):
+    """Whether a roadmap result was served by the brownout instead of a fresh generation."""
+    from roadmap_cache import BROWNOUT, EXPIRED
+    return cache_status in (BROWNOUT, EXPIRED)
 
+
+def _roadmap_payload_from(domain, ai_result, cache_status):
+    """/generate-roadmap body from a generation result, falling back to templates when it is empty."""
     if ai_result and ai_result.get("units"):
         payload = _build_payload_from_ai(ai_result, domain)
-        print(f"[AI] Roadmap generated for '{domain}' via LLM")
-        return jsonify(payload), 200
+        print(f"[AI] Roadmap generated for '{domain}' via LLM (cache {cache_status})")
+        _schedule_prefetch(domain, payload["roadmap"]["units"])
+        if _degraded(cache_status):
+            payload["degraded"] = True
+        return payload
 
-    # Fallback: template-based (no API keys or all APIs failed)
-    configured = [k for k, v in _check_api_keys().items() if v]
-    print(f"[AI] Fallback: using templates for '{domain}' — keys present: {configured or 'NONE'}. Set GEMINI_API_KEY etc. in Render env vars (AI service, not backend).")
+    if _degraded(cache_status):
+        print(f"[AI] Brownout: using templates for '{domain}'")
+    else:
+        # Fallback: template-based (no API keys or all APIs failed)
+        configured = [k for k, v in _check_api_keys().items() if v]
+        print(f"[AI] Fallback: using templates for '{domain}' — keys present: {configured or 'NONE'}. Set GEMINI_API_KEY etc. in Render env vars (AI service, not backend).")
     units = [_fallback_unit(i, domain) for i in range(1, 9)]
     units = normalize_units_mcqs(units, domain)
-    colors = ["#3B82F6", "#10B981", "#F59E0B"]
-    node_config = [{"unit": u["unit_number"], "offset": "left" if (u["unit_number"] - 1) % 2 == 0 else "right", "color": colors[i]} for i, u in enumerate(units)]
+    node_config = [_node_config(u) for u in units]
     payload = {
         "roadmap": {"domain": domain, "units": units},
         "ui_metadata": {"node_config": node_config},
         "gamification": {"daily_streak_goal_xp": 50},
     }
-    return jsonify(payload), 200
+    if _degraded(cache_status):
+        payload["degraded"] = True
+    return payload
+
+
+def _submit_roadmap_job(data):
+    """Queue a roadmap generation; 202 with a job id to poll at /jobs/<id>."""
+    from jobs import QueueFull, callback_url_for, job_queue
+    callback = data.get("callback_url")
+    callback_url = callback_url_for(callback)
+    if callback and not callback_url:
+        return jsonify({"error": "callback_url must point at JOB_CALLBACK_BASE_URL"}), 400
+    try:
+        priority = max(-10, min(10, int(data.get("priority", 0))))
+    except (TypeError, ValueError):
+        priority = 0
+    params = {k: data.get(k) for k in ("domain", "proficiency_level", "professional_goal", "current_status", "hedge", "fanout") if k in data}
+    if not start_job_queue():
+        return jsonify({"error": "async jobs are not available on this service"}), 503
+    try:
+        job_id = job_queue.submit("roadmap", params, priority=priority, callback_url=callback_url)
+    except QueueFull:
+        return jsonify({"error": "job queue full, retry later"}), 503, {"Retry-After": "30"}
+    return jsonify({"job_id": job_id, "status": "queued", "poll": f"/jobs/{job_id}"}), 202, {"Location": f"/jobs/{job_id}"}
+
+
+def _run_roadmap_job(params):
+    payload, _ = _roadmap_payload(params, degrade=False)
+    return payload
+
+
+def start_job_queue():
+    """
+    Register the roadmap handler and start this process's job workers, resuming persisted
+    queued work; returns False when JOBS_ENABLED=0 or the queue is unavailable. Idempotent.
+    Called when serving (gunicorn post_worker_init, ASGI lifespan, __main__), not at import,
+    so importing this module starts no threads.
+    """
+    if os.environ.get("JOBS_ENABLED", "1") != "1":
+        return False
+    try:
+        from jobs import job_queue
+        job_queue.register("roadmap", _run_roadmap_job)
+        job_queue.start()
+        return True
+    except Exception as e:
+        print(f"[AI] Job queue unavailable: {e}")
+        return False
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Job status; includes the roadmap payload once status is 'done'."""
+    from jobs import job_queue
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    body = {k: job.get(k) for k in ("id", "status", "priority", "attempts", "error", "queue_position", "created_at", "started_at", "finished_at")}
+    body["result"] = job["result"]
+    return jsonify(body), 200
+
+@app.route("/generate-roadmap/stream", methods=["POST"])
+def generate_roadmap_stream():
+    """
+    Progressive roadmap generation. Each unit is validated and sent as soon as its JSON
+    object closes in the provider stream: NDJSON lines by default, SSE when the client
+    sends Accept: text/event-stream. Lines are {"type": "unit", "unit": ..., "node_config": ...}
+    followed by {"type": "done", ...}. Units the model did not produce are filled from templates.
+    """
+    data = request.get_json() or {}
+    domain = (data.get("domain") or "General").strip()
+    proficiency = data.get("proficiency_level") or ""
+    goal = data.get("professional_goal") or ""
+    status = data.get("current_status") or ""
+    count = 8
+    use_sse = "text/event-stream" in (request.headers.get("Accept") or "")
+    shed = _shed_stream()
+    if shed:
+        return shed
+
+    def emit(obj):
+        if use_sse:
+            return _sse(obj, event=obj["type"])
+        return json.dumps(obj) + "\n"
+
+    def events():
+        from llm_client import stream_roadmap_units
+        meta = {}
+        seen = set()
+        raw_units = []
+        expected = set(range(1, count + 1))
+        for raw in stream_roadmap_units(domain, proficiency, goal, status, start_unit=1, count=count, meta=meta):
+            if not isinstance(raw.get("unit_number"), int) and expected - seen:
+                raw = {**raw, "unit_number": min(expected - seen)}
+            unit = _ensure_unit_format(raw, domain)
+            n = unit["unit_number"]
+            if n not in expected or n in seen:
+                continue
+            seen.add(n)
+            raw_units.append(raw)
+            yield emit({"type": "unit", "source": "ai", "unit": unit, "node_config": _node_config(unit)})
+        for n in sorted(expected - seen):
+            unit = _fallback_unit(n, domain)
+            yield emit({"type": "unit", "source": "template", "unit": unit, "node_config": _node_config(unit)})
+        if len(seen) == count:
+            # Complete AI roadmap: make it available to the non-streaming endpoint too
+            from roadmap_cache import cache, normalize_params
+            cache.store(normalize_params(domain, proficiency, goal, status, 1, count), {"units": raw_units})
+        yield emit({
+            "type": "done",
+            "domain": domain,
+            "ai_units": len(seen),
+            "provider": meta.get("provider"),
+            "ttft_ms": meta.get("ttft_ms"),
+            "gamification": {"daily_streak_goal_xp": 50},
+        })
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.route("/generate-next-chapter", methods=["POST"])
+@idempotent
 def generate_next_chapter():
     """Generate next 2 chapters using AI. Falls back to templates if AI fails."""
     data = request.get_json() or {}
     domain = (data.get("domain") or "General").strip()
+    last_unit = _next_chapter_last_unit(data)
+
+    from chapter_prefetch import prefetcher
+    prefetched = prefetcher.take(domain, last_unit)
+    if prefetched:
+        ai_result, cache_status = {"units": prefetched}, "PREFETCH"
+    else:
+        from roadmap_cache import get_roadmap
+        ai_result, cache_status = get_roadmap(domain, start_unit=last_unit + 1, count=2)
+    return jsonify(_next_chapter_payload(domain, last_unit, ai_result, cache_status)), 200, {"X-Cache": cache_status}
+
+
+def _next_chapter_last_unit(data):
     last_unit = int(data.get("last_unit_number", 0))
-    if last_unit < 1:
-        last_unit = 0
+    return last_unit if last_unit >= 1 else 0
 
-    from llm_client import generate_next_chapters_via_ai
-    ai_result = generate_next_chapters_via_ai(domain, last_unit, count=2)
 
+def _next_chapter_payload(domain, last_unit, ai_result, cache_status=None):
+    """/generate-next-chapter body from a generation result, falling back to templates when it is empty."""
     if ai_result and ai_result.get("units"):
         units = [_ensure_unit_format(u, domain) for u in ai_result["units"]]
         units = normalize_units_mcqs(units, domain)
+        _schedule_prefetch(domain, units)
     else:
         units = [_fallback_unit(last_unit + i, domain) for i in range(1, 3)]
         units = normalize_units_mcqs(units, domain)
 
-    colors = ["#3B82F6", "#10B981", "#F59E0B", "#8B5CF6", "#EC4899", "#06B6D4"]
-    node_config = [{"unit": u["unit_number"], "offset": "left" if (u["unit_number"] - 1) % 2 == 0 else "right", "color": colors[(u["unit_number"] - 1) % len(colors)]} for u in units]
-    return jsonify({"units": units, "ui_metadata": {"node_config": node_config}}), 200
+    node_config = [_node_config(u) for u in units]
+    payload = {"units": units, "ui_metadata": {"node_config": node_config}}
+    if _degraded(cache_status):
+        payload["degraded"] = True
+    return payload
+
+
+# ========== Admin: roadmap cache ==========
+def _admin_authorized():
+    """Admin endpoints require X-Admin-Token matching AI_ADMIN_TOKEN (disabled when unset)."""
+    token = os.environ.get("AI_ADMIN_TOKEN", "").strip()
+    supplied = request.headers.get("X-Admin-Token", "")
+    return bool(token) and hmac.compare_digest(supplied.encode("utf-8"), token.encode("utf-8"))
+
+
+@app.route("/admin/cache", methods=["GET"])
+def admin_cache_inspect():
+    if not _admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    from roadmap_cache import cache
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(cache.describe(limit)), 200
+
+
+@app.route("/admin/cache", methods=["DELETE"])
+def admin_cache_evict():
+    """Evict one entry (?key=...) or the whole cache."""
+    if not _admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    from roadmap_cache import cache
+    removed = cache.evict(request.args.get("key") or None)
+    return jsonify({"removed": removed}), 200
+
+
+@app.route("/admin/cache/warm", methods=["POST"])
+def admin_cache_warm():
+    """Generate entries in the background: {"requests": [{"domain": ..., "proficiency_level": ..., ...}]}."""
+    if not _admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    import threading
+    from roadmap_cache import warm
+    reqs = (request.get_json() or {}).get("requests") or []
+    if not isinstance(reqs, list) or not all(isinstance(r, dict) for r in reqs):
+        return jsonify({"error": "requests must be a list of objects"}), 400
+    threading.Thread(target=warm, args=(reqs,), daemon=True, name="roadmap-cache-warm").start()
+    return jsonify({"queued": len(reqs)}), 202
 
 if __name__ == "__main__":
+    start_job_queue()
     port = int(os.environ.get("PORT", 5001))
     app.run(host="0.0.0.0", port=port, debug=False)
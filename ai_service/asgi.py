@@ -0,0 +1,175 @@
+"""
+ASGI entry point: `uvicorn asgi:app --host 0.0.0.0 --port $PORT`.
+
+The LLM-bound endpoints (/ask_ai, /generate-roadmap, /generate-next-chapter) are served
+natively on the event loop through llm_async, so a request waiting on a provider holds a
+coroutine rather than a worker thread. Idempotency-Key requests to them go through the
+same idempotency store as the Flask routes (IdempotencyStore.arun). Everything else —
+streaming, async jobs, diagnostics and admin routes — is passed to the Flask app through
+asgiref's WSGI adapter, so behaviour there is unchanged. The gunicorn/WSGI entry point
+(application:app) keeps working as before.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import application
+import deadline as _deadline
+import idempotency
+from llm_client import LLMOverloaded
+
+flask_app = WsgiToAsgi(application.app)
+
+
+async def _ask_ai(data):
+    from llm_async import call_llm_async
+    question = (data.get("question") or "").strip()
+    if not question:
+        return 400, {"error": "question required"}, {}
+    answer = await call_llm_async(application._ask_prompt(question))
+    return 200, {"answer": answer or application.NO_LLM_ANSWER}, {}
+
+
+async def _generate_roadmap(data):
+    if application._flag(data.get("hedge")) or application._flag(data.get("fanout")):
+        # Hedging and fan-out only exist on the threaded client
+        payload, cache_status = await asyncio.to_thread(application._roadmap_payload, data)
+        return 200, payload, {"X-Cache": cache_status}
+    from roadmap_cache import aget_roadmap
+    domain = (data.get("domain") or "General").strip()
+    ai_result, cache_status = await aget_roadmap(
+        domain, data.get("proficiency_level") or "", data.get("professional_goal") or "",
+        data.get("current_status") or "", start_unit=1, count=8,
+    )
+    return 200, application._roadmap_payload_from(domain, ai_result, cache_status), {"X-Cache": cache_status}
+
+
+async def _generate_next_chapter(data):
+    from chapter_prefetch import prefetcher
+    from roadmap_cache import aget_roadmap
+    domain = (data.get("domain") or "General").strip()
+    last_unit = application._next_chapter_last_unit(data)
+    prefetched = prefetcher.take(domain, last_unit)
+    if prefetched:
+        ai_result, cache_status = {"units": prefetched}, "PREFETCH"
+    else:
+        ai_result, cache_status = await aget_roadmap(domain, start_unit=last_unit + 1, count=2)
+    return 200, application._next_chapter_payload(domain, last_unit, ai_result, cache_status), {"X-Cache": cache_status}
+
+
+NATIVE_ROUTES = {
+    "/ask_ai": _ask_ai,
+    "/generate-roadmap": _generate_roadmap,
+    "/generate-next-chapter": _generate_next_chapter,
+}
+
+
+def _headers(scope) -> dict:
+    return {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+
+
+def _native_handler(scope):
+    """The async handler for this request, or None to pass it to Flask."""
+    if scope["method"] != "POST":
+        return None
+    handler = NATIVE_ROUTES.get(scope["path"].rstrip("/") or "/")
+    if handler is None:
+        return None
+    headers = _headers(scope)
+    if "text/event-stream" in headers.get("accept", ""):
+        return None
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    if application._flag((query.get("async") or [None])[0]):
+        return None
+    return handler
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, body: bytes, headers):
+    raw_headers = [(b"content-length", str(len(body)).encode())]
+    raw_headers += [(k.lower().encode("latin-1"), str(v).encode("latin-1")) for k, v in headers.items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload, headers):
+    await _send(send, status, json.dumps(payload).encode("utf-8"), {"Content-Type": "application/json", **headers})
+
+
+async def _respond(handler, data):
+    try:
+        return await handler(data)
+    except LLMOverloaded as e:
+        return 503, application.OVERLOADED_BODY, {"Retry-After": application._retry_after(e.retry_after_s)}
+
+
+async def _respond_idempotent(send, path, key, raw_body, handler, data):
+    """The idempotent() decorator's behaviour for a native route, without leaving the event loop."""
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        return await _send_json(send, *idempotency.ERRORS["too_long"])
+    executed = {}
+
+    async def execute():
+        status, payload, headers = await _respond(handler, data)
+        executed["headers"] = headers
+        stored = {k: v for k, v in headers.items() if k in idempotency.REPLAY_HEADERS}
+        return json.dumps(payload).encode("utf-8"), status, {"Content-Type": "application/json", **stored}
+
+    body, status, headers, outcome = await idempotency.store.arun(
+        f"{path}:{key}", idempotency.fingerprint_of(raw_body), execute, _deadline.current())
+    if outcome in idempotency.ERRORS:
+        return await _send_json(send, *idempotency.ERRORS[outcome])
+    if outcome == "executed":
+        headers = {"Content-Type": "application/json", **executed["headers"]}
+    else:
+        headers = {**headers, "Idempotent-Replayed": "true"}
+    await _send(send, status, body, headers)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            application.start_job_queue()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            from llm_async import aclose
+            await aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    handler = _native_handler(scope) if scope["type"] == "http" else None
+    if handler is None:
+        return await flask_app(scope, receive, send)
+    raw_body = await _read_body(receive)
+    try:
+        data = json.loads(raw_body or b"{}")
+        if not isinstance(data, dict):
+            data = {}
+    except ValueError:
+        return await _send_json(send, 400, {"error": "invalid JSON body"}, {})
+    headers = _headers(scope)
+    key = (headers.get("idempotency-key") or "").strip()
+    # Tasks and asyncio.to_thread copy the context, so LLM calls made for this request see its deadline
+    token = _deadline.set_current(_deadline.parse(headers.get(_deadline.HEADER.lower())))
+    try:
+        if key:
+            return await _respond_idempotent(send, scope["path"], key, raw_body, handler, data)
+        status, payload, headers = await _respond(handler, data)
+    finally:
+        _deadline.reset(token)
+    await _send_json(send, status, payload, headers)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Memory per in-flight LLM request: blocking client on threads vs llm_async on one event loop.
+
+A local stub provider (OpenAI chat-completions shape) holds every request open for --latency
+seconds, so all --inflight calls are waiting at once. Each mode runs in a fresh process and
+reports peak RSS growth and peak Python heap (tracemalloc) divided by the number of calls.
+Thread stacks show up in RSS only; the heap figure covers request/response objects.
+
+    python bench_async_memory.py
+    python bench_async_memory.py --inflight 500 --latency 3
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+STUB_BODY = json.dumps({"choices": [{"message": {"content": "ok"}}]}).encode()
+
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def _stub_handler(reader, writer, latency_s):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            await asyncio.sleep(latency_s)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                         b"Content-Length: %d\r\n\r\n%s" % (len(STUB_BODY), STUB_BODY))
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def _start_stub(latency_s):
+    """Stub provider on its own thread and event loop; returns its base URL."""
+    ready = threading.Event()
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        server = loop.run_until_complete(asyncio.start_server(
+            lambda r, w: _stub_handler(r, w, latency_s), "127.0.0.1", 0, backlog=4096))
+        holder["port"] = server.sockets[0].getsockname()[1]
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return f"http://127.0.0.1:{holder['port']}"
+
+
+def _configure(stub_url, inflight):
+    for var in ("HF_TOKEN", "HF_API_KEY", "GEMINI_API_KEY", "COHERE_API_KEY", "ANTHROPIC_API_KEY", "GROQ_API_KEY"):
+        os.environ.pop(var, None)
+    os.environ.update({"OPENAI_API_KEY": "bench", "LLM_MAX_INFLIGHT": str(inflight),
+                       "LLM_POOL_MAXSIZE": str(inflight), "LLM_QUEUE_BUDGET_S": "60"})
+    import llm_client
+    _, extract, label = llm_client.PROVIDER_API["openai"]
+    build = lambda prompt, key, output=None: [llm_client._chat_completions_request(f"{stub_url}/v1/chat/completions", "stub", prompt, key, 120)]
+    llm_client.PROVIDER_API["openai"] = (build, extract, label)
+
+
+def _measure(run, inflight, heap):
+    """Peak RSS growth per request; with heap=True (a separate run) the tracemalloc peak instead."""
+    peak = {"rss": _rss_kb(), "threads": threading.active_count()}
+    base_rss = peak["rss"]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak["rss"] = max(peak["rss"], _rss_kb())
+            peak["threads"] = max(peak["threads"], threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    if heap:
+        tracemalloc.start()
+    sampler.start()
+    start = time.monotonic()
+    results = run()
+    elapsed = time.monotonic() - start
+    done.set()
+    sampler.join()
+    out = {"inflight": inflight, "ok": sum(1 for r in results if r == "ok"), "threads_peak": peak["threads"]}
+    if heap:
+        out["heap_per_request_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / inflight, 1)
+        tracemalloc.stop()
+    else:
+        out["elapsed_s"] = round(elapsed, 2)
+        out["rss_per_request_kb"] = round((peak["rss"] - base_rss) / inflight, 1)
+    return out
+
+
+def run_mode(mode, inflight, latency_s, heap):
+    stub_url = _start_stub(latency_s)
+    _configure(stub_url, inflight)
+    import llm_client
+    import llm_async
+
+    # Warm up imports and one connection so they are not counted per request
+    llm_client.call_llm("warm up sync")
+    asyncio.run(llm_async.call_llm_async("warm up async"))
+
+    if mode == "sync":
+        def run():
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=inflight) as pool:
+                return list(pool.map(lambda i: llm_client.call_llm(f"bench prompt {i}"), range(inflight)))
+    else:
+        def run():
+            async def main():
+                return await asyncio.gather(*(llm_async.call_llm_async(f"bench prompt {i}") for i in range(inflight)))
+            return asyncio.run(main())
+
+    print(json.dumps({"mode": mode, **_measure(run, inflight, heap)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--inflight", type=int, default=200, help="Concurrent provider calls")
+    parser.add_argument("--latency", type=float, default=2.0, help="Stub provider latency in seconds")
+    parser.add_argument("--json", action="store_true", help="Print results as one JSON document")
+    parser.add_argument("--mode", choices=["sync", "async"], help=argparse.SUPPRESS)
+    parser.add_argument("--heap", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        return run_mode(args.mode, args.inflight, args.latency, args.heap)
+
+    results = []
+    for mode in ("sync", "async"):
+        row = {"mode": mode}
+        # RSS and heap are measured in separate processes: tracemalloc inflates RSS and slows the run
+        for extra in ([], ["--heap"]):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--mode", mode,
+                 "--inflight", str(args.inflight), "--latency", str(args.latency), *extra],
+                capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+            lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+            if not lines:
+                sys.exit(f"{mode} run failed:\n{out.stderr[-2000:]}")
+            row.update(json.loads(lines[-1]))
+        results.append(row)
+
+    if args.json:
+        print(json.dumps({"latency_s": args.latency, "results": results}, indent=2))
+        return
+    print(f"{'mode':<6} {'in-flight':>9} {'ok':>5} {'time s':>7} {'RSS KB/req':>11} {'heap KB/req':>12} {'threads':>8}")
+    for r in results:
+        print(f"{r['mode']:<6} {r['inflight']:>9} {r['ok']:>5} {r['elapsed_s']:>7} {r['rss_per_request_kb']:>11} "
+              f"{r['heap_per_request_kb']:>12} {r['threads_peak']:>8}")
+
+
+if __name__ == "__main__":
+    main()
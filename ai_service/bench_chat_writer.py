@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Latency of recording a chat exchange, as /ask_ai does: written inline (one INSERT and
+commit per request) against the write-behind queue (chat_writer, batched flushes).
+
+Each level runs N threads calling writer.submit() for --duration seconds, then syncs and
+checks that every submitted row reached the table. Per-call latency is what the request
+pays; the flush columns come from the writer's own metrics.
+
+    python bench_chat_writer.py --output bench_chat_writer.json
+    python bench_chat_writer.py --url "sqlite:///career_roadmap.db?tuned=1" --levels 1,16,64
+    python bench_chat_writer.py --url postgresql://postgres@localhost/career_roadmap
+    python bench_chat_writer.py --compare bench_chat_writer.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+import uuid
+
+import chat_writer
+from bench_common import git_commit
+from stats import percentile
+import repository
+
+ANSWER = "a" * 1500  # about the size of a fallback career answer
+
+
+def run_level(writer, repo, concurrency, duration_s):
+    tag = f"bench-writer-{uuid.uuid4().hex[:8]}"
+    latencies = [[] for _ in range(concurrency)]
+    stop = time.monotonic() + duration_s
+
+    def worker(idx):
+        uid = f"{tag}-{idx}"
+        i = 0
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            writer.submit(uid, f"question {i}", ANSWER, "bench")
+            latencies[idx].append((time.perf_counter() - start) * 1000)
+            i += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    sync_start = time.monotonic()
+    writer.sync(timeout_s=60)
+    sync_ms = (time.monotonic() - sync_start) * 1000
+    stored = sum(len(repo.chat_history.get_by_uid(f"{tag}-{i}")) for i in range(concurrency))
+    repo.driver.execute("DELETE FROM chat_history WHERE uid LIKE %s", (tag + "%",))
+    lat = [ms for per in latencies for ms in per]
+    metrics = writer.describe()
+    return {
+        "concurrency": concurrency,
+        "calls": len(lat),
+        "calls_per_s": round(len(lat) / elapsed, 1),
+        "p50_ms": percentile(lat, 0.50, 3),
+        "p95_ms": percentile(lat, 0.95, 3),
+        "p99_ms": percentile(lat, 0.99, 3),
+        "rows_stored": stored,
+        "rows_missing": len(lat) - stored,
+        "final_sync_ms": round(sync_ms, 1),
+        "flush_p95_ms": metrics["flush_p95_ms"],
+        "rows_per_batch": metrics["rows_per_batch"],
+        "max_queue_depth": metrics["stats"]["max_depth"],
+        "written_inline": metrics["stats"]["written_inline"],
+    }
+
+
+def compare(baseline, current):
+    base = {(r["mode"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"{'mode':<13} {'conc':>5} {'calls/s':>9} {'base':>9} {'p95 ms':>8} {'base p95':>9}")
+    for r in current["results"]:
+        b = base.get((r["mode"], r["concurrency"]))
+        print(f"{r['mode']:<13} {r['concurrency']:>5} {r['calls_per_s']:>9} {b['calls_per_s'] if b else '-':>9} "
+              f"{r['p95_ms']:>8} {b['p95_ms'] if b else '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Database URL (default: a temporary SQLite file)")
+    parser.add_argument("--levels", default="1,8,32", help="Comma-separated thread counts")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per mode and level")
+    parser.add_argument("--modes", default="inline,write_behind", help="inline, write_behind, or both")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    tmpdir = None
+    url = args.url
+    if not url:
+        tmpdir = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    repo = repository.open_repository(url, init_schema=True)
+    repository._repo = repo  # the writer persists through get_repository()
+    levels = [int(x) for x in args.levels.split(",") if x]
+    results = []
+    for mode in [m for m in args.modes.split(",") if m]:
+        for level in levels:
+            writer = chat_writer.ChatHistoryWriter(enabled=mode == "write_behind")
+            row = {"mode": mode, **run_level(writer, repo, level, args.duration)}
+            print(f"{mode:<13} conc={level:<3} calls/s={row['calls_per_s']:<9} p50={row['p50_ms']}ms "
+                  f"p95={row['p95_ms']}ms missing={row['rows_missing']} rows/batch={row['rows_per_batch']}", flush=True)
+            results.append(row)
+    repo.close()
+    if tmpdir:
+        tmpdir.cleanup()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "driver": repo.driver.name,
+            "duration_s": args.duration,
+            "flush_batch": chat_writer.FLUSH_BATCH,
+            "flush_interval_ms": chat_writer.FLUSH_INTERVAL_S * 1000,
+            "queue_size": chat_writer.QUEUE_SIZE,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+"""
+Helpers shared by the benchmark and load-test scripts.
+"""
+import os
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_commit():
+    """Short hash of the checked-out commit, recorded with benchmark results (None outside git)."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Query throughput of db_postgres.DatabaseConnection at increasing concurrency.
+
+Runs the same indexed lookup (shaped like Event/Project.get_by_domain_and_percentage) from
+1..N threads against a scratch table, once with a single-connection pool (how the module
+worked before pooling: every query serialized on one socket) and once with the full pool.
+--query-ms adds pg_sleep to each query to stand in for network round trips and heavier
+plans; without it a local server is CPU-bound and scaling mostly shows core count.
+Connection settings come from the DB_* environment, like the service.
+
+    python bench_db_pool.py --output bench_db_pool.json
+    python bench_db_pool.py --levels 1,8,32 --pool-max 16 --query-ms 5
+    python bench_db_pool.py --compare bench_db_pool.json
+"""
+import argparse
+import json
+import platform
+import threading
+import time
+
+import db_postgres
+from bench_common import git_commit
+from stats import percentile
+
+TABLE = "bench_pool_items"
+DOMAINS = ["web", "data", "mobile", "cloud", "security", "ml", "devops", "design"]
+
+
+def setup(rows):
+    conn = db_postgres.DatabaseConnection(minconn=1, maxconn=1)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.execute(f"CREATE TABLE {TABLE} (id SERIAL PRIMARY KEY, name TEXT, domain TEXT, suggested_for_percentage REAL)")
+        cur.execute(f"CREATE INDEX ON {TABLE} (domain, suggested_for_percentage)")
+        cur.execute(
+            f"INSERT INTO {TABLE} (name, domain, suggested_for_percentage) "
+            "SELECT 'item ' || i, (%s::text[])[1 + i %% %s], (i * 7) %% 100 FROM generate_series(1, %s) AS i",
+            (DOMAINS, len(DOMAINS), rows),
+        )
+        cur.execute(f"ANALYZE {TABLE}")
+    conn.close()
+
+
+def teardown():
+    conn = db_postgres.DatabaseConnection(minconn=1, maxconn=1)
+    conn.execute_update(f"DROP TABLE IF EXISTS {TABLE}")
+    conn.close()
+
+
+def run_level(pool, concurrency, duration_s, query_ms):
+    query = (f"SELECT t.* FROM {TABLE} t WHERE domain = %s AND suggested_for_percentage <= %s "
+             "ORDER BY suggested_for_percentage DESC LIMIT 20")
+    if query_ms > 0:
+        # Materialized CTE: sleeps once per query, not once per returned row
+        query = f"WITH s AS MATERIALIZED (SELECT pg_sleep({query_ms / 1000.0})) " + query.replace(" t WHERE", " t, s WHERE")
+    latencies = [[] for _ in range(concurrency)]
+    empty = [0] * concurrency
+    stop = time.monotonic() + duration_s
+
+    def worker(idx):
+        i = idx
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            rows = pool.execute_query(query, (DOMAINS[i % len(DOMAINS)], float(i % 100)))
+            latencies[idx].append((time.perf_counter() - start) * 1000)
+            empty[idx] += int(not rows)
+            i += concurrency
+
+    before = pool.pool_stats()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    after = pool.pool_stats()
+    lat = [ms for per in latencies for ms in per]
+    return {
+        "concurrency": concurrency,
+        "queries": len(lat),
+        "qps": round(len(lat) / elapsed, 1),
+        "p50_ms": percentile(lat, 0.50),
+        "p95_ms": percentile(lat, 0.95),
+        "p99_ms": percentile(lat, 0.99),
+        "empty_or_failed": sum(empty),
+        "pool_timeouts": after["timeouts"] - before["timeouts"],
+        "pool_wait_p95_ms": after["wait_p95_ms"],
+        "pool_open": after["open"],
+    }
+
+
+def compare(baseline, current):
+    base = {(r["mode"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"{'mode':<8} {'conc':>5} {'qps':>10} {'base qps':>10} {'ratio':>7} {'p95 ms':>8} {'base p95':>9}")
+    for r in current["results"]:
+        b = base.get((r["mode"], r["concurrency"]))
+        ratio = f"{r['qps'] / b['qps']:.2f}x" if b and b["qps"] else "-"
+        print(f"{r['mode']:<8} {r['concurrency']:>5} {r['qps']:>10} {b['qps'] if b else '-':>10} {ratio:>7} "
+              f"{r['p95_ms']:>8} {b['p95_ms'] if b else '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Comma-separated thread counts")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per level")
+    parser.add_argument("--pool-max", type=int, default=db_postgres.POOL_MAX, help="Connections in the pooled run")
+    parser.add_argument("--modes", default="single,pooled", help="single (one connection), pooled, or both")
+    parser.add_argument("--query-ms", type=float, default=2.0, help="Server-side pg_sleep per query (0 = none)")
+    parser.add_argument("--rows", type=int, default=20000, help="Rows in the scratch table")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch table afterwards")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    if db_postgres.psycopg2 is None:
+        raise SystemExit("psycopg2 is not installed (pip install psycopg2-binary)")
+    setup(args.rows)
+    levels = [int(x) for x in args.levels.split(",") if x]
+    results = []
+    try:
+        for mode in [m for m in args.modes.split(",") if m]:
+            size = 1 if mode == "single" else args.pool_max
+            # Checkout timeout above any queueing the run can produce: measure waits, not failures
+            pool = db_postgres.DatabaseConnection(minconn=size, maxconn=size, timeout_s=60)
+            if not pool.is_connected():
+                raise SystemExit("could not connect; check DB_HOST/DB_PORT/DB_USER/DB_PASSWORD/DB_NAME")
+            for level in levels:
+                row = {"mode": mode, "pool_max": size, **run_level(pool, level, args.duration, args.query_ms)}
+                print(f"{mode:<7} conc={level:<3} qps={row['qps']:<9} p50={row['p50_ms']}ms p95={row['p95_ms']}ms "
+                      f"pool wait p95={row['pool_wait_p95_ms']}ms", flush=True)
+                results.append(row)
+            pool.close()
+    finally:
+        if not args.keep:
+            teardown()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "duration_s": args.duration,
+            "query_ms": args.query_ms,
+            "rows": args.rows,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+End-to-end load benchmark against a local stub LLM provider (no network access or API keys).
+
+Starts stub_llm_server.py and the AI service (gunicorn by default) as subprocesses, points
+every configured provider at the stub via LLM_BASE_URL_<PROVIDER>, then drives /ask_ai,
+/generate-roadmap and /generate-next-chapter at increasing concurrency. Results (throughput,
+p50/p95/p99 latency, status counts) are written as JSON so runs on different commits can be
+compared with --compare. The brownout is off (BROWNOUT=0) so every 200 is a generation; with
+--env BROWNOUT=1 the template roadmaps it serves are reported as "degraded", not "ok".
+
+    python bench_load.py --output bench_results.json
+    python bench_load.py --latency-dist lognormal --error-rate 0.05 --malformed-rate 0.1
+    python bench_load.py --compare bench_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench_common import git_commit
+from stats import percentile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Provider -> env var holding its key (all providers llm_client knows about)
+PROVIDER_KEYS = {
+    "huggingface": "HF_API_KEY",
+    "gemini": "GEMINI_API_KEY",
+    "cohere": "COHERE_API_KEY",
+    "claude": "ANTHROPIC_API_KEY",
+    "groq": "GROQ_API_KEY",
+    "openai": "OPENAI_API_KEY",
+}
+
+ENDPOINTS = {
+    "ask_ai": lambda i: ("/ask_ai", {"question": f"How do I get better at topic {i}?"}),
+    "generate-roadmap": lambda i: ("/generate-roadmap", {
+        "domain": f"Bench Domain {i}", "proficiency_level": "beginner",
+        "professional_goal": "job-ready", "current_status": "student",
+    }),
+    "generate-next-chapter": lambda i: ("/generate-next-chapter", {"domain": f"Bench Domain {i}", "last_unit_number": 8}),
+}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(url, timeout_s=30):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout_s}s")
+
+def start_stub(args):
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(HERE, "stub_llm_server.py"), "--port", str(port),
+           "--latency-ms", str(args.latency_ms), "--latency-dist", args.latency_dist,
+           "--latency-sigma", str(args.latency_sigma), "--error-rate", str(args.error_rate),
+           "--malformed-rate", str(args.malformed_rate), "--seed", str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    _wait_for(f"{url}/stats")
+    return proc, url
+
+
+def start_service(args, stub_url, workdir):
+    port = _free_port()
+    env = dict(os.environ)
+    # Empty (not unset) so a local .env cannot add real keys for other providers
+    for provider, var in PROVIDER_KEYS.items():
+        env[var] = "stub" if provider in args.providers else ""
+        env[f"LLM_BASE_URL_{provider.upper()}"] = stub_url
+    env.update({
+        "HF_TOKEN": "stub" if "huggingface" in args.providers else "",
+        "PORT": str(port),
+        "ROADMAP_CACHE": "0",           # every request must reach the provider
+        "CHAPTER_PREFETCH": "0",
+        "BROWNOUT": "0",                # degraded template roadmaps are not generations; --env BROWNOUT=1 to measure it
+        "ROADMAP_CACHE_DB": "",
+        "JOBS_DB": os.path.join(workdir, "jobs.db"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    if args.server == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "application:app"]
+    elif args.server == "uvicorn":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "application.py"]
+    log = open(os.path.join(workdir, "service.log"), "w")
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    _wait_for(f"{url}/health")
+    return proc, url
+
+def run_level(base_url, endpoint, concurrency, n, offset):
+    local = threading.local()
+
+    def one(i):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, body = ENDPOINTS[endpoint](offset + i)
+        start = time.monotonic()
+        degraded = False
+        try:
+            resp = session.post(base_url + path, json=body, timeout=180)
+            status = resp.status_code
+            if status == 200:
+                degraded = bool(resp.json().get("degraded"))
+        except (requests.RequestException, ValueError):
+            status = None
+        return status, (time.monotonic() - start) * 1000, degraded
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(n)))
+    elapsed = time.monotonic() - start
+    latencies = [ms for _, ms, _ in results]
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    # A brownout answers 200 with a template roadmap; those are not counted as ok
+    degraded = sum(1 for _, _, d in results if d)
+    ok = statuses.get("200", 0) - degraded
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": n,
+        "ok": ok,
+        "degraded": degraded,
+        "statuses": statuses,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(ok / elapsed, 2) if elapsed else None,
+        "p50_ms": percentile(latencies, 0.50, 1),
+        "p95_ms": percentile(latencies, 0.95, 1),
+        "p99_ms": percentile(latencies, 0.99, 1),
+    }
+
+
+def compare(baseline, current):
+    """Print throughput and p95 deltas for rows present in both runs."""
+    rows = {(r["endpoint"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\nvs baseline {baseline.get('meta', {}).get('commit')}:")
+    print(f"{'endpoint':<22} {'conc':>4} {'rps':>8} {'Δrps':>8} {'p95 ms':>9} {'Δp95':>8}")
+    for r in current["results"]:
+        b = rows.get((r["endpoint"], r["concurrency"]))
+        if not b:
+            continue
+        d_rps = (r["throughput_rps"] or 0) - (b["throughput_rps"] or 0)
+        d_p95 = (r["p95_ms"] or 0) - (b["p95_ms"] or 0)
+        print(f"{r['endpoint']:<22} {r['concurrency']:>4} {r['throughput_rps']:>8} {d_rps:>+8.2f} {r['p95_ms']:>9} {d_p95:>+8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Comma-separated endpoints to drive")
+    parser.add_argument("--levels", default="1,4,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=48, help="Requests per endpoint and level (at least the concurrency)")
+    parser.add_argument("--server", choices=["gunicorn", "uvicorn", "flask"], default="gunicorn")
+    parser.add_argument("--providers", default="openai,gemini,cohere,claude",
+                        help="Providers given a stub key (response shapes exercised)")
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Extra env for the service (repeatable)")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+    args.providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+    unknown = [p for p in args.providers if p not in PROVIDER_KEYS]
+    if unknown:
+        parser.error(f"unknown providers: {unknown}")
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    stub, stub_url = start_stub(args)
+    service = None
+    try:
+        service, base_url = start_service(args, stub_url, workdir)
+        results = []
+        offset = 0
+        for endpoint in [e.strip() for e in args.endpoints.split(",") if e.strip()]:
+            for level in [int(x) for x in args.levels.split(",") if x.strip()]:
+                n = max(args.requests, level)
+                row = run_level(base_url, endpoint, level, n, offset)
+                offset += n  # unique payloads so nothing is served from coalescing
+                results.append(row)
+                print(f"{endpoint:<22} c={level:<3} {row['throughput_rps']:>7} req/s  p50 {row['p50_ms']}ms  "
+                      f"p95 {row['p95_ms']}ms  p99 {row['p99_ms']}ms  {row['statuses']}  degraded {row['degraded']}", file=sys.stderr)
+        stub_stats = requests.get(f"{stub_url}/stats", timeout=5).json()
+    finally:
+        for proc in (service, stub):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "server": args.server,
+            "providers": args.providers,
+            "stub": {"latency_ms": args.latency_ms, "latency_dist": args.latency_dist, "latency_sigma": args.latency_sigma,
+                     "error_rate": args.error_rate, "malformed_rate": args.malformed_rate, "seed": args.seed},
+            "service_env": args.env,
+            "service_log": os.path.join(workdir, "service.log"),
+        },
+        "results": results,
+        "stub_requests": stub_stats,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the roadmap post-processing that runs on every LLM response:
+llm_client._extract_json / _parse_units and application._ensure_mcq_format,
+_ensure_unit_format, normalize_units_mcqs and _build_payload_from_ai.
+
+Inputs are synthetic and deterministic: roadmaps of 8 to 500 units, units with MCQ
+overflow, and ~100 KB model outputs wrapped in prose and code fences. Each case reports
+ns/op (best of --repeat timing runs) and, from a separate tracemalloc pass, peak and
+retained KB per op (retained includes the returned value). Results are compared against
+bench_postprocess_baseline.json.
+
+    python bench_postprocess.py                     # run and diff against the baseline
+    python bench_postprocess.py --filter extract    # only cases whose name contains "extract"
+    python bench_postprocess.py --save              # rewrite the baseline
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "bench_postprocess_baseline.json")
+
+os.environ.setdefault("JOBS_ENABLED", "0")
+os.environ.setdefault("LLM_PREWARM", "0")
+
+import application  # noqa: E402
+from bench_common import git_commit  # noqa: E402
+import llm_client  # noqa: E402
+
+
+# ---------- Synthetic inputs ----------
+
+def _unit(n, mcqs=5, rng=None):
+    rng = rng or random.Random(n)
+    return {
+        "unit_number": n,
+        "title": f"Chapter {n}: {' '.join(rng.choice(['data', 'model', 'graph', 'query', 'state', 'cache']) for _ in range(4))}",
+        "level": ["beginner", "intermediate", "advanced"][(n - 1) % 3],
+        "tasks": [{"task_id": f"u{n}_t{t}", "task_name": f"Build a {{small}} exercise {n}.{t} with \"quotes\""} for t in range(1, 5)],
+        "mcqs": [
+            {
+                "question": f"In chapter {n}, which option about concept {q} is right? Use {{braces}} carefully.",
+                "options": [f"Option {o} for {n}.{q}" for o in "ABCD"],
+                "correctIndex": rng.randrange(4),
+            }
+            for q in range(mcqs)
+        ],
+    }
+
+
+def roadmap(units, mcqs=5, start=1):
+    rng = random.Random(units * 1000 + mcqs)
+    return {"units": [_unit(n, mcqs, rng) for n in range(start, start + units)]}
+
+
+def _prose(size, rng):
+    words = ["the", "roadmap", "below", "covers", "each", "chapter", "in", "order", "and", "skills"]
+    out, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        out.append(word)
+        length += len(word) + 1
+    return " ".join(out)
+
+
+def llm_output(target_kb, wrap):
+    """A model response of roughly target_kb KB: roadmap JSON plus prose, optionally fenced."""
+    rng = random.Random(target_kb)
+    units = 1
+    body = json.dumps(roadmap(units))
+    while len(body) < target_kb * 1024 * 0.9:
+        units *= 2
+        body = json.dumps(roadmap(units), indent=1)
+    lead, tail = _prose(2048, rng), _prose(2048, rng)
+    if wrap == "fence":
+        return f"Sure! Here is your roadmap.\n{lead}\n```json\n{body}\n```\n{tail}"
+    if wrap == "prose":
+        return f"{lead}\n{body}\n{tail}"
+    return body
+
+
+def _malformed_units(units):
+    """Units as models really return them: missing fields, string tasks, short options, bad indexes."""
+    out = []
+    for u in roadmap(units, mcqs=7)["units"]:
+        u = dict(u)
+        n = u["unit_number"]
+        if n % 3 == 0:
+            u.pop("level")
+            u["tasks"] = [t["task_name"] for t in u["tasks"][:2]]
+        if n % 4 == 0:
+            u["mcqs"] = [{**m, "options": m["options"][:2], "correctIndex": 9} for m in u["mcqs"]]
+        out.append(u)
+    return out
+
+
+def cases():
+    """(name, fn, arg) for every benchmark case; inputs are built once, outside the timing."""
+    mcq_ok = roadmap(1)["units"][0]["mcqs"][0]
+    mcq_short = {"question": "Q?", "options": ["a"], "correctIndex": "7"}
+    unit_ok = roadmap(1)["units"][0]
+    unit_messy = _malformed_units(12)[11]
+
+    out = [
+        ("extract_json/plain_2kb", llm_client._extract_json, json.dumps(roadmap(2))),
+        ("extract_json/fence_100kb", llm_client._extract_json, llm_output(100, "fence")),
+        ("extract_json/prose_100kb", llm_client._extract_json, llm_output(100, "prose")),
+        ("extract_json/raw_100kb", llm_client._extract_json, llm_output(100, "raw")),
+        ("parse_units/fence_100kb", llm_client._parse_units, llm_output(100, "fence")),
+        # Cut off mid-unit (max_tokens): goes through llm_json.repair_json
+        ("parse_units/truncated_100kb", llm_client._parse_units, llm_output(100, "raw")[:-3000]),
+        ("ensure_mcq_format/valid", application._ensure_mcq_format, mcq_ok),
+        ("ensure_mcq_format/short", application._ensure_mcq_format, mcq_short),
+        ("ensure_unit_format/valid", lambda u: application._ensure_unit_format(u, "Bench"), unit_ok),
+        ("ensure_unit_format/messy", lambda u: application._ensure_unit_format(u, "Bench"), unit_messy),
+    ]
+    for n in (8, 100, 500):
+        out.append((f"normalize_units_mcqs/{n}_units", lambda u: application.normalize_units_mcqs(u, "Bench"), roadmap(n)["units"]))
+    for n in (8, 100):
+        # 12 MCQs per unit: every unit overflows into the next and the tail spills into new units
+        out.append((f"normalize_units_mcqs/{n}_units_overflow", lambda u: application.normalize_units_mcqs(u, "Bench"),
+                    roadmap(n, mcqs=12)["units"]))
+    for n in (8, 100, 300):
+        out.append((f"build_payload/{n}_units", lambda r: application._build_payload_from_ai(r, "Bench"), roadmap(n)))
+    out.append(("build_payload/100_units_messy", lambda r: application._build_payload_from_ai(r, "Bench"),
+                {"units": _malformed_units(100)}))
+    return out
+
+
+# ---------- Measurement ----------
+
+def time_ns(fn, arg, repeat, min_time_s):
+    """Best-of-repeat ns per call; each run loops until it takes at least min_time_s."""
+    loops = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn(arg)
+        if time.perf_counter_ns() - start >= min_time_s * 1e9:
+            break
+        loops *= 2
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            fn(arg)
+        per_op = (time.perf_counter_ns() - start) / loops
+        best = per_op if best is None else min(best, per_op)
+    return best
+
+
+def allocations(fn, arg, loops=5):
+    """(peak KB, retained KB) per call under tracemalloc; the result is dropped after each call."""
+    fn(arg)  # warm caches (regex compile, etc.)
+    tracemalloc.start()
+    peak = retained = 0
+    for _ in range(loops):
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        result = fn(arg)
+        after, top = tracemalloc.get_traced_memory()
+        peak = max(peak, top - before)
+        retained = max(retained, after - before)
+        del result
+    tracemalloc.stop()
+    return round(peak / 1024, 1), round(retained / 1024, 1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per case (best is reported)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="Minimum seconds per timing run")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument("--save", action="store_true", help="Write results to --baseline")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, fn, arg in cases():
+        if args.filter not in name:
+            continue
+        ns = time_ns(fn, arg, args.repeat, args.min_time)
+        peak_kb, retained_kb = allocations(fn, arg)
+        results[name] = {"ns_per_op": round(ns), "peak_kb": peak_kb, "retained_kb": retained_kb}
+
+    report = {
+        "meta": {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine()},
+        "results": results,
+    }
+    if args.save:
+        with open(args.baseline, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    print(f"{'case':<42} {'ns/op':>12} {'vs base':>8} {'peak KB':>9} {'kept KB':>8}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        delta = f"{r['ns_per_op'] / base['ns_per_op']:.2f}x" if base and base["ns_per_op"] else "-"
+        print(f"{name:<42} {r['ns_per_op']:>12,} {delta:>8} {r['peak_kb']:>9} {r['retained_kb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Conformance checks and throughput benchmark for repository.py drivers.
+
+Each --url (a temporary SQLite file by default) first gets the conformance checks: the
+same calls must return the same shapes on every backend (dict rows, datetime timestamps,
+ids from inserts, rowcounts from updates/deletes, bulk inserts, ordering, keyset pages).
+Any failure exits non-zero before benchmarking. Then each operation runs from 1..N threads:
+
+    chat_insert   chat_history.create (one row per call, like /ask_ai)
+    chat_bulk     chat_history.create_many of --batch rows
+    history_read  chat_history.get_by_uid for a uid with --history rows
+    events_read   events.get_by_domain_and_percentage
+    user_update   users.get_by_uid + users.update
+
+Rows are written under uids / domains unique to the run and deleted afterwards.
+
+    python bench_repository.py --output bench_repository.json
+    python bench_repository.py --url sqlite:///career_roadmap.db --url postgresql://postgres@localhost/career_roadmap
+    python bench_repository.py --compare bench_repository.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import repository
+from bench_common import git_commit
+from stats import percentile
+
+OPERATIONS = ["chat_insert", "chat_bulk", "history_read", "events_read", "user_update"]
+
+
+def _redact(url):
+    scheme, _, rest = url.partition("://")
+    if "@" in rest:
+        rest = rest.split("@", 1)[1]
+    return f"{scheme}://{rest}"
+
+
+# ---------- Conformance ----------
+
+def conformance(repo, tag):
+    """Run the checks; returns a list of failure messages (empty when the driver conforms)."""
+    failures = []
+
+    def check(name, ok, detail=""):
+        if not ok:
+            failures.append(f"{name}: {detail}" if detail else name)
+
+    uid, domain = f"conf-{tag}", f"conf-{tag}"
+    try:
+        # users
+        user_id = repo.users.create(uid, name="Ada", email="ada@example.com", planning_days=30)
+        check("users.create returns id", isinstance(user_id, int) and user_id > 0, repr(user_id))
+        user = repo.users.get_by_uid(uid)
+        check("users.get_by_uid", user is not None and user["name"] == "Ada" and user["planning_days"] == 30, repr(user))
+        check("users.update rowcount", repo.users.update(uid, name="Grace", bogus="x", email=None) == 1)
+        user = repo.users.get_by_uid(uid) or {}
+        check("users.update applied", user.get("name") == "Grace" and user.get("email") == "ada@example.com", repr(user))
+        check("users.get_by_uid missing", repo.users.get_by_uid(uid + "-missing") is None)
+
+        # chat_history
+        first = repo.chat_history.create(uid, "q1", "a1", "fallback")
+        second = repo.chat_history.create(uid, "q2", "a2")
+        check("chat_history.create ids", isinstance(first, int) and second > first > 0, f"{first}, {second}")
+        written = repo.chat_history.create_many([(uid, f"bq{i}", f"ba{i}", "bulk") for i in range(5)])
+        check("chat_history.create_many count", written == 5, repr(written))
+        rows = repo.chat_history.get_by_uid(uid)
+        check("chat_history.get_by_uid count", len(rows) == 7, str(len(rows)))
+        if rows:
+            check("chat_history row keys", {"id", "uid", "question", "answer", "engine", "timestamp"} <= set(rows[0]),
+                  repr(sorted(rows[0])))
+            check("chat_history timestamp is datetime", all(isinstance(r["timestamp"], datetime) for r in rows),
+                  repr(type(rows[0]["timestamp"])))
+            check("chat_history order", [r["question"] for r in rows[:2]] == ["q1", "q2"],
+                  repr([r["question"] for r in rows]))
+            check("chat_history default engine", rows[1]["engine"] == "gemini", repr(rows[1]["engine"]))
+        ids = [r["id"] for r in rows]
+        page = list(repo.chat_history.page(uid, limit=3))
+        check("chat_history.page first page", [r["id"] for r in page] == ids[:3], repr(page))
+        check("chat_history.page projection", bool(page) and set(page[0]) == {"id", "question", "answer", "engine", "timestamp"},
+              repr(page[:1]))
+        page = [r["id"] for r in repo.chat_history.page(uid, after=ids[2], limit=3)]
+        check("chat_history.page after", page == ids[3:6], repr(page))
+        page = [r["id"] for r in repo.chat_history.page(uid, before=ids[5], limit=2)]
+        check("chat_history.page before", page == ids[3:5], repr(page))
+        page = [r["id"] for r in repo.chat_history.page(uid, after=ids[-1])]
+        check("chat_history.page past the end", page == [], repr(page))
+        check("chat_history.clear_by_uid rowcount", repo.chat_history.clear_by_uid(uid) == 7)
+        check("chat_history cleared", repo.chat_history.get_by_uid(uid) == [])
+
+        # roadmap_progress
+        progress_id = repo.roadmap_progress.create(uid, "Learn A;Learn B", 0)
+        check("roadmap_progress.create id", isinstance(progress_id, int) and progress_id > 0, repr(progress_id))
+        check("roadmap_progress.update_progress", repo.roadmap_progress.update_progress(uid, 42.5) == 1)
+        rows = repo.roadmap_progress.get_by_uid(uid)
+        check("roadmap_progress.get_by_uid", len(rows) == 1 and float(rows[0]["completion_percentage"]) == 42.5
+              and isinstance(rows[0]["date_updated"], datetime), repr(rows))
+
+        # events / projects
+        check("events.create_many", repo.events.create_many(
+            [(f"Event {p}", domain, "2025-01-01", "https://example.com", p) for p in (10, 50, 90)]) == 3)
+        rows = repo.events.get_by_domain_and_percentage(domain, 60)
+        check("events.get_by_domain_and_percentage", [float(r["suggested_for_percentage"]) for r in rows] == [50, 10],
+              repr(rows))
+        check("projects.create_many", repo.projects.create_many([(f"Project {p}", domain, "d", p) for p in (0, 75)]) == 2)
+        rows = repo.projects.get_by_domain_and_percentage(domain, 100)
+        check("projects.get_by_domain_and_percentage", [r["project_name"] for r in rows] == ["Project 75", "Project 0"],
+              repr(rows))
+        check("empty bulk insert", repo.chat_history.create_many([]) == 0)
+    finally:
+        _cleanup(repo, uid, domain)
+    return failures
+
+
+def _cleanup(repo, uid_prefix, domain_prefix):
+    driver = repo.driver
+    for table in ("chat_history", "roadmap_progress", "users"):
+        driver.execute(f"DELETE FROM {table} WHERE uid LIKE %s", (uid_prefix + "%",))
+    for table in ("events", "projects"):
+        driver.execute(f"DELETE FROM {table} WHERE domain LIKE %s", (domain_prefix + "%",))
+
+
+# ---------- Benchmark ----------
+
+def seed(repo, tag, history_rows):
+    repo.chat_history.create_many([(f"bench-{tag}-history", f"q{i}", "a" * 400, "bench") for i in range(history_rows)])
+    repo.events.create_many([(f"Event {i}", f"bench-{tag}-{i % 8}", "2025-01-01", "https://example.com", (i * 7) % 100)
+                             for i in range(400)])
+    for i in range(64):
+        repo.users.create(f"bench-{tag}-user-{i}", name=f"User {i}", planning_days=30)
+
+
+def run_level(repo, tag, op, concurrency, duration_s, batch):
+    latencies = [[] for _ in range(concurrency)]
+    rows_done = [0] * concurrency
+    stop = time.monotonic() + duration_s
+
+    def worker(idx):
+        i = idx
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            if op == "chat_insert":
+                n = int(repo.chat_history.create(f"bench-{tag}-w{idx}", f"question {i}", "a" * 400, "bench") > 0)
+            elif op == "chat_bulk":
+                n = repo.chat_history.create_many(
+                    [(f"bench-{tag}-w{idx}", f"question {i}-{j}", "a" * 400, "bench") for j in range(batch)])
+            elif op == "history_read":
+                n = len(repo.chat_history.get_by_uid(f"bench-{tag}-history"))
+            elif op == "events_read":
+                n = len(repo.events.get_by_domain_and_percentage(f"bench-{tag}-{i % 8}", float(i % 100)))
+            else:
+                uid = f"bench-{tag}-user-{i % 64}"
+                n = int(repo.users.get_by_uid(uid) is not None) + repo.users.update(uid, planning_days=i % 90)
+            latencies[idx].append((time.perf_counter() - start) * 1000)
+            rows_done[idx] += n
+            i += concurrency
+
+    errors_before = repo.stats().get("errors", 0)
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    lat = [ms for per in latencies for ms in per]
+    return {
+        "op": op,
+        "concurrency": concurrency,
+        "calls": len(lat),
+        "ops_per_s": round(len(lat) / elapsed, 1),
+        "rows_per_s": round(sum(rows_done) / elapsed, 1),
+        "p50_ms": percentile(lat, 0.50),
+        "p95_ms": percentile(lat, 0.95),
+        "errors": repo.stats().get("errors", 0) - errors_before,
+    }
+
+
+def compare(baseline, current):
+    base = {(r["driver"], r["op"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"{'driver':<11} {'op':<13} {'conc':>5} {'ops/s':>9} {'base':>9} {'ratio':>7} {'p95 ms':>8} {'base p95':>9}")
+    for r in current["results"]:
+        b = base.get((r["driver"], r["op"], r["concurrency"]))
+        ratio = f"{r['ops_per_s'] / b['ops_per_s']:.2f}x" if b and b["ops_per_s"] else "-"
+        print(f"{r['driver']:<11} {r['op']:<13} {r['concurrency']:>5} {r['ops_per_s']:>9} "
+              f"{b['ops_per_s'] if b else '-':>9} {ratio:>7} {r['p95_ms']:>8} {b['p95_ms'] if b else '-':>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", help="Database URL to test (repeatable; default: temporary SQLite file)")
+    parser.add_argument("--ops", default=",".join(OPERATIONS), help="Comma-separated operations to benchmark")
+    parser.add_argument("--levels", default="1,4,16", help="Comma-separated thread counts")
+    parser.add_argument("--duration", type=float, default=2.0, help="Seconds per operation and level")
+    parser.add_argument("--pool-size", type=int, default=repository.POOL_SIZE, help="Connections per repository")
+    parser.add_argument("--batch", type=int, default=100, help="Rows per chat_bulk call")
+    parser.add_argument("--history", type=int, default=200, help="Rows in the history_read conversation")
+    parser.add_argument("--conformance-only", action="store_true", help="Run the checks and skip the benchmark")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    tmpdir = None
+    urls = args.url
+    if not urls:
+        tmpdir = tempfile.TemporaryDirectory()
+        urls = [f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"]
+    levels = [int(x) for x in args.levels.split(",") if x]
+    ops = [op for op in args.ops.split(",") if op]
+    results, checks = [], {}
+    failed = False
+
+    for url in urls:
+        # Tables are created for every backend here (PostgreSQL included) so a fresh database works
+        repo = repository.open_repository(url, pool_size=args.pool_size, init_schema=True)
+        name = repo.driver.name
+        tag = uuid.uuid4().hex[:8]
+        failures = conformance(repo, tag)
+        checks[_redact(url)] = failures
+        if failures:
+            failed = True
+            print(f"[FAIL] {name} ({_redact(url)}): {len(failures)} conformance failure(s)", flush=True)
+            for f in failures:
+                print(f"    - {f}")
+            repo.close()
+            continue
+        print(f"[OK] {name} ({_redact(url)}) conforms", flush=True)
+        if args.conformance_only:
+            repo.close()
+            continue
+        try:
+            seed(repo, tag, args.history)
+            for op in ops:
+                for level in levels:
+                    row = {"driver": name, **run_level(repo, tag, op, level, args.duration, args.batch)}
+                    print(f"{name:<10} {op:<12} conc={level:<3} ops/s={row['ops_per_s']:<9} rows/s={row['rows_per_s']:<10} "
+                          f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms errors={row['errors']}", flush=True)
+                    results.append(row)
+        finally:
+            _cleanup(repo, f"bench-{tag}", f"bench-{tag}")
+            repo.close()
+
+    if tmpdir:
+        tmpdir.cleanup()
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "duration_s": args.duration,
+            "pool_size": args.pool_size,
+            "batch": args.batch,
+            "history": args.history,
+        },
+        "conformance": checks,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    elif not args.conformance_only:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
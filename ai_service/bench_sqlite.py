@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+SQLite throughput: db_sqlite.get_connection() against repository.py's SQLite driver.
+
+Three modes, each on its own scratch database seeded with the same rows:
+
+    legacy  db_sqlite.get_connection() per operation (new connection, rollback journal,
+            commit per write) on the tables without the lookup indexes, as before
+    pooled  repository SQLiteDriver default: shared connection pool, indexes
+    tuned   repository SQLiteDriver tuned mode: per-thread connections, WAL,
+            synchronous=NORMAL, mmap, indexes
+
+Workloads run from 1, 8 and 64 client threads (--levels):
+
+    read         chat history for a user, events for a domain up to a percentage
+    write        one chat_history insert per operation (like /ask_ai)
+    write_batch  --batch inserts committed together (batch() in the repository modes)
+    mixed        --read-ratio reads, the rest single writes
+
+    python bench_sqlite.py --output bench_sqlite.json
+    python bench_sqlite.py --modes legacy,tuned --workloads mixed --duration 5
+    python bench_sqlite.py --compare bench_sqlite.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import threading
+import time
+
+import repository
+from bench_common import git_commit
+from stats import percentile
+
+DOMAINS = ["web", "data", "mobile", "cloud", "security", "ml", "devops", "design"]
+USERS = 256
+HISTORY_PER_USER = 20
+ANSWER = "a" * 400
+
+
+def seed(path, indexes):
+    repo = repository.open_repository(f"sqlite:///{path}?tuned=0", pool_size=1)
+    repo.chat_history.create_many([(f"user-{u}", f"question {i}", ANSWER, "bench")
+                                   for u in range(USERS) for i in range(HISTORY_PER_USER)])
+    repo.events.create_many([(f"Event {i}", DOMAINS[i % len(DOMAINS)], "2025-01-01", "https://example.com",
+                              (i * 7) % 100) for i in range(2000)])
+    if not indexes:
+        for name in ("idx_chat_history_uid_id", "idx_roadmap_progress_uid", "idx_events_domain", "idx_projects_domain"):
+            repo.driver.execute(f"DROP INDEX IF EXISTS {name}")
+    repo.close()
+
+
+class Legacy:
+    """The operations as db_sqlite.get_connection() callers do them."""
+
+    def __init__(self, path):
+        import db_sqlite  # creates its tables in DB_FILE on import; point it at the scratch file first
+        db_sqlite.DB_FILE = path
+        self.db = db_sqlite
+
+    def read(self, uid, domain, pct):
+        conn = self.db.get_connection()
+        try:
+            n = len(conn.execute("SELECT * FROM chat_history WHERE uid = ? ORDER BY timestamp ASC, id ASC",
+                                 (uid,)).fetchall())
+            n += len(conn.execute("SELECT * FROM events WHERE domain = ? AND suggested_for_percentage <= ? "
+                                  "ORDER BY suggested_for_percentage DESC", (domain, pct)).fetchall())
+            return n
+        finally:
+            conn.close()
+
+    def write(self, uid, count=1):
+        conn = self.db.get_connection()
+        try:
+            for i in range(count):
+                conn.execute("INSERT INTO chat_history (uid, question, answer, engine) VALUES (?, ?, ?, ?)",
+                             (uid, f"question {i}", ANSWER, "bench"))
+            conn.commit()
+            return count
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+class Repo:
+    def __init__(self, path, tuned):
+        self.repo = repository.open_repository(f"sqlite:///{path}?tuned={int(tuned)}", pool_size=64)
+
+    def read(self, uid, domain, pct):
+        return (len(self.repo.chat_history.get_by_uid(uid))
+                + len(self.repo.events.get_by_domain_and_percentage(domain, pct)))
+
+    def write(self, uid, count=1):
+        if count == 1:
+            return int(self.repo.chat_history.create(uid, "question", ANSWER, "bench") > 0)
+        with self.repo.driver.batch():
+            return sum(int(self.repo.chat_history.create(uid, f"question {i}", ANSWER, "bench") > 0)
+                       for i in range(count))
+
+    def close(self):
+        self.repo.close()
+
+
+def run_level(backend, workload, concurrency, duration_s, batch, read_ratio):
+    latencies = [[] for _ in range(concurrency)]
+    rows = [0] * concurrency
+    errors = [0] * concurrency
+    stop = time.monotonic() + duration_s
+
+    def worker(idx):
+        rng = random.Random(idx)
+        while time.monotonic() < stop:
+            uid = f"user-{rng.randrange(USERS)}"
+            op = workload
+            if workload == "mixed":
+                op = "read" if rng.random() < read_ratio else "write"
+            start = time.perf_counter()
+            try:
+                if op == "read":
+                    n = backend.read(uid, rng.choice(DOMAINS), float(rng.randrange(100)))
+                else:
+                    # Own uid per writer, so the users being read keep the same history size
+                    n = backend.write(f"writer-{idx}", batch if op == "write_batch" else 1)
+            except Exception:  # legacy mode raises "database is locked" under write contention
+                errors[idx] += 1
+                n = 0
+            latencies[idx].append((time.perf_counter() - start) * 1000)
+            rows[idx] += n
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+    lat = [ms for per in latencies for ms in per]
+    return {
+        "workload": workload,
+        "concurrency": concurrency,
+        "ops": len(lat),
+        "ops_per_s": round(len(lat) / elapsed, 1),
+        "rows_per_s": round(sum(rows) / elapsed, 1),
+        "p50_ms": percentile(lat, 0.50),
+        "p95_ms": percentile(lat, 0.95),
+        "p99_ms": percentile(lat, 0.99),
+        "errors": sum(errors),
+    }
+
+
+def compare(baseline, current):
+    base = {(r["mode"], r["workload"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"{'mode':<7} {'workload':<12} {'conc':>5} {'ops/s':>9} {'base':>9} {'ratio':>7} {'p95 ms':>8} {'base p95':>9}")
+    for r in current["results"]:
+        b = base.get((r["mode"], r["workload"], r["concurrency"]))
+        ratio = f"{r['ops_per_s'] / b['ops_per_s']:.2f}x" if b and b["ops_per_s"] else "-"
+        print(f"{r['mode']:<7} {r['workload']:<12} {r['concurrency']:>5} {r['ops_per_s']:>9} "
+              f"{b['ops_per_s'] if b else '-':>9} {ratio:>7} {r['p95_ms']:>8} {b['p95_ms'] if b else '-':>9}")
+
+
+def summary(results):
+    """ops/s of each mode relative to legacy, per workload and level."""
+    legacy = {(r["workload"], r["concurrency"]): r["ops_per_s"] for r in results if r["mode"] == "legacy"}
+    print(f"\n{'workload':<12} {'conc':>5} " + " ".join(f"{m:>14}" for m in ("legacy", "pooled", "tuned")))
+    keys = sorted({(r["workload"], r["concurrency"]) for r in results}, key=lambda k: (k[0], k[1]))
+    for key in keys:
+        cells = []
+        for mode in ("legacy", "pooled", "tuned"):
+            r = next((r for r in results if r["mode"] == mode and (r["workload"], r["concurrency"]) == key), None)
+            if r is None:
+                cells.append(f"{'-':>14}")
+            elif legacy.get(key):
+                cells.append(f"{r['ops_per_s']:>8} {r['ops_per_s'] / legacy[key]:>4.1f}x")
+            else:
+                cells.append(f"{r['ops_per_s']:>14}")
+        print(f"{key[0]:<12} {key[1]:>5} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="legacy,pooled,tuned", help="Comma-separated modes")
+    parser.add_argument("--workloads", default="read,write,write_batch,mixed", help="Comma-separated workloads")
+    parser.add_argument("--levels", default="1,8,64", help="Comma-separated client thread counts")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per workload and level")
+    parser.add_argument("--batch", type=int, default=20, help="Inserts per write_batch operation")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="Share of reads in the mixed workload")
+    parser.add_argument("--dir", help="Directory for the scratch databases (default: a temporary directory)")
+    parser.add_argument("--output", help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    tmpdir = None if args.dir else tempfile.TemporaryDirectory()
+    workdir = args.dir or tmpdir.name
+    levels = [int(x) for x in args.levels.split(",") if x]
+    workloads = [w for w in args.workloads.split(",") if w]
+    results = []
+    cwd = os.getcwd()
+    os.chdir(workdir)  # db_sqlite creates career_roadmap.db in the working directory on import
+    try:
+        for mode in [m for m in args.modes.split(",") if m]:
+            path = os.path.join(workdir, f"bench_{mode}.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+            seed(path, indexes=mode != "legacy")
+            backend = Legacy(path) if mode == "legacy" else Repo(path, tuned=mode == "tuned")
+            try:
+                for workload in workloads:
+                    for level in levels:
+                        row = {"mode": mode, **run_level(backend, workload, level, args.duration, args.batch,
+                                                         args.read_ratio)}
+                        print(f"{mode:<7} {workload:<12} conc={level:<3} ops/s={row['ops_per_s']:<9} "
+                              f"p50={row['p50_ms']}ms p95={row['p95_ms']}ms errors={row['errors']}", flush=True)
+                        results.append(row)
+            finally:
+                backend.close()
+    finally:
+        os.chdir(cwd)
+        if tmpdir:
+            tmpdir.cleanup()
+
+    summary(results)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "sqlite": repository.sqlite3.sqlite_version,
+            "duration_s": args.duration,
+            "batch": args.batch,
+            "read_ratio": args.read_ratio,
+            "users": USERS,
+            "history_per_user": HISTORY_PER_USER,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(json.dumps(report, indent=2) + "\n")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Brownout for roadmap generation.
+The controller watches the rolling p95 latency of generate_roadmap_via_ai and the queue
+depth (interactive generations in flight plus calls waiting for a provider slot). While
+either breaches its SLO, roadmap requests that miss the cache are answered right away
+with the template roadmap (flagged as degraded) instead of waiting on slow providers, and
+an AI generation for the same parameters is queued in the background to upgrade the
+cache entry, so the next request for it gets the real roadmap.
+
+Brownout ends once both signals are back under BROWNOUT_EXIT_RATIO of their limits and it
+has lasted BROWNOUT_HOLD_S. Only interactive generations supply latency samples: background
+upgrades run unhurried and would hold p95 up forever. Samples expire after BROWNOUT_WINDOW_S,
+so a brownout that sends nobody to the providers ends once the window has passed.
+
+Opt-in (BROWNOUT=1). BROWNOUT_P95_MS defaults to 120 s, above the 30-90 s an ordinary
+roadmap generation takes, so the controller only trips when providers are really degraded.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from stats import percentile
+
+ENABLED = os.environ.get("BROWNOUT", "0") == "1"
+FORCE = os.environ.get("BROWNOUT_FORCE", "0") == "1"  # always degrade (incident switch)
+P95_MS = float(os.environ.get("BROWNOUT_P95_MS", 120000))
+MAX_QUEUE = int(os.environ.get("BROWNOUT_MAX_QUEUE", 16))
+WINDOW_S = float(os.environ.get("BROWNOUT_WINDOW_S", 60))
+MIN_SAMPLES = int(os.environ.get("BROWNOUT_MIN_SAMPLES", 5))
+HOLD_S = float(os.environ.get("BROWNOUT_HOLD_S", 30))
+EXIT_RATIO = float(os.environ.get("BROWNOUT_EXIT_RATIO", 0.7))
+UPGRADE = os.environ.get("BROWNOUT_UPGRADE", "1") == "1"
+UPGRADE_MAX_PENDING = int(os.environ.get("BROWNOUT_UPGRADE_MAX_PENDING", 4))
+
+
+def _waiting_for_slots() -> int:
+    import llm_transport
+    return sum(p["waiting"] for p in llm_transport.limiter.snapshot().values())
+
+
+class BrownoutController:
+    def __init__(self):
+        self._samples = deque(maxlen=1000)  # (monotonic time, latency ms)
+        self._inflight = 0
+        self._since = None  # monotonic time brownout started, None when off
+        self._reason = None
+        self._upgrades = set()
+        self._lock = threading.Lock()
+        self.stats = {"entered": 0, "degraded": 0, "served_cached": 0,
+                      "upgrades_queued": 0, "upgrades_dropped": 0, "upgrades_done": 0, "upgrades_failed": 0}
+
+    @contextmanager
+    def track(self, interactive: bool = True):
+        """Time one roadmap generation; only interactive ones count towards p95 and the queue depth."""
+        start = time.monotonic()
+        if interactive:
+            with self._lock:
+                self._inflight += 1
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            now = time.monotonic()
+            with self._lock:
+                if interactive:
+                    self._inflight -= 1
+                # Calls shed for lack of a slot (LLMOverloaded) say nothing about provider latency
+                if completed and interactive:
+                    self._samples.append((now, (now - start) * 1000))
+
+    def _p95_ms(self, now: float) -> float | None:
+        while self._samples and now - self._samples[0][0] > WINDOW_S:
+            self._samples.popleft()
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        return percentile([ms for _, ms in self._samples], 0.95, None)
+
+    def active(self) -> bool:
+        """Whether roadmap requests should be degraded now (re-evaluates the SLOs)."""
+        if FORCE:
+            return True
+        if not ENABLED:
+            return False
+        waiting = _waiting_for_slots()
+        now = time.monotonic()
+        with self._lock:
+            p95 = self._p95_ms(now)
+            depth = self._inflight + waiting
+            if self._since is None:
+                if p95 is not None and p95 > P95_MS:
+                    self._reason = f"p95 {p95:.0f} ms > {P95_MS:.0f} ms"
+                elif depth > MAX_QUEUE:
+                    self._reason = f"queue depth {depth} > {MAX_QUEUE}"
+                else:
+                    return False
+                self._since = now
+                self.stats["entered"] += 1
+                print(f"[AI] Brownout on: {self._reason}; serving template roadmaps")
+            elif (now - self._since >= HOLD_S and (p95 is None or p95 <= P95_MS * EXIT_RATIO)
+                  and depth <= MAX_QUEUE * EXIT_RATIO):
+                print(f"[AI] Brownout off after {now - self._since:.0f}s")
+                self._since, self._reason = None, None
+                return False
+            return True
+
+    def count(self, stat: str):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def upgrade(self, key, run) -> bool:
+        """
+        Run run() on a background thread to replace a degraded response (at most one per key
+        and UPGRADE_MAX_PENDING overall); run() should store its result where the next
+        request finds it. Returns False when the upgrade was not queued.
+        """
+        if not UPGRADE:
+            return False
+        with self._lock:
+            if key in self._upgrades or len(self._upgrades) >= UPGRADE_MAX_PENDING:
+                self.stats["upgrades_dropped"] += 1
+                return False
+            self._upgrades.add(key)
+            self.stats["upgrades_queued"] += 1
+
+        def target():
+            ok = False
+            try:
+                with self.track(interactive=False):
+                    ok = bool(run())
+            except Exception as e:
+                print(f"[AI] Brownout upgrade failed: {e}")
+            finally:
+                with self._lock:
+                    self._upgrades.discard(key)
+                    self.stats["upgrades_done" if ok else "upgrades_failed"] += 1
+
+        threading.Thread(target=target, daemon=True, name="brownout-upgrade").start()
+        return True
+
+    def describe(self) -> dict:
+        waiting = _waiting_for_slots()
+        now = time.monotonic()
+        with self._lock:
+            p95 = self._p95_ms(now)
+            return {
+                "enabled": ENABLED,
+                "forced": FORCE,
+                "active": FORCE or self._since is not None,
+                "reason": self._reason,
+                "active_for_s": round(now - self._since, 1) if self._since is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "p95_limit_ms": P95_MS,
+                "samples": len(self._samples),
+                "queue_depth": self._inflight + waiting,
+                "queue_limit": MAX_QUEUE,
+                "upgrades_pending": len(self._upgrades),
+                "stats": dict(self.stats),
+            }
+
+
+brownout = BrownoutController()
@@ -0,0 +1,155 @@
+"""
+Speculative prefetch of the next roadmap chapters.
+After /generate-roadmap or /generate-next-chapter returns, the client will soon ask for
+the chapters after the last unit it received. A background worker generates them via
+generate_next_chapters_via_ai and keeps the result keyed by (domain, last_unit_number)
+so that request is served instantly.
+
+Prefetch never competes with interactive traffic: the queue is bounded (new work is
+dropped when full), each provider has a per-minute prefetch budget, and a provider is
+skipped while it already has PREFETCH_MAX_INTERACTIVE interactive calls in flight.
+"""
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+ENABLED = os.environ.get("CHAPTER_PREFETCH", "0") == "1"
+COUNT = int(os.environ.get("PREFETCH_CHAPTERS", 2))
+QUEUE_SIZE = int(os.environ.get("PREFETCH_QUEUE_SIZE", 16))
+WORKERS = int(os.environ.get("PREFETCH_WORKERS", 1))
+MAX_ENTRIES = int(os.environ.get("PREFETCH_MAX_ENTRIES", 256))
+TTL_S = float(os.environ.get("PREFETCH_TTL_S", 1800))
+PROVIDER_BUDGET_PER_MIN = int(os.environ.get("PREFETCH_PROVIDER_BUDGET_PER_MIN", 6))
+MAX_INTERACTIVE = int(os.environ.get("PREFETCH_MAX_INTERACTIVE", 2))
+
+
+def _key(domain, last_unit_number):
+    return (" ".join(str(domain or "").split()).lower(), int(last_unit_number))
+
+
+class ProviderBudget:
+    """Per-provider cap on background calls per minute, and no prefetch while interactive calls queue up."""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+
+    def allow(self, provider):
+        from llm_client import inflight
+        usage = inflight().get(provider, {})
+        if usage.get("interactive", 0) >= MAX_INTERACTIVE:
+            return False
+        return usage.get("background_last_min", 0) < self.per_minute
+
+    def usage(self):
+        from llm_client import inflight
+        return {p: u["background_last_min"] for p, u in inflight().items() if u["background_last_min"]}
+
+
+class ChapterPrefetcher:
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._store = OrderedDict()  # key -> (created_at, units)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._workers = []
+        self.budget = ProviderBudget(PROVIDER_BUDGET_PER_MIN)
+        self.stats = {"enqueued": 0, "dropped_queue_full": 0, "generated": 0, "failed": 0,
+                      "hits": 0, "misses": 0, "expired_unused": 0, "evicted_unused": 0}
+
+    def _ensure_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(WORKERS):
+                t = threading.Thread(target=self._run, daemon=True, name=f"chapter-prefetch-{i}")
+                t.start()
+                self._workers.append(t)
+
+    def schedule(self, domain, last_unit_number):
+        """Queue a prefetch of the chapters after last_unit_number (no-op if disabled, queued or stored)."""
+        if not ENABLED or not domain:
+            return False
+        key = _key(domain, last_unit_number)
+        with self._lock:
+            if key in self._pending or key in self._store:
+                return False
+            self._pending.add(key)
+        try:
+            self._queue.put_nowait((domain, int(last_unit_number)))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(key)
+                self.stats["dropped_queue_full"] += 1
+            return False
+        with self._lock:
+            self.stats["enqueued"] += 1
+        self._ensure_workers()
+        return True
+
+    def _run(self):
+        from llm_client import background_calls, generate_next_chapters_via_ai
+        while True:
+            domain, last_unit = self._queue.get()
+            key = _key(domain, last_unit)
+            try:
+                with background_calls(allow=self.budget.allow):
+                    result = generate_next_chapters_via_ai(domain, last_unit, count=COUNT)
+                units = (result or {}).get("units")
+                with self._lock:
+                    if units:
+                        self._store[key] = (time.monotonic(), units)
+                        self.stats["generated"] += 1
+                        while len(self._store) > MAX_ENTRIES:
+                            self._store.popitem(last=False)
+                            self.stats["evicted_unused"] += 1
+                    else:
+                        self.stats["failed"] += 1
+            except Exception as e:
+                print(f"[AI] Prefetch for '{domain}' after unit {last_unit} failed: {e}")
+                with self._lock:
+                    self.stats["failed"] += 1
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+                self._queue.task_done()
+
+    def take(self, domain, last_unit_number):
+        """Return prefetched units for this request (removing them), or None."""
+        if not ENABLED:
+            return None
+        key = _key(domain, last_unit_number)
+        with self._lock:
+            entry = self._store.pop(key, None)
+            if entry is not None and time.monotonic() - entry[0] > TTL_S:
+                self.stats["expired_unused"] += 1
+                entry = None
+            self.stats["hits" if entry is not None else "misses"] += 1
+        return entry[1] if entry is not None else None
+
+    def describe(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stored = len(self._store)
+            pending = len(self._pending)
+        lookups = stats["hits"] + stats["misses"]
+        used = stats["hits"]
+        return {
+            "enabled": ENABLED,
+            "stats": stats,
+            "hit_rate": round(stats["hits"] / lookups, 3) if lookups else None,
+            # Share of generated prefetches that were actually served
+            "utilization": round(used / stats["generated"], 3) if stats["generated"] else None,
+            "stored": stored,
+            "pending": pending,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": QUEUE_SIZE,
+            "provider_budget_per_min": PROVIDER_BUDGET_PER_MIN,
+            "provider_usage_last_min": self.budget.usage(),
+        }
+
+
+prefetcher = ChapterPrefetcher()
@@ -0,0 +1,166 @@
+"""
+Write-behind persistence for chat history (CHAT_WRITE_BEHIND=1).
+/ask_ai hands its row to an in-memory queue and responds without waiting for the database.
+A single background writer drains the queue in submission order and inserts the rows in
+batches through the repository (one executemany / multi-row INSERT per batch) as soon as
+CHAT_FLUSH_BATCH rows are waiting or the oldest has waited CHAT_FLUSH_INTERVAL_MS.
+
+The queue holds at most CHAT_QUEUE_SIZE rows. When it is full, submit() waits up to
+CHAT_QUEUE_BLOCK_MS for room (backpressure on the request) and then writes the row itself,
+so rows are not dropped while the database keeps up at all. Reads of the history call
+sync() first so a user sees their own messages, and pending rows are flushed at
+interpreter exit. A hard kill loses whatever was still queued.
+"""
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from repository import utcnow
+from stats import percentile
+
+ENABLED = os.environ.get("CHAT_WRITE_BEHIND", "0") == "1"
+QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", 1000))
+QUEUE_BLOCK_S = float(os.environ.get("CHAT_QUEUE_BLOCK_MS", 200)) / 1000.0
+FLUSH_BATCH = int(os.environ.get("CHAT_FLUSH_BATCH", 100))
+FLUSH_INTERVAL_S = float(os.environ.get("CHAT_FLUSH_INTERVAL_MS", 50)) / 1000.0
+FLUSH_RETRIES = int(os.environ.get("CHAT_FLUSH_RETRIES", 3))
+SYNC_TIMEOUT_S = float(os.environ.get("CHAT_SYNC_TIMEOUT_S", 2))
+SHUTDOWN_TIMEOUT_S = float(os.environ.get("CHAT_SHUTDOWN_TIMEOUT_S", 10))
+
+
+class ChatHistoryWriter:
+    def __init__(self, enabled: bool = ENABLED):
+        self.enabled = enabled
+        self._rows = deque()  # (uid, question, answer, engine, timestamp)
+        self._lock = threading.Lock()
+        self._has_rows = threading.Condition(self._lock)  # the writer waits on it
+        self._has_room = threading.Condition(self._lock)  # submitters wait on it when the queue is full
+        self._written = threading.Condition(self._lock)  # sync() waits on it
+        self._submitted = 0  # rows accepted into the queue
+        self._processed = 0  # rows written or given up on
+        self._flush_requested = False
+        self._worker = None
+        self._flush_ms = deque(maxlen=500)
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "queue_full_waits": 0, "written_inline": 0,
+                      "failed_batches": 0, "dropped": 0, "max_depth": 0}
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is not None:
+                return
+            self._worker = threading.Thread(target=self._run, daemon=True, name="chat-history-writer")
+            self._worker.start()
+        atexit.register(self.close)
+
+    def submit(self, uid: str, question: str, answer: str, engine: str = "gemini") -> bool:
+        """
+        Record one chat exchange. Returns True once it is queued (or, when write-behind is off
+        or the queue stayed full, written); False only if an inline write failed.
+        """
+        from repository import get_repository
+        if not self.enabled:
+            return get_repository().chat_history.create(uid, question, answer, engine) > 0
+        self._ensure_worker()
+        row = (uid, question, answer, engine, utcnow())
+        with self._lock:
+            if len(self._rows) >= QUEUE_SIZE:
+                self.stats["queue_full_waits"] += 1
+                self._has_room.wait_for(lambda: len(self._rows) < QUEUE_SIZE, timeout=QUEUE_BLOCK_S)
+            if len(self._rows) < QUEUE_SIZE:
+                self._rows.append(row)
+                self._submitted += 1
+                self.stats["queued"] += 1
+                self.stats["max_depth"] = max(self.stats["max_depth"], len(self._rows))
+                self._has_rows.notify()
+                return True
+            self.stats["written_inline"] += 1
+        # Still full: the database is falling behind, so this request pays for its own write
+        return get_repository().chat_history.create_many([row]) == 1
+
+    def _run(self):
+        from repository import get_repository
+        repo = get_repository()
+        while True:
+            with self._lock:
+                self._has_rows.wait_for(lambda: self._rows)
+                deadline = time.monotonic() + FLUSH_INTERVAL_S
+                while len(self._rows) < FLUSH_BATCH and not self._flush_requested:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._has_rows.wait(left)
+                batch = [self._rows.popleft() for _ in range(min(FLUSH_BATCH, len(self._rows)))]
+                self._flush_requested = self._flush_requested and bool(self._rows)
+                self._has_room.notify_all()
+            self._write(repo, batch)
+
+    def _write(self, repo, batch):
+        start = time.monotonic()
+        written = 0
+        for attempt in range(FLUSH_RETRIES + 1):
+            try:
+                written = repo.chat_history.create_many(batch)
+            except Exception as e:  # the writer thread must survive whatever the database does
+                print(f"[ERROR] Chat history write-behind batch failed: {e}")
+                written = 0
+            if written:
+                break
+            if attempt < FLUSH_RETRIES:
+                print(f"[INFO] Retrying chat history batch of {len(batch)} rows (attempt {attempt + 2})")
+                time.sleep(min(0.1 * 2 ** attempt, 2.0))
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._flush_ms.append(elapsed_ms)
+            self._processed += len(batch)
+            if written:
+                self.stats["written"] += written
+                self.stats["batches"] += 1
+            else:
+                self.stats["failed_batches"] += 1
+                self.stats["dropped"] += len(batch)
+            self._written.notify_all()
+        if not written:
+            print(f"[ERROR] Chat history write-behind failed: dropped {len(batch)} rows after {FLUSH_RETRIES + 1} attempts")
+
+    def sync(self, timeout_s: float = SYNC_TIMEOUT_S) -> bool:
+        """Flush now and wait until every row submitted so far is written; False on timeout."""
+        with self._lock:
+            target = self._submitted
+            if self._processed >= target:
+                return True
+            self._flush_requested = True
+            self._has_rows.notify()
+            return self._written.wait_for(lambda: self._processed >= target, timeout=timeout_s)
+
+    def close(self):
+        """Flush what is queued (at exit); waits up to CHAT_SHUTDOWN_TIMEOUT_S."""
+        if not self.sync(SHUTDOWN_TIMEOUT_S):
+            with self._lock:
+                left = len(self._rows)
+            print(f"[ERROR] Chat history write-behind shutdown failed: {left} rows unwritten")
+
+    def describe(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            depth = len(self._rows)
+            flush_ms = list(self._flush_ms)
+            oldest = self._rows[0][4] if self._rows else None
+        return {
+            "enabled": self.enabled,
+            "queue_depth": depth,
+            "queue_size": QUEUE_SIZE,
+            "oldest_queued_ms": round((utcnow() - oldest).total_seconds() * 1000, 1) if oldest else None,
+            "flush_batch": FLUSH_BATCH,
+            "flush_interval_ms": FLUSH_INTERVAL_S * 1000,
+            "flush_p50_ms": percentile(flush_ms, 0.50),
+            "flush_p95_ms": percentile(flush_ms, 0.95),
+            "rows_per_batch": round(stats["written"] / stats["batches"], 1) if stats["batches"] else None,
+            "stats": stats,
+        }
+
+
+writer = ChatHistoryWriter()
@@ -1,26 +1,63 @@
 # db_postgres.py - PostgreSQL database connection using psycopg2
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
+
+from stats import percentile
 
 try:
     import psycopg2
     from psycopg2 import Error
+    from psycopg2.extensions import TRANSACTION_STATUS_IDLE
     from psycopg2.extras import RealDictCursor
+    from psycopg2.pool import ThreadedConnectionPool
 except ImportError:
     psycopg2 = None
     Error = Exception
 
+POOL_MIN = int(os.environ.get('DB_POOL_MIN', 1))
+POOL_MAX = int(os.environ.get('DB_POOL_MAX', 10))
+POOL_TIMEOUT_S = float(os.environ.get('DB_POOL_TIMEOUT_S', 5))
+# Connections idle longer than this get a round-trip check (SELECT 1) when borrowed
+POOL_CHECK_IDLE_S = float(os.environ.get('DB_POOL_CHECK_IDLE_S', 30))
+CONNECT_TIMEOUT_S = int(os.environ.get('DB_CONNECT_TIMEOUT_S', 5))
+# Rows per round trip when streaming through a server-side cursor
+STREAM_ITERSIZE = int(os.environ.get('DB_STREAM_ITERSIZE', 200))
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within DB_POOL_TIMEOUT_S."""
+
 
 class DatabaseConnection:
-    def __init__(self):
-        self.connection = None
-        self.cursor = None
+    """
+    Pool of PostgreSQL connections (DB_POOL_MIN..DB_POOL_MAX) shared by all threads.
+    Each query borrows a connection and gets its own cursor, so concurrent requests run
+    in parallel instead of sharing one socket. Borrowing waits up to DB_POOL_TIMEOUT_S for
+    a free connection; borrowed connections are health-checked and replaced when dead.
+    """
+
+    def __init__(self, minconn: int = POOL_MIN, maxconn: int = POOL_MAX, timeout_s: float = POOL_TIMEOUT_S, **config):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.timeout_s = timeout_s
+        self.config = config
+        self.pool = None
+        self._slots = threading.BoundedSemaphore(self.maxconn)
+        self._last_used = {}  # id(connection) -> time.monotonic() it was returned
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'discarded': 0, 'errors': 0, 'in_use': 0, 'waiting': 0,
+                       'wait_ms': deque(maxlen=1000)}
         if psycopg2:
             self.connect()
 
     def connect(self):
-        """Establish PostgreSQL database connection"""
+        """Create the PostgreSQL connection pool"""
         if not psycopg2:
             print("[ERROR] psycopg2 not installed. Run: pip install psycopg2-binary")
             return
@@ -31,72 +68,207 @@ class DatabaseConnection:
                 'user': os.environ.get('DB_USER', 'postgres'),
                 'password': os.environ.get('DB_PASSWORD', ''),
                 'dbname': os.environ.get('DB_NAME', 'career_roadmap'),
+                'connect_timeout': CONNECT_TIMEOUT_S,
+                **self.config,
             }
-            self.connection = psycopg2.connect(**config)
-            self.cursor = self.connection.cursor(cursor_factory=RealDictCursor)
-            self.connection.autocommit = True
-            print(f"[SUCCESS] Connected to PostgreSQL database: {config['dbname']}")
+            self.pool = ThreadedConnectionPool(self.minconn, self.maxconn, **config)
+            print(f"[SUCCESS] Connected to PostgreSQL database: {config['dbname']} (pool {self.minconn}-{self.maxconn})")
         except Error as e:
             print(f"[ERROR] Database connection failed: {e}")
-            self.connection = None
-            self.cursor = None
+            self.pool = None
 
     def is_connected(self) -> bool:
+        return self.pool is not None and not self.pool.closed
+
+    def reconnect(self):
+        if self.is_connected():
+            return
+        with self._connect_lock:
+            if not self.is_connected():
+                print("[INFO] Reconnecting to database...")
+                self.connect()
+
+    def _healthy(self, conn) -> bool:
+        """
+        Cheap checks on every borrow; a round trip only for connections that are new to
+        this pool or sat idle a while. Leaves a healthy connection in autocommit mode.
+        """
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            return False
+        with self._lock:
+            last_used = self._last_used.get(id(conn))
         try:
-            return self.connection is not None and not self.connection.closed
-        except:
+            conn.autocommit = True
+            if last_used is None or time.monotonic() - last_used >= POOL_CHECK_IDLE_S:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+            return True
+        except Error:
             return False
 
-    def reconnect(self):
-        if not self.is_connected():
-            print("[INFO] Reconnecting to database...")
-            self.connect()
+    def _discard(self, conn):
+        with self._lock:
+            self._stats['discarded'] += 1
+            self._last_used.pop(id(conn), None)
+        try:
+            self.pool.putconn(conn, close=True)
+        except Error:
+            pass
+
+    def _borrow(self):
+        start = time.monotonic()
+        with self._lock:
+            self._stats['waiting'] += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout_s)
+        finally:
+            with self._lock:
+                self._stats['waiting'] -= 1
+        if not acquired:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolTimeout(f"no database connection free within {self.timeout_s}s")
+        try:
+            while True:
+                conn = self.pool.getconn()
+                if self._healthy(conn):
+                    break
+                print("[INFO] Replacing dead database connection")
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats['checkouts'] += 1
+            self._stats['in_use'] += 1
+            self._stats['wait_ms'].append((time.monotonic() - start) * 1000)
+        return conn
+
+    def _return(self, conn, broken: bool = False):
+        try:
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._last_used[id(conn)] = time.monotonic()
+                self.pool.putconn(conn)
+        finally:
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection (autocommit) for the duration of the block."""
+        self.reconnect()
+        if self.pool is None:
+            raise Error("database not connected")
+        conn = self._borrow()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self._return(conn, broken)
+
+    @contextmanager
+    def cursor(self):
+        """A RealDictCursor of its own on a borrowed connection."""
+        with self.connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                yield cur
+
+    def _failed(self, what: str, e: Exception):
+        with self._lock:
+            self._stats['errors'] += 1
+        print(f"[ERROR] {what} failed: {e}")
 
     def execute_query(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
-        try:
-            self.reconnect()
-            if self.cursor:
-                self.cursor.execute(query, params or ())
-                return self.cursor.fetchall()
-        except Error as e:
-            print(f"[ERROR] Query execution failed: {e}")
+        for attempt in range(2):
+            try:
+                with self.cursor() as cur:
+                    cur.execute(query, params or ())
+                    return cur.fetchall()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Connection died since its last health check (discarded on return): reads retry once
+                if attempt == 0 and self.is_connected():
+                    continue
+                self._failed("Query execution", e)
+            except (Error, PoolTimeout) as e:
+                self._failed("Query execution", e)
             return []
         return []
 
+    def stream_query(self, query: str, params: tuple = None, itersize: int = STREAM_ITERSIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the rows of a query through a server-side (named) cursor, itersize rows per round
+        trip, so large results are never held in memory at once. The connection stays borrowed
+        until the generator is exhausted or closed. Errors are logged and re-raised, since the
+        caller may already have consumed part of the result.
+        """
+        try:
+            with self.connection() as conn:
+                conn.autocommit = False  # named cursors only live inside a transaction
+                try:
+                    with conn.cursor(name=f"stream_{id(conn)}_{time.monotonic_ns()}", cursor_factory=RealDictCursor) as cur:
+                        cur.itersize = itersize
+                        cur.execute(query, params or ())
+                        yield from cur
+                finally:
+                    if not conn.closed:
+                        conn.rollback()  # read only: ends the transaction and drops the cursor
+                        conn.autocommit = True
+        except (Error, PoolTimeout) as e:
+            self._failed("Streaming query", e)
+            raise
+
     def execute_insert(self, query: str, params: tuple = None) -> int:
         try:
-            self.reconnect()
-            if self.cursor:
-                self.cursor.execute(query, params or ())
+            with self.cursor() as cur:
+                cur.execute(query, params or ())
                 if 'RETURNING' in query.upper():
-                    row = self.cursor.fetchone()
+                    row = cur.fetchone()
                     return row['id'] if row else 0
                 return 0
-        except Error as e:
-            print(f"[ERROR] Insert execution failed: {e}")
+        except (Error, PoolTimeout) as e:
+            self._failed("Insert execution", e)
             return 0
-        return 0
 
     def execute_update(self, query: str, params: tuple = None) -> int:
         try:
-            self.reconnect()
-            if self.cursor:
-                self.cursor.execute(query, params or ())
-                return self.cursor.rowcount
-        except Error as e:
-            print(f"[ERROR] Update execution failed: {e}")
+            with self.cursor() as cur:
+                cur.execute(query, params or ())
+                return cur.rowcount
+        except (Error, PoolTimeout) as e:
+            self._failed("Update execution", e)
             return 0
-        return 0
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Pool size and usage, checkout counts and checkout wait percentiles."""
+        with self._lock:
+            stats = {k: v for k, v in self._stats.items() if k != 'wait_ms'}
+            waits = list(self._stats['wait_ms'])
+        idle = len(self.pool._pool) if self.pool is not None and not self.pool.closed else 0
+        return {
+            **stats,
+            'connected': self.is_connected(),
+            'min': self.minconn,
+            'max': self.maxconn,
+            'idle': idle,
+            'open': idle + stats['in_use'],
+            'wait_p50_ms': percentile(waits, 0.50),
+            'wait_p95_ms': percentile(waits, 0.95),
+        }
 
     def close(self):
         try:
-            if self.cursor:
-                self.cursor.close()
-            if self.connection and not self.connection.closed:
-                self.connection.close()
-                print("[INFO] Database connection closed")
+            if self.pool and not self.pool.closed:
+                self.pool.closeall()
+                print("[INFO] Database connection pool closed")
         except Error as e:
-            print(f"[ERROR] Error closing connection: {e}")
+            print(f"[ERROR] Error closing connection pool: {e}")
 
 
 db = DatabaseConnection() if psycopg2 else None
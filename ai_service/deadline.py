@@ -0,0 +1,60 @@
+"""
+Request deadlines. Callers send X-Request-Timeout-Ms with how long they will wait for the
+response; the service turns it into an absolute time.monotonic() deadline (less a margin
+for building and sending the response) held in a context variable for the request.
+call_llm and friends cap provider timeouts and slot queueing by the time that remains and
+stop trying providers once it is gone, so the route answers with its template fallback
+while the caller is still listening. Background work (prefetch, jobs, cache refresh) runs
+in threads that do not inherit the variable and so has no deadline.
+"""
+import contextvars
+import os
+import time
+
+HEADER = "X-Request-Timeout-Ms"
+MARGIN_S = float(os.environ.get("REQUEST_DEADLINE_MARGIN_S", 1.0))
+DEFAULT_TIMEOUT_S = float(os.environ.get("REQUEST_TIMEOUT_S", 0))  # used without the header; 0 = no deadline
+MIN_CALL_S = float(os.environ.get("LLM_MIN_CALL_S", 2.0))  # less than this left: do not start a provider call
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+class Exceeded(Exception):
+    """The request deadline leaves no time for another provider call."""
+
+
+def parse(header_value) -> float | None:
+    """Absolute deadline for a request from its X-Request-Timeout-Ms value (REQUEST_TIMEOUT_S if absent)."""
+    try:
+        timeout_s = float(header_value) / 1000.0
+    except (TypeError, ValueError):
+        timeout_s = DEFAULT_TIMEOUT_S
+    if timeout_s <= 0:
+        return None
+    return time.monotonic() + max(0.0, timeout_s - MARGIN_S)
+
+
+def set_current(deadline: float | None):
+    """Make deadline current for this thread / task; returns a token for reset()."""
+    return _current.set(deadline)
+
+
+def reset(token):
+    _current.reset(token)
+
+
+def current() -> float | None:
+    return _current.get()
+
+
+def remaining(deadline: float | None) -> float | None:
+    """Seconds left before deadline (None when there is no deadline)."""
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def exhausted(deadline: float | None) -> bool:
+    """True when there is too little time left to start a provider call."""
+    left = remaining(deadline)
+    return left is not None and left < MIN_CALL_S
@@ -1,11 +1,13 @@
 # free_ai_service.py - No-cost AI alternatives
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
+import itertools
 import os
 import requests
 import json
 from dotenv import load_dotenv
-from db import SessionLocal, User, ChatHistory, RoadmapProgress
+from chat_writer import writer as chat_writer
+from repository import get_repository
 from roadmap import generate_roadmap_image
 from events import get_events_for_user
 from projects import get_projects_for_user
@@ -37,6 +39,11 @@ github_jobs_url = "https://jobs.github.com/positions.json"
 # Stack Overflow API (Completely free)
 stack_overflow_url = "https://api.stackexchange.com/2.3"
 
+# Chat history paging: ?before=<id> without ?limit returns CHAT_HISTORY_PAGE_SIZE rows; ?limit is capped
+CHAT_HISTORY_PAGE_SIZE = int(os.environ.get("CHAT_HISTORY_PAGE_SIZE", 50))
+CHAT_HISTORY_MAX_LIMIT = int(os.environ.get("CHAT_HISTORY_MAX_LIMIT", 500))
+CHAT_HISTORY_CHUNK_BYTES = 32 * 1024  # response body is flushed in chunks of about this size
+
 # ---------------- Free AI Response Function ----------------
 def get_free_ai_response(question, engine="fallback"):
     """Get AI response using free services"""
@@ -353,7 +360,6 @@ def ask_ai():
     engine = data.get("engine", "fallback")
     question = data.get("question")
     uid = data.get("uid", "anonymous")
-    session = SessionLocal()
 
     try:
         # Get AI response using free services
@@ -373,51 +379,100 @@ def ask_ai():
                 answer_text += f"- [{resource['title']}]({resource['url']}) ({resource['source']})\n"
 
         # Store chat
-        chat = ChatHistory(uid=uid, question=question, answer=answer_text, engine=engine)
-        session.add(chat)
-        session.commit()
+        # Queued for a batched write when CHAT_WRITE_BEHIND=1, so the response does not wait on the commit
+        if not chat_writer.submit(uid, question, answer_text, engine):
+            return jsonify({"error": "Database Error: chat history could not be saved"}), 500
 
     except Exception as e:
-        session.close()
         return jsonify({"error": f"AI Error: {str(e)}"}), 500
 
-    session.close()
     return jsonify({"answer": answer_text})
 
+def _history_entries(chat):
+    """The user and ai entries the frontend expects for one chat_history row."""
+    timestamp = chat["timestamp"].isoformat()
+    yield {"id": chat["id"], "type": "user", "content": chat["question"], "timestamp": timestamp, "engine": chat["engine"]}
+    yield {"id": chat["id"] + 1000, "type": "ai", "content": chat["answer"], "timestamp": timestamp, "engine": chat["engine"]}
+
+
+def _stream_history(rows):
+    """
+    JSON body for /get_chat_history written as rows arrive, so memory does not grow with the history.
+    If reading fails part way the body still closes as valid JSON, with an "error" and the cursors
+    of what was sent (next_after resumes after the last chat).
+    """
+    first = last = None
+    parts, size, sep = ['{"chat_history": ['], 0, ""
+    error = ""
+    try:
+        for chat in rows:
+            if first is None:
+                first = chat["id"]
+            last = chat["id"]
+            for entry in _history_entries(chat):
+                part = sep + json.dumps(entry)
+                sep = ","
+                parts.append(part)
+                size += len(part)
+            if size >= CHAT_HISTORY_CHUNK_BYTES:
+                yield "".join(parts)
+                parts, size = [], 0
+    except Exception as e:
+        print(f"Chat history stream error after chat {last}: {str(e)}")
+        error = f', "error": {json.dumps("Database Error: chat history incomplete")}'
+    parts.append(f']{error}, "next_before": {json.dumps(first)}, "next_after": {json.dumps(last)}}}')
+    yield "".join(parts)
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    return None if value in (None, "") else int(value)
+
+
 # Keep existing routes for chat history, roadmap, etc.
 @app.route("/get_chat_history", methods=["GET"])
 def get_chat_history():
+    """
+    uid's chat history, oldest first, streamed. Without paging parameters the whole history
+    is returned as before. ?after=<id> / ?before=<id> (the chat ids of user entries) with
+    ?limit=<chats> page through it by keyset; "next_after" / "next_before" in the response
+    are the cursors for the next / previous page, and a page shorter than limit is the last.
+    """
     uid = request.args.get("uid")
     if not uid:
         return jsonify({"error": "UID is required"}), 400
-    
-    session = SessionLocal()
     try:
-        chats = session.query(ChatHistory).filter(ChatHistory.uid == uid).order_by(ChatHistory.timestamp.asc()).all()
-        
-        chat_history = []
-        for chat in chats:
-            chat_history.append({
-                "id": chat.id,
-                "type": "user",
-                "content": chat.question,
-                "timestamp": chat.timestamp.isoformat(),
-                "engine": chat.engine
-            })
-            chat_history.append({
-                "id": chat.id + 1000,
-                "type": "ai",
-                "content": chat.answer,
-                "timestamp": chat.timestamp.isoformat(),
-                "engine": chat.engine
-            })
-        
-        return jsonify({"chat_history": chat_history})
+        before, after, limit = _int_arg("before"), _int_arg("after"), _int_arg("limit")
+    except ValueError:
+        return jsonify({"error": "before, after and limit must be integers"}), 400
+    if before is not None and after is not None:
+        return jsonify({"error": "Use either before or after, not both"}), 400
+    if limit is None and before is not None:
+        limit = CHAT_HISTORY_PAGE_SIZE
+    if limit is not None:
+        limit = max(1, min(limit, CHAT_HISTORY_MAX_LIMIT))
+
+    try:
+        chat_writer.sync()  # include this user's messages still queued for write-behind
+        rows = get_repository().chat_history.page(uid, before=before, after=after, limit=limit)
+        first = next(rows, None)  # start the query here, so failures still get an error response
+    except Exception as e:
+        return jsonify({"error": f"Database Error: {str(e)}"}), 500
+    rows = itertools.chain([first], rows) if first is not None else iter(())
+    return Response(_stream_history(rows), mimetype="application/json")
+
+@app.route("/chat_history/writer", methods=["GET"])
+def chat_history_writer():
+    """Write-behind chat history: queue depth, flush latency and batch sizes."""
+    return jsonify(chat_writer.describe()), 200
+
+@app.route("/db/stats", methods=["GET"])
+def db_stats():
+    """Repository driver counters; for PostgreSQL also the connection pool (usage, timeouts, checkout waits)."""
+    try:
+        return jsonify(get_repository().stats()), 200
     except Exception as e:
-        session.close()
         return jsonify({"error": f"Database Error: {str(e)}"}), 500
-    finally:
-        session.close()
 
 @app.route("/clear_chat_history", methods=["DELETE"])
 def clear_chat_history():
@@ -425,17 +480,12 @@ def clear_chat_history():
     if not uid:
         return jsonify({"error": "UID is required"}), 400
     
-    session = SessionLocal()
     try:
-        session.query(ChatHistory).filter(ChatHistory.uid == uid).delete()
-        session.commit()
+        chat_writer.sync()  # queued rows would otherwise reappear after the delete
+        get_repository().chat_history.clear_by_uid(uid)
         return jsonify({"message": "Chat history cleared successfully"})
     except Exception as e:
-        session.rollback()
-        session.close()
         return jsonify({"error": f"Database Error: {str(e)}"}), 500
-    finally:
-        session.close()
 
 @app.route("/generate_roadmap", methods=["POST"])
 def generate_roadmap():
@@ -449,11 +499,7 @@ def generate_roadmap():
     roadmap_steps = [f"Learn {skill}" for skill in skills_to_learn]
     img_path = generate_roadmap_image(roadmap_steps, uid)
 
-    session = SessionLocal()
-    progress = RoadmapProgress(uid=uid, roadmap_step=";".join(roadmap_steps), completion_percentage=0)
-    session.add(progress)
-    session.commit()
-    session.close()
+    get_repository().roadmap_progress.create(uid, ";".join(roadmap_steps), 0)
 
     return jsonify({"roadmap_steps": roadmap_steps, "roadmap_image": img_path})
 
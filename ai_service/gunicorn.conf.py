@@ -1,6 +1,23 @@
+import multiprocessing
 import os
 
 timeout = 120
-workers = 1
 # Render provides the PORT environment variable. Fallback to 10000 which is common for Render.
 bind = "0.0.0.0:" + str(os.environ.get('PORT', '10000'))
+
+# The service is I/O-bound on LLM provider calls, so requests run on threads (gthread) or
+# greenlets (gevent, requires `pip install gevent`) instead of one blocking sync worker.
+# GUNICORN_WORKER_CLASS=sync with GUNICORN_WORKERS=1 restores the old single-worker mode.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Few processes: caches, single-flight and the provider limiter are per process.
+workers = int(os.environ.get('GUNICORN_WORKERS', min(multiprocessing.cpu_count(), 2)))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 200))
+# Drop idle client keep-alives quickly so threads are free for new requests
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+
+def post_worker_init(worker):
+    # Async roadmap job workers run in each serving process; importing the app does not start them
+    from application import start_job_queue
+    start_job_queue()
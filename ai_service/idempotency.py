@@ -0,0 +1,331 @@
+"""
+Idempotency-Key support for the generation endpoints.
+The Node backend retries /generate-roadmap after timeouts and cold starts; without this
+each retry starts a fresh 30-60 s generation while the first one is still running.
+A request carrying an Idempotency-Key either runs (and records its response), attaches to
+the same key's in-flight run, or replays the stored response while it is within its TTL.
+
+Records live in process memory; with IDEMPOTENCY_DB set they are also written to SQLite
+so a retry routed to a different gunicorn worker still finds them.
+
+A retry attached to an in-flight run waits at most IDEMPOTENCY_WAIT_S, and never past its
+own request deadline, so it answers 409 while the backend (90 s timeout) still listens.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import deadline as _deadline
+
+TTL_S = float(os.environ.get("IDEMPOTENCY_TTL_S", 3600))
+WAIT_S = float(os.environ.get("IDEMPOTENCY_WAIT_S", 60))
+CLAIM_S = float(os.environ.get("IDEMPOTENCY_CLAIM_S", 180))  # an unfinished run's claim in IDEMPOTENCY_DB
+MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", 5000))
+DB_PATH = os.environ.get("IDEMPOTENCY_DB", "").strip()
+POLL_S = 0.2
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+
+
+def _wait_s(deadline):
+    """How long a retry may wait for the in-flight run: WAIT_S, capped by its request deadline."""
+    left = _deadline.remaining(deadline)
+    return WAIT_S if left is None else max(0.0, min(left, WAIT_S))
+
+
+class _Record:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.state = IN_FLIGHT
+        self.response = None  # (body bytes, status, headers dict)
+        self.created_at = time.time()
+        self.done = threading.Event()
+
+
+class _SqliteRecords:
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY, fingerprint TEXT, state TEXT,
+                    body BLOB, status INTEGER, headers TEXT, created_at REAL, expires_at REAL
+                )"""
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def claim(self, key, fingerprint):
+        """Insert an in-flight row unless a live one exists. Returns the existing row or None if claimed."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
+                row = conn.execute(
+                    "SELECT fingerprint, state, body, status, headers FROM idempotency_keys WHERE key = ?", (key,)
+                ).fetchone()
+                if row:
+                    return row
+                conn.execute(
+                    "INSERT INTO idempotency_keys (key, fingerprint, state, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, fingerprint, IN_FLIGHT, now, now + CLAIM_S),
+                )
+                return None
+            finally:
+                conn.execute("COMMIT")
+
+    def complete(self, key, body, status, headers):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE idempotency_keys SET state = ?, body = ?, status = ?, headers = ?, expires_at = ? WHERE key = ?",
+                (DONE, body, status, json.dumps(headers), now + TTL_S, key),
+            )
+
+    def release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM idempotency_keys WHERE key = ? AND state = ?", (key, IN_FLIGHT))
+
+    def get(self, key):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT fingerprint, state, body, status, headers FROM idempotency_keys WHERE key = ? AND expires_at >= ?",
+                (key, time.time()),
+            ).fetchone()
+
+
+class IdempotencyStore:
+    def __init__(self, db_path=DB_PATH):
+        self._records = {}
+        self._lock = threading.Lock()
+        self.stats = {"executed": 0, "replayed": 0, "attached": 0, "conflicts": 0, "mismatched": 0}
+        self._db = None
+        if db_path:
+            try:
+                self._db = _SqliteRecords(db_path)
+            except Exception as e:
+                print(f"[AI] Idempotency: SQLite store disabled ({e})")
+
+    def _purge(self, now):
+        expired = [k for k, r in self._records.items() if r.state == DONE and now - r.created_at > TTL_S]
+        for k in expired:
+            del self._records[k]
+        while len(self._records) > MAX_ENTRIES:
+            oldest = min(self._records, key=lambda k: self._records[k].created_at)
+            del self._records[oldest]
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def run(self, key, fingerprint, execute, deadline=None):
+        """
+        execute() -> (body, status, headers). Returns (body, status, headers, outcome) where
+        outcome is "executed", "replayed", "attached", "conflict" (still running elsewhere)
+        or "mismatch" (same key reused with a different request). deadline (absolute
+        time.monotonic()) bounds how long a call waits on another run of the same key.
+        """
+        rec, owner = self._claim(key, fingerprint)
+        if not owner:
+            early = self._existing(rec, fingerprint)
+            if early is not None:
+                return early
+            rec.done.wait(_wait_s(deadline))
+            return self._attached(rec)
+        try:
+            shared = self._run_shared(key, fingerprint, deadline) if self._db is not None else None
+            if shared is not None:
+                return self._adopt(key, rec, shared)
+            body, status, headers = execute()
+            return self._finish(key, rec, body, status, headers)
+        except Exception:
+            self._abandon(key)
+            raise
+        finally:
+            rec.done.set()
+
+    async def arun(self, key, fingerprint, execute, deadline=None):
+        """run() for the event loop: execute is a coroutine function; waiting holds no thread."""
+        rec, owner = self._claim(key, fingerprint)
+        if not owner:
+            early = self._existing(rec, fingerprint)
+            if early is not None:
+                return early
+            give_up = time.monotonic() + _wait_s(deadline)
+            while not rec.done.is_set() and time.monotonic() < give_up:
+                await asyncio.sleep(POLL_S)
+            return self._attached(rec)
+        try:
+            shared = None
+            if self._db is not None:
+                shared = await asyncio.to_thread(self._run_shared, key, fingerprint, deadline)
+            if shared is not None:
+                return self._adopt(key, rec, shared)
+            body, status, headers = await execute()
+            return self._finish(key, rec, body, status, headers)
+        except BaseException:  # includes cancellation when the client goes away
+            self._abandon(key)
+            raise
+        finally:
+            rec.done.set()
+
+    def _claim(self, key, fingerprint):
+        """(record, True) when this call now owns the key; otherwise the existing record."""
+        with self._lock:
+            self._purge(time.time())
+            rec = self._records.get(key)
+            if rec is not None:
+                return rec, False
+            rec = self._records[key] = _Record(fingerprint)
+            return rec, True
+
+    def _existing(self, rec, fingerprint):
+        """Outcome for a key already seen in this worker without waiting, or None to wait for it."""
+        if rec.fingerprint != fingerprint:
+            self._count("mismatched")
+            return None, None, None, "mismatch"
+        if rec.state == DONE:
+            self._count("replayed")
+            return (*rec.response, "replayed")
+        return None
+
+    def _attached(self, rec):
+        if rec.state == DONE:
+            self._count("attached")
+            return (*rec.response, "attached")
+        self._count("conflicts")
+        return None, None, None, "conflict"
+
+    def _adopt(self, key, rec, shared):
+        """Take another worker's outcome from the shared store."""
+        body, status, headers, outcome = shared
+        if outcome in ("replayed", "attached"):
+            rec.response, rec.state = (body, status, headers), DONE
+        else:
+            with self._lock:
+                self._records.pop(key, None)
+        return shared
+
+    def _finish(self, key, rec, body, status, headers):
+        self._count("executed")
+        if status < 500:
+            rec.response, rec.state = (body, status, headers), DONE
+            if self._db is not None:
+                self._safe(self._db.complete, key, body, status, headers)
+        else:
+            # Failed runs are not remembered so the client's retry can try again
+            self._abandon(key)
+        return body, status, headers, "executed"
+
+    def _abandon(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+        if self._db is not None:
+            self._safe(self._db.release, key)
+
+    def _run_shared(self, key, fingerprint, deadline=None):
+        """Check the cross-worker store; None means this worker claimed the key and should execute."""
+        try:
+            row = self._db.claim(key, fingerprint)
+        except Exception as e:
+            print(f"[AI] Idempotency store error: {e}")
+            return None
+        give_up = time.monotonic() + _wait_s(deadline)
+        while row is not None:
+            if row[0] != fingerprint:
+                self._count("mismatched")
+                return None, None, None, "mismatch"
+            if row[1] == DONE:
+                self._count("replayed")
+                return row[2], row[3], json.loads(row[4] or "{}"), "replayed"
+            if time.monotonic() >= give_up:
+                self._count("conflicts")
+                return None, None, None, "conflict"
+            time.sleep(POLL_S)
+            row = self._safe(self._db.get, key)
+            if row is None:
+                # The other worker failed or its claim expired: take over
+                return self._run_shared(key, fingerprint, deadline)
+        return None
+
+    @staticmethod
+    def _safe(fn, *args):
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"[AI] Idempotency store error: {e}")
+            return None
+
+    def describe(self):
+        with self._lock:
+            in_flight = sum(1 for r in self._records.values() if r.state == IN_FLIGHT)
+            return {"entries": len(self._records), "in_flight": in_flight, "ttl_s": TTL_S,
+                    "shared_store": self._db is not None, **self.stats}
+
+
+store = IdempotencyStore()
+
+REPLAY_HEADERS = ("Content-Type", "X-Cache")
+MAX_KEY_LENGTH = 255
+
+# Responses for outcomes that did not produce the endpoint's own: (status, body, headers)
+ERRORS = {
+    "too_long": (400, {"error": "Idempotency-Key too long"}, {}),
+    "mismatch": (422, {"error": "Idempotency-Key was already used with a different request body"}, {}),
+    "conflict": (409, {"error": "A request with this Idempotency-Key is still in progress"}, {"Retry-After": "5"}),
+}
+
+
+def fingerprint_of(body: bytes) -> str:
+    return hashlib.sha256(body or b"").hexdigest()
+
+
+def idempotent(view):
+    """
+    Flask view decorator: honour the Idempotency-Key request header.
+    The key is scoped to the endpoint and bound to a hash of the request body.
+    Streaming (text/event-stream) requests are passed through untouched.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from flask import current_app, jsonify, request
+
+        key = (request.headers.get("Idempotency-Key") or "").strip()
+        if not key or "text/event-stream" in (request.headers.get("Accept") or ""):
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            status, body, headers = ERRORS["too_long"]
+            return jsonify(body), status, headers
+        scoped = f"{request.path}:{key}"
+        fingerprint = fingerprint_of(request.get_data())
+
+        def execute():
+            resp = current_app.make_response(view(*args, **kwargs))
+            headers = {h: resp.headers[h] for h in REPLAY_HEADERS if h in resp.headers}
+            return resp.get_data(), resp.status_code, headers
+
+        body, status, headers, outcome = store.run(scoped, fingerprint, execute, _deadline.current())
+        if outcome in ERRORS:
+            status, body, headers = ERRORS[outcome]
+            return jsonify(body), status, headers
+        resp = current_app.response_class(body, status=status, headers=headers)
+        if outcome != "executed":
+            resp.headers["Idempotent-Replayed"] = "true"
+        return resp
+
+    return wrapper
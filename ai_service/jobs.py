@@ -0,0 +1,233 @@
+"""
+Asynchronous job queue for long generations (POST /generate-roadmap?async=1).
+A roadmap can take 30-90 s while gunicorn runs a single sync worker, so clients can
+instead get a job id immediately and poll GET /jobs/<id> (or receive a callback).
+
+Jobs are persisted in SQLite (JOBS_DB), so a worker restart does not lose queued work:
+jobs left "running" by a dead process go back to "queued" once they are stale. Workers claim the
+highest-priority queued job atomically, which also makes the table safe to share between
+gunicorn workers on one host.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+DB_PATH = os.environ.get("JOBS_DB") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.db")
+WORKERS = int(os.environ.get("JOBS_WORKERS", 2))
+MAX_QUEUED = int(os.environ.get("JOBS_MAX_QUEUED", 100))
+RETENTION_S = float(os.environ.get("JOBS_RETENTION_S", 24 * 3600))
+MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", 3))
+STALE_S = float(os.environ.get("JOBS_STALE_S", 600))  # longer than any single generation
+CALLBACK_BASE_URL = os.environ.get("JOB_CALLBACK_BASE_URL", "").strip().rstrip("/")
+POLL_S = 1.0
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, db_path=DB_PATH):
+        self.db_path = db_path
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._workers = []
+        self._schema_ready = False  # the table is created on first use, not when this module is imported
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            if not self._schema_ready:
+                self._init_db(conn)
+                self._schema_ready = True
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _init_db(conn):
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                priority INTEGER DEFAULT 0,
+                status TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                callback_url TEXT,
+                attempts INTEGER DEFAULT 0,
+                created_at REAL,
+                started_at REAL,
+                finished_at REAL
+            )"""
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs(status, priority DESC, created_at)")
+
+    def register(self, kind, handler):
+        """handler(params: dict) -> JSON-serializable result."""
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(WORKERS):
+                t = threading.Thread(target=self._run, daemon=True, name=f"job-worker-{i}")
+                t.start()
+                self._workers.append(t)
+
+    def submit(self, kind, params, priority=0, callback_url=None):
+        """Persist a queued job and return its id. Raises QueueFull past JOBS_MAX_QUEUED."""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if queued >= MAX_QUEUED:
+                    raise QueueFull(f"{queued} jobs already queued")
+                conn.execute(
+                    "INSERT INTO jobs (id, kind, params, priority, status, callback_url, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, kind, json.dumps(params), int(priority), QUEUED, callback_url, time.time()),
+                )
+            finally:
+                conn.execute("COMMIT")
+        self._wake.set()
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == QUEUED:
+                job["queue_position"] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (QUEUED, job["priority"], job["priority"], job["created_at"]),
+                ).fetchone()[0] + 1
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _recover_stale(self, conn, now):
+        """Re-queue jobs whose worker died mid-run (running for longer than JOBS_STALE_S)."""
+        cutoff = now - STALE_S
+        recovered = conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ? AND attempts < ?",
+            (QUEUED, RUNNING, cutoff, MAX_ATTEMPTS),
+        ).rowcount
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = 'interrupted too many times', finished_at = ? WHERE status = ? AND started_at < ?",
+            (FAILED, now, RUNNING, cutoff),
+        )
+        if recovered:
+            print(f"[AI] Jobs: re-queued {recovered} job(s) interrupted by a worker restart")
+
+    def _claim(self):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._recover_stale(conn, now)
+                row = conn.execute(
+                    "SELECT id, kind, params, callback_url, attempts FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, now - RETENTION_S))
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, now, row["id"]),
+                )
+                return {**dict(row), "attempts": row["attempts"] + 1}
+            finally:
+                conn.execute("COMMIT")
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def _requeue(self, job_id):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE id = ?", (QUEUED, job_id))
+
+    def _run(self):
+        while True:
+            try:
+                job = self._claim()
+            except Exception as e:
+                print(f"[AI] Jobs: claim failed: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(POLL_S)
+                self._wake.clear()
+                continue
+            handler = self._handlers.get(job["kind"])
+            try:
+                if handler is None:
+                    raise RuntimeError(f"no handler for job kind '{job['kind']}'")
+                result = handler(json.loads(job["params"]))
+                self._finish(job["id"], DONE, result=result)
+                status, error = DONE, None
+            except Exception as e:
+                retry_after = getattr(e, "retry_after_s", None)
+                if retry_after is not None and job["attempts"] < MAX_ATTEMPTS:
+                    # Providers are shedding load: put the job back rather than failing it
+                    self._requeue(job["id"])
+                    time.sleep(min(retry_after, 30))
+                    continue
+                print(f"[AI] Jobs: {job['id']} failed: {e}")
+                self._finish(job["id"], FAILED, error=str(e))
+                status, result, error = FAILED, None, str(e)
+            if job["callback_url"]:
+                self._callback(job["callback_url"], {"job_id": job["id"], "status": status, "result": result, "error": error})
+
+    @staticmethod
+    def _callback(url, body):
+        try:
+            import requests
+            requests.post(url, json=body, timeout=10)
+        except Exception as e:
+            print(f"[AI] Jobs: callback to {url} failed: {e}")
+
+    def describe(self):
+        with self._connect() as conn:
+            counts = {r[0]: r[1] for r in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+        return {"workers": len(self._workers), "max_queued": MAX_QUEUED, "counts": counts}
+
+
+def callback_url_for(value):
+    """
+    Resolve a client-supplied callback (absolute URL or path) against JOB_CALLBACK_BASE_URL.
+    Callbacks are only sent to the configured backend; returns None when not allowed.
+    """
+    if not value or not CALLBACK_BASE_URL:
+        return None
+    value = str(value).strip()
+    if value.startswith("/"):
+        return CALLBACK_BASE_URL + value
+    if value == CALLBACK_BASE_URL or value.startswith(CALLBACK_BASE_URL + "/"):
+        return value
+    return None
+
+
+job_queue = JobQueue()
@@ -0,0 +1,244 @@
+"""
+Asyncio LLM client with the same provider chain and return contract as
+llm_client.call_llm / generate_roadmap_via_ai, built on httpx.AsyncClient.
+A waiting provider call costs a coroutine instead of an OS thread, so one process can
+hold hundreds of them; asgi.py serves the LLM endpoints through this module.
+
+Shared with the blocking client: provider request shapes (llm_client.PROVIDER_API),
+router ranking and health, the per-provider in-flight cap and load shedding, and
+inflight() accounting, adaptive timeouts and the request deadline (a context variable,
+which tasks inherit). Identical prompts are coalesced within the event loop.
+Not available here: hedging, fan-out, cross-worker single-flight and the Gemini SDK fallback.
+"""
+import asyncio
+import itertools
+import os
+import time
+import weakref
+
+import httpx
+
+import deadline as _deadline
+import llm_client as _sync
+import llm_transport as _transport
+import singleflight as _singleflight
+from llm_client import _learner_context, _parse_units, _roadmap_output, _roadmap_prompt
+from llm_router import classify_status, router as _router
+
+SLOT_POLL_S = 0.02
+CLIENT_POOL_SIZE = int(os.environ.get("LLM_ASYNC_CLIENT_POOL_SIZE", 32))
+
+_clients = weakref.WeakKeyDictionary()  # event loop -> {provider: ([clients], round-robin iterator)}
+_flights = weakref.WeakKeyDictionary()  # event loop -> {prompt key: Future}
+
+
+def _client(provider: str) -> httpx.AsyncClient:
+    """
+    Pooled keep-alive client for a provider, one set per event loop. httpcore's pool scans
+    all its connections on every request, so the provider's slots are spread over several
+    small clients (CLIENT_POOL_SIZE connections each) picked round-robin.
+    """
+    per_loop = _clients.setdefault(asyncio.get_running_loop(), {})
+    shards = per_loop.get(provider)
+    if shards is None:
+        limit = _transport.limiter.limit(provider)
+        size = min(limit, CLIENT_POOL_SIZE)
+        clients = [
+            httpx.AsyncClient(limits=httpx.Limits(max_connections=size, max_keepalive_connections=size))
+            for _ in range(-(-limit // size))
+        ]
+        shards = per_loop[provider] = (clients, itertools.cycle(clients))
+    return next(shards[1])
+
+
+async def aclose():
+    """Close this event loop's provider clients (ASGI lifespan shutdown)."""
+    for clients, _ in _clients.pop(asyncio.get_running_loop(), {}).values():
+        for client in clients:
+            await client.aclose()
+
+
+async def _acquire_slot(provider: str, deadline: float | None = None) -> float:
+    """
+    Async counterpart of ProviderLimiter.acquire: wait up to LLM_QUEUE_BUDGET_S (less if the
+    request deadline is closer) without blocking the loop.
+    """
+    limiter = _transport.limiter
+    slot = limiter.try_acquire(provider)
+    if slot is not None:
+        return slot
+    budget_s = _sync._queue_budget_s(False, deadline)
+    estimate = limiter.estimated_wait_s(provider)
+    if estimate > budget_s:
+        limiter.reject(provider, estimate)
+    wait_until = time.monotonic() + budget_s
+    limiter.add_waiter(provider, 1)
+    try:
+        while time.monotonic() < wait_until:
+            await asyncio.sleep(SLOT_POLL_S)
+            slot = limiter.try_acquire(provider)
+            if slot is not None:
+                return slot
+    finally:
+        limiter.add_waiter(provider, -1)
+    limiter.reject(provider, max(estimate, budget_s))
+
+
+async def _call_provider(provider: str, prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None):
+    """Async counterpart of llm_client._call_rest. Returns (text, error_class)."""
+    build, extract, label = _sync.PROVIDER_API[provider]
+    error = "empty"
+    for req in build(prompt, api_key, output):
+        timeout = _sync._request_timeout(provider, req["timeout"], output, deadline)
+        if timeout is None:
+            break
+        start = time.monotonic()
+        try:
+            resp = await _client(provider).post(req["url"], headers=req["headers"], json=req["json"], timeout=timeout)
+        except httpx.HTTPError as e:
+            _transport.record_call(provider, (time.monotonic() - start) * 1000)
+            error = "timeout" if isinstance(e, httpx.TimeoutException) else "network"
+            print(f"{label} API error: {e}")
+            continue
+        _transport.record_call(provider, (time.monotonic() - start) * 1000, resp.status_code)
+        if resp.status_code != 200:
+            if _sync._structured_rejected(provider, output, resp.status_code, resp.text):
+                return await _call_provider(provider, prompt, api_key, output, deadline)
+            error = classify_status(resp.status_code) or "empty"
+            continue
+        try:
+            text = extract(resp.json())
+        except Exception as e:
+            print(f"{label} API error: {e}")
+            text = None
+        if text:
+            _sync._record_latency(provider, output, time.monotonic() - start)
+            return text, None
+        error = "empty"
+    return None, error
+
+
+async def _attempt(name: str, key: str, prompt: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """
+    Call one provider within its slot limit and report the outcome to the router.
+    Raises deadline.Exceeded when there is no time left to call at all.
+    """
+    if _deadline.exhausted(deadline):
+        raise _deadline.Exceeded()
+    slot = await _acquire_slot(name, deadline)
+    start = time.monotonic()
+    try:
+        with _sync._tracked_call(name):
+            out, error = await _call_provider(name, prompt, key, output, deadline)
+    finally:
+        _transport.limiter.release(name, slot)
+    elapsed_ms = (time.monotonic() - start) * 1000
+    if out:
+        _router.record_success(name, elapsed_ms)
+    else:
+        _router.record_failure(name, error, elapsed_ms)
+    return out
+
+
+async def call_llm_async(prompt: str, validate=None, prefer: str | None = None, output: dict | None = None) -> str | None:
+    """
+    Async call_llm: best available provider first (llm_router order), next on failure or when
+    validate(text) rejects the response. Returns raw text or None if all fail (or the request
+    deadline is up); raises llm_client.LLMOverloaded when every provider was at its in-flight cap.
+    """
+    deadline = _deadline.current()
+    if not _singleflight.ENABLED:
+        return await _call_llm_uncoalesced(prompt, validate, prefer, output, deadline)
+    loop = asyncio.get_running_loop()
+    flights = _flights.setdefault(loop, {})
+    key = _sync._flight_key(prompt, output)
+    pending = flights.get(key)
+    if pending is not None:
+        try:
+            return await asyncio.wait_for(asyncio.shield(pending), _singleflight.wait_s(deadline))
+        except asyncio.TimeoutError:
+            if _deadline.exhausted(deadline):
+                print("[AI] Request deadline reached waiting for an identical in-flight call")
+                return None
+            return await _call_llm_uncoalesced(prompt, validate, prefer, output, deadline)
+    future = flights[key] = loop.create_future()
+    try:
+        result = await _call_llm_uncoalesced(prompt, validate, prefer, output, deadline)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        else:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else was waiting
+        raise
+    finally:
+        flights.pop(key, None)
+
+
+async def _call_llm_uncoalesced(prompt: str, validate=None, prefer: str | None = None, output: dict | None = None, deadline: float | None = None) -> str | None:
+    providers = {name: key for name, _, key in _sync._configured_providers()}
+    order = _router.order(list(providers.keys()))
+    if prefer in order:
+        order.remove(prefer)
+        order.insert(0, prefer)
+    shed = []
+    untried = 0
+    try:
+        for i, name in enumerate(order):
+            untried = i + 1
+            try:
+                out = await _attempt(name, providers[name], prompt, output, deadline)
+            except _transport.Saturated as e:
+                _router.release([name])
+                shed.append(e)
+                continue
+            except _deadline.Exceeded:
+                print(f"[AI] Request deadline reached; skipping {', '.join(order[i:])}")
+                untried = i
+                return None
+            if out and (validate is None or validate(out)):
+                return out
+        _sync._raise_if_all_shed(shed, len(order))
+        return None
+    finally:
+        # Probe slots claimed by order() for providers never called (also on cancellation)
+        _router.release(order[untried:])
+
+
+async def generate_roadmap_via_ai_async(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 3) -> dict | None:
+    """Async generate_roadmap_via_ai (single call, no fan-out). Returns {'units': [...]} or None."""
+    args = (domain, proficiency_level, professional_goal, current_status, start_unit, count)
+    prompt = _roadmap_prompt(*args, compact=True)
+    output = _roadmap_output(count, full_prompt=_roadmap_prompt(*args))
+    raw = await call_llm_async(prompt, validate=lambda text: _parse_units(text, quiet=True) is not None, output=output)
+    if not raw:
+        return None
+    units = _parse_units(raw)
+    if not units:
+        return None
+    context = _learner_context(domain, proficiency_level, professional_goal, current_status, start_unit)
+    return {"units": await repair_units_async(units, domain, context, start_unit, count)}
+
+
+async def repair_units_async(units: list, domain: str, context: str, start_unit: int, count: int) -> list:
+    """Async llm_client.repair_units: the follow-up calls run concurrently on the event loop."""
+    if not _sync.REPAIR_ENABLED or _deadline.exhausted(_deadline.current()):
+        return units
+    by_number, loose, calls = _sync._repair_plan(units, domain, context, start_unit, count)
+    _sync._count_repair(calls)
+    if not calls:
+        return units
+    print(f"[AI] Repairing roadmap for '{domain}': {len(calls)} follow-up call(s)")
+    results = await asyncio.gather(
+        *(call_llm_async(prompt, validate=_sync._repair_validate(kind), output=output) for kind, _, prompt, output in calls),
+        return_exceptions=True,
+    )
+    results = [None if isinstance(r, Exception) else r for r in results]
+    return _sync._repair_merge(by_number, loose, calls, results, start_unit, count)
+
+
+async def generate_next_chapters_via_ai_async(domain: str, last_unit_number: int, count: int = 2) -> dict | None:
+    """Async generate_next_chapters_via_ai. Returns {'units': [...]} or None."""
+    return await generate_roadmap_via_ai_async(domain, start_unit=last_unit_number + 1, count=count)
@@ -5,99 +5,344 @@ Uses: Hugging Face -> Gemini -> Cohere -> Claude -> Groq -> OpenAI (first availa
 import os
 import json
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+import deadline as _deadline
+import llm_transport as _transport
+import singleflight as _singleflight
+from llm_json import UnitStreamParser, extract_json, parse_json
+from llm_router import router as _router
+from stats import percentile
 
 def _extract_json(text):
     """Extract JSON from LLM response (may be wrapped in markdown code block)."""
-    text = (text or "").strip()
-    # Try to find ```json ... ``` block
-    match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-    if match:
-        text = match.group(1).strip()
-    # Fallback: find first { ... } block
-    start = text.find("{")
-    if start >= 0:
-        depth = 0
-        for i in range(start, len(text)):
-            if text[i] == "{":
-                depth += 1
-            elif text[i] == "}":
-                depth -= 1
-                if depth == 0:
-                    text = text[start : i + 1]
-                    break
-    return text
+    return extract_json(text)
 
 
-def _call_huggingface(prompt: str, api_key: str) -> str | None:
-    """Call Hugging Face Inference API (OpenAI-compatible, e.g. Qwen)."""
+def _parse_units(raw: str, quiet: bool = False) -> list | None:
+    """Parse the units list out of a roadmap LLM response (None if missing or invalid JSON)."""
     try:
-        import requests
-        model = os.environ.get("HF_MODEL", "Qwen/Qwen3-Coder-Next:novita")
-        resp = requests.post(
-            "https://router.huggingface.co/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-                "max_tokens": 8192,
-            },
-            timeout=90,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            msg = data.get("choices", [{}])[0].get("message", {})
-            return msg.get("content")
+        data = parse_json(raw)
+        units = data.get("units") or data.get("roadmap", {}).get("units") or []
+        return units or None
+    except (json.JSONDecodeError, AttributeError) as e:
+        if not quiet:
+            print(f"LLM JSON parse error: {e}")
         return None
-    except Exception as e:
-        print(f"Hugging Face API error: {e}")
+
+
+# Structured output: callers that want JSON pass output={"name", "schema", "max_tokens"} and each
+# provider asks for it natively (response_format / responseSchema / a forced Anthropic tool).
+# A provider that rejects the structured request (400/422) is retried and remembered as plain-only.
+DEFAULT_MAX_TOKENS = 8192
+# A provider that says it cannot do structured output is asked for plain JSON for this long, then re-probed
+STRUCTURED_RETRY_S = float(os.environ.get("LLM_STRUCTURED_RETRY_S", 3600))
+_structured_unsupported = {}  # provider -> time.monotonic() until which structured output is off
+# Error bodies that blame the structured-output request itself, not the prompt
+_STRUCTURED_ERROR = re.compile(r"response_?format|response_?schema|response_mime_type|json_schema|tool_choice|"
+                               r"\bschema\b|structured output", re.IGNORECASE)
+
+
+def _max_tokens(output: dict | None) -> int:
+    return (output or {}).get("max_tokens") or DEFAULT_MAX_TOKENS
+
+
+def _structured(provider: str, output: dict | None) -> dict | None:
+    """The output spec if this provider should be asked for structured output, else None."""
+    if not (output and output.get("schema")):
         return None
+    until = _structured_unsupported.get(provider)
+    if until is not None:
+        if time.monotonic() < until:
+            return None
+        _structured_unsupported.pop(provider, None)
+    return output
 
 
-def _call_gemini(prompt: str, api_key: str) -> str | None:
-    """Call Google Gemini API. Tries REST API first (X-goog-api-key), then SDK."""
-    for model_name in ("gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.0-pro"):
+def _prompt_for(prompt: str, output: dict | None, schema_sent: bool) -> str:
+    """
+    The prompt to send: output["full_prompt"] (the original with its worked JSON example) when
+    the request will not carry the schema, since the compact prompt leaves the format to it.
+    """
+    if output and output.get("full_prompt") and not schema_sent:
+        return output["full_prompt"]
+    return prompt
+
+
+def _structured_rejected(provider: str, output: dict | None, status_code: int, body: str = "") -> bool:
+    """
+    True if a 400/422 says the provider cannot handle the structured-output request (the call
+    should be retried plain); structured output is then off for it for LLM_STRUCTURED_RETRY_S.
+    Other validation errors are the prompt's problem and leave it on.
+    """
+    if status_code not in (400, 422) or not _structured(provider, output):
+        return False
+    if not _STRUCTURED_ERROR.search(body or ""):
+        return False
+    print(f"[AI] {provider} rejected structured output (HTTP {status_code}); "
+          f"using plain JSON prompts for {STRUCTURED_RETRY_S:.0f}s")
+    _structured_unsupported[provider] = time.monotonic() + STRUCTURED_RETRY_S
+    return True
+
+
+# Each provider is described by the HTTP request(s) to try and how to read the text out of
+# a 200 response, so the blocking client below and llm_async share one definition.
+def _chat_completions_request(url: str, model: str, prompt: str, api_key: str, timeout: float, output: dict | None = None, response_format: dict | None = None) -> dict:
+    body = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "temperature": 0.8,
+        "max_tokens": _max_tokens(output),
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return {
+        "url": url,
+        "headers": {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        "json": body,
+        "timeout": timeout,
+    }
+
+
+def _json_schema_format(output: dict | None) -> dict | None:
+    """OpenAI-style response_format constrained to the output schema."""
+    if not output:
+        return None
+    return {"type": "json_schema", "json_schema": {"name": output["name"], "schema": output["schema"]}}
+
+
+def _json_object_format(output: dict | None) -> dict | None:
+    """JSON mode without a schema, for models that do not take one (gpt-3.5-turbo, Groq Llama)."""
+    return {"type": "json_object"} if output else None
+
+
+def _chat_completions_text(data: dict) -> str | None:
+    msg = data.get("choices", [{}])[0].get("message", {})
+    return msg.get("content")
+
+
+def _huggingface_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """Hugging Face Inference API (OpenAI-compatible, e.g. Qwen)."""
+    model = os.environ.get("HF_MODEL", "Qwen/Qwen3-Coder-Next:novita")
+    fmt = _json_schema_format(_structured("huggingface", output))
+    prompt = _prompt_for(prompt, output, fmt is not None)
+    return [_chat_completions_request(f"{_transport.origin('huggingface')}/v1/chat/completions", model, prompt, api_key, 90, output, fmt)]
+
+
+def _gemini_schema(schema: dict) -> dict:
+    """JSON schema -> Gemini responseSchema (OpenAPI subset: upper-case types, no additionalProperties)."""
+    out = {}
+    for key, value in schema.items():
+        if key == "type":
+            out[key] = value.upper()
+        elif key == "properties":
+            out[key] = {name: _gemini_schema(sub) for name, sub in value.items()}
+        elif key == "items":
+            out[key] = _gemini_schema(value)
+        elif key in ("required", "enum", "minItems", "maxItems", "description"):
+            out[key] = value
+    return out
+
+
+def _gemini_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """Google Gemini REST API (X-goog-api-key), one request per model to try."""
+    config = {"temperature": 0.8, "maxOutputTokens": _max_tokens(output)}
+    structured = _structured("gemini", output)
+    if structured:
+        config.update({"responseMimeType": "application/json", "responseSchema": _gemini_schema(structured["schema"])})
+    prompt = _prompt_for(prompt, output, structured is not None)
+    return [
+        {
+            "url": f"{_transport.origin('gemini')}/v1beta/models/{model_name}:generateContent",
+            "headers": {"Content-Type": "application/json", "X-goog-api-key": api_key},
+            "json": {
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": config,
+            },
+            "timeout": 60,
+        }
+        for model_name in ("gemini-2.0-flash", "gemini-1.5-flash", "gemini-1.0-pro")
+    ]
+
+
+def _gemini_text(data: dict) -> str | None:
+    candidates = data.get("candidates", [])
+    if candidates:
+        parts = candidates[0].get("content", {}).get("parts", [])
+        if parts:
+            return parts[0].get("text")
+    return None
+
+
+def _cohere_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """Cohere Chat API v2."""
+    model = os.environ.get("COHERE_MODEL", "command-r-plus")
+    structured = _structured("cohere", output)
+    fmt = {"type": "json_object", "json_schema": structured["schema"]} if structured else None
+    prompt = _prompt_for(prompt, output, structured is not None)
+    return [_chat_completions_request(f"{_transport.origin('cohere')}/v2/chat", model, prompt, api_key, 90, output, fmt)]
+
+
+def _cohere_text(data: dict) -> str | None:
+    msg = data.get("message", {})
+    if isinstance(msg, dict):
+        text = msg.get("text") or msg.get("content")
+        if isinstance(text, str) and text:
+            return text
+        for block in msg.get("content", []) or []:
+            if isinstance(block, dict) and block.get("text"):
+                return block["text"]
+            if isinstance(block, str):
+                return block
+    return str(msg) if msg else None
+
+
+def _claude_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """Anthropic Claude Messages API; structured output is a forced tool call whose input is the JSON."""
+    model = os.environ.get("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
+    structured = _structured("claude", output)
+    body = {
+        "model": model,
+        "max_tokens": _max_tokens(output),
+        "messages": [{"role": "user", "content": _prompt_for(prompt, output, structured is not None)}],
+        "temperature": 0.8,
+    }
+    if structured:
+        body["tools"] = [{"name": structured["name"], "description": "Return the requested JSON.", "input_schema": structured["schema"]}]
+        body["tool_choice"] = {"type": "tool", "name": structured["name"]}
+    return [{
+        "url": f"{_transport.origin('claude')}/v1/messages",
+        "headers": {"x-api-key": api_key, "anthropic-version": "2023-06-01", "Content-Type": "application/json"},
+        "json": body,
+        "timeout": 90,
+    }]
+
+
+def _claude_text(data: dict) -> str | None:
+    for block in data.get("content", []):
+        if block.get("type") == "tool_use":
+            return json.dumps(block.get("input"))
+        if block.get("type") == "text":
+            return block.get("text")
+    return None
+
+
+def _groq_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """Groq API via REST (avoids groq package compatibility issues). JSON mode only, so the full prompt."""
+    fmt = _json_object_format(_structured("groq", output))
+    prompt = _prompt_for(prompt, output, False)
+    return [_chat_completions_request(f"{_transport.origin('groq')}/openai/v1/chat/completions", "llama-3.3-70b-versatile", prompt, api_key, 60, output, fmt)]
+
+
+def _openai_requests(prompt: str, api_key: str, output: dict | None = None) -> list:
+    """OpenAI API. JSON mode only, so the full prompt."""
+    fmt = _json_object_format(_structured("openai", output))
+    prompt = _prompt_for(prompt, output, False)
+    return [_chat_completions_request(f"{_transport.origin('openai')}/v1/chat/completions", "gpt-3.5-turbo", prompt, api_key, 60, output, fmt)]
+
+
+# provider -> (build requests, extract text from a 200 response, label for logs)
+PROVIDER_API = {
+    "huggingface": (_huggingface_requests, _chat_completions_text, "Hugging Face"),
+    "gemini": (_gemini_requests, _gemini_text, "Gemini REST"),
+    "cohere": (_cohere_requests, _cohere_text, "Cohere"),
+    "claude": (_claude_requests, _claude_text, "Claude"),
+    "groq": (_groq_requests, _chat_completions_text, "Groq"),
+    "openai": (_openai_requests, _chat_completions_text, "OpenAI"),
+}
+
+
+# Per-request timeouts: each provider's static timeout, tightened to LLM_TIMEOUT_P95_MULTIPLIER x
+# the p95 latency observed for the same kind of call (per 1k max_tokens, so short and long
+# generations compare), never below LLM_TIMEOUT_MIN_S, then capped by the request deadline.
+TIMEOUT_P95_MULTIPLIER = float(os.environ.get("LLM_TIMEOUT_P95_MULTIPLIER", 2.0))
+TIMEOUT_MIN_S = float(os.environ.get("LLM_TIMEOUT_MIN_S", 10))
+TIMEOUT_MIN_SAMPLES = 5
+
+_latency_samples = {}  # (provider, output name or "text") -> deque of seconds per 1k max_tokens
+
+
+def _latency_key(provider: str, output: dict | None) -> tuple:
+    return provider, (output or {}).get("name") or "text"
+
+
+def _record_latency(provider: str, output: dict | None, elapsed_s: float):
+    with _hedge_lock:
+        samples = _latency_samples.setdefault(_latency_key(provider, output), deque(maxlen=50))
+        samples.append(elapsed_s * 1000.0 / _max_tokens(output))
+
+
+def _request_timeout(provider: str, static_s: float, output: dict | None, deadline: float | None) -> float | None:
+    """Timeout for one provider request, or None when the deadline leaves too little time to start it."""
+    with _hedge_lock:
+        samples = list(_latency_samples.get(_latency_key(provider, output)) or ())
+    timeout = static_s
+    if len(samples) >= TIMEOUT_MIN_SAMPLES:
+        p95 = percentile(samples, 0.95, None)
+        timeout = min(static_s, max(TIMEOUT_MIN_S, TIMEOUT_P95_MULTIPLIER * p95 * _max_tokens(output) / 1000.0))
+    if _deadline.exhausted(deadline):
+        return None
+    left = _deadline.remaining(deadline)
+    return timeout if left is None else min(timeout, left)
+
+
+def timeout_snapshot() -> dict:
+    """Adaptive timeout per provider and call kind at DEFAULT_MAX_TOKENS (no deadline), for diagnostics."""
+    with _hedge_lock:
+        keys = list(_latency_samples)
+    return {f"{p}:{kind}": round(_request_timeout(p, 90, None if kind == "text" else {"name": kind}, None), 1) for p, kind in keys}
+
+
+def _call_rest(provider: str, prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """Try the provider's request(s) in order over the pooled transport; first text wins."""
+    build, extract, label = PROVIDER_API[provider]
+    for req in build(prompt, api_key, output):
+        timeout = _request_timeout(provider, req["timeout"], output, deadline)
+        if timeout is None:
+            break
         try:
-            import requests
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
-            resp = requests.post(
-                url,
-                headers={
-                    "Content-Type": "application/json",
-                    "X-goog-api-key": api_key,
-                },
-                json={
-                    "contents": [{"parts": [{"text": prompt}]}],
-                    "generationConfig": {"temperature": 0.8, "maxOutputTokens": 8192},
-                },
-                timeout=60,
-            )
+            start = time.monotonic()
+            resp = _transport.post(provider, req["url"], headers=req["headers"], json=req["json"], timeout=timeout)
             if resp.status_code == 200:
-                data = resp.json()
-                candidates = data.get("candidates", [])
-                if candidates:
-                    content = candidates[0].get("content", {})
-                    parts = content.get("parts", [])
-                    if parts:
-                        return parts[0].get("text")
+                text = extract(resp.json())
+                if text:
+                    _record_latency(provider, output, time.monotonic() - start)
+                    return text
+            elif _structured_rejected(provider, output, resp.status_code, resp.text):
+                return _call_rest(provider, prompt, api_key, output, deadline)
         except Exception as e:
-            print(f"Gemini REST ({model_name}) error: {e}")
-            continue
+            print(f"{label} API error: {e}")
+    return None
+
+
+def _call_huggingface(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    return _call_rest("huggingface", prompt, api_key, output, deadline)
+
+
+def _call_gemini(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """Call Google Gemini API. Tries REST API first (X-goog-api-key), then SDK."""
+    text = _call_rest("gemini", prompt, api_key, output, deadline)
+    if text:
+        return text
 
     # Fallback: SDK
     for model_name in ("gemini-2.0-flash", "gemini-1.5-flash-8b", "gemini-pro"):
+        if _deadline.exhausted(deadline):
+            return None
         try:
             import google.generativeai as genai
             genai.configure(api_key=api_key)
             model = genai.GenerativeModel(model_name)
             response = model.generate_content(
-                prompt,
+                _prompt_for(prompt, output, False),
                 generation_config=genai.types.GenerationConfig(
                     temperature=0.8,
-                    max_output_tokens=8192,
+                    max_output_tokens=_max_tokens(output),
+                    response_mime_type="application/json" if output else None,
                 ),
             )
             return response.text if response else None
@@ -107,177 +352,557 @@ def _call_gemini(prompt: str, api_key: str) -> str | None:
     return None
 
 
-def _call_cohere(prompt: str, api_key: str) -> str | None:
-    """Call Cohere Chat API v2."""
+def _call_cohere(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    return _call_rest("cohere", prompt, api_key, output, deadline)
+
+
+def _call_claude(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    return _call_rest("claude", prompt, api_key, output, deadline)
+
+
+def _call_groq(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    return _call_rest("groq", prompt, api_key, output, deadline)
+
+
+def _call_openai(prompt: str, api_key: str, output: dict | None = None, deadline: float | None = None) -> str | None:
+    return _call_rest("openai", prompt, api_key, output, deadline)
+
+
+def _configured_providers():
+    """Return [(provider_name, call_fn, api_key)] for providers with a key set, in chain order."""
+    chain = [
+        ("huggingface", _call_huggingface, os.environ.get("HF_TOKEN", os.environ.get("HF_API_KEY", ""))),
+        ("gemini", _call_gemini, os.environ.get("GEMINI_API_KEY", "")),
+        ("cohere", _call_cohere, os.environ.get("COHERE_API_KEY", "")),
+        ("claude", _call_claude, os.environ.get("ANTHROPIC_API_KEY", "")),
+        ("groq", _call_groq, os.environ.get("GROQ_API_KEY", "")),
+        ("openai", _call_openai, os.environ.get("OPENAI_API_KEY", "")),
+    ]
+    return [(name, fn, key.strip()) for name, fn, key in chain if key and key.strip()]
+
+
+def configured_provider_names() -> list:
+    """Names of providers that have an API key configured (e.g. for connection prewarming)."""
+    return [name for name, _, _ in _configured_providers()]
+
+
+HEDGE_ENABLED = os.environ.get("LLM_HEDGE", "0") == "1"
+HEDGE_DELAY_MS = float(os.environ.get("LLM_HEDGE_DELAY_MS", 2000))
+HEDGE_MAX_PARALLEL = int(os.environ.get("LLM_HEDGE_MAX_PARALLEL", 2))
+
+_hedge_pool = None
+_hedge_lock = threading.Lock()
+_hedge_stats = {"requests": 0, "hedges_fired": 0, "wins": {}, "win_position": {}, "primary_latency_ms": deque(maxlen=200)}
+
+
+_call_ctx = threading.local()
+_inflight = {}  # provider -> {"total": n, "background": n}
+_background_starts = {}  # provider -> deque of monotonic start times (last minute)
+
+
+@contextmanager
+def background_calls(allow=None):
+    """
+    Mark LLM calls made on this thread as background work (e.g. speculative prefetch).
+    allow(provider_name) -> bool, if given, filters which providers may be used.
+    """
+    prev = (getattr(_call_ctx, "background", False), getattr(_call_ctx, "allow", None))
+    _call_ctx.background, _call_ctx.allow = True, allow
     try:
-        import requests
-        model = os.environ.get("COHERE_MODEL", "command-r-plus")
-        resp = requests.post(
-            "https://api.cohere.com/v2/chat",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-                "max_tokens": 8192,
-            },
-            timeout=90,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            msg = data.get("message", {})
-            if isinstance(msg, dict):
-                text = msg.get("text") or msg.get("content")
-                if text:
-                    return text
-                for block in msg.get("content", []) or []:
-                    if isinstance(block, dict) and block.get("text"):
-                        return block["text"]
-                    if isinstance(block, str):
-                        return block
-            return str(msg) if msg else None
-        return None
-    except Exception as e:
-        print(f"Cohere API error: {e}")
-        return None
+        yield
+    finally:
+        _call_ctx.background, _call_ctx.allow = prev
+
+
+def inflight() -> dict:
+    """Current in-flight provider calls (interactive vs background) and background calls started in the last minute."""
+    now = time.monotonic()
+    with _hedge_lock:
+        out = {}
+        for name, c in _inflight.items():
+            starts = _background_starts.get(name) or ()
+            out[name] = {
+                "interactive": c["total"] - c["background"],
+                "background": c["background"],
+                "background_last_min": sum(1 for t in starts if now - t <= 60),
+            }
+        return out
 
 
-def _call_claude(prompt: str, api_key: str) -> str | None:
-    """Call Anthropic Claude Messages API."""
+class LLMOverloaded(Exception):
+    """Every usable provider is at its in-flight cap; callers should shed the request (503)."""
+
+    def __init__(self, retry_after_s: float):
+        super().__init__("all LLM providers are saturated")
+        self.retry_after_s = retry_after_s
+
+
+def _raise_if_all_shed(shed: list, tried: int):
+    if shed and len(shed) == tried:
+        raise LLMOverloaded(min(s.retry_after_s for s in shed))
+
+
+def _attempt(name: str, fn, key: str, prompt: str, background: bool = False, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """
+    Call one provider within its outbound slot limit and report the outcome to the router.
+    Raises llm_transport.Saturated (without counting a provider failure) when no slot frees
+    up within LLM_QUEUE_BUDGET_S (or the time left before deadline); background calls never
+    queue for a slot. Raises deadline.Exceeded when there is no time left to call at all.
+    """
+    if _deadline.exhausted(deadline):
+        raise _deadline.Exceeded()
+    slot = _transport.limiter.acquire(name, _queue_budget_s(background, deadline))
     try:
-        import requests
-        model = os.environ.get("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022")
-        resp = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers={
-                "x-api-key": api_key,
-                "anthropic-version": "2023-06-01",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": model,
-                "max_tokens": 8192,
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-            },
-            timeout=90,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            for block in data.get("content", []):
-                if block.get("type") == "text":
-                    return block.get("text")
-        return None
-    except Exception as e:
-        print(f"Claude API error: {e}")
-        return None
+        return _attempt_unlimited(name, fn, key, prompt, background, output, deadline)
+    finally:
+        _transport.limiter.release(name, slot)
+
+
+def _queue_budget_s(background: bool, deadline: float | None) -> float:
+    """How long a call may wait for a provider slot: none for background work, never past the deadline."""
+    if background:
+        return 0
+    left = _deadline.remaining(deadline)
+    return _transport.QUEUE_BUDGET_S if left is None else max(0.0, min(_transport.QUEUE_BUDGET_S, left - _deadline.MIN_CALL_S))
 
 
-def _call_groq(prompt: str, api_key: str) -> str | None:
-    """Call Groq API via REST (avoids groq package compatibility issues)."""
+@contextmanager
+def _tracked_call(name: str, background: bool = False):
+    """Count a provider call in inflight() for its duration."""
+    with _hedge_lock:
+        c = _inflight.setdefault(name, {"total": 0, "background": 0})
+        c["total"] += 1
+        c["background"] += int(background)
+        if background:
+            starts = _background_starts.setdefault(name, deque(maxlen=1000))
+            starts.append(time.monotonic())
     try:
-        import requests
-        resp = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "llama-3.3-70b-versatile",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-                "max_tokens": 8192,
-            },
-            timeout=60,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            msg = data.get("choices", [{}])[0].get("message", {})
-            return msg.get("content")
-        return None
-    except Exception as e:
-        print(f"Groq API error: {e}")
-        return None
+        yield
+    finally:
+        with _hedge_lock:
+            c["total"] -= 1
+            c["background"] -= int(background)
 
 
-def _call_openai(prompt: str, api_key: str) -> str | None:
-    """Call OpenAI API."""
+def _attempt_unlimited(name: str, fn, key: str, prompt: str, background: bool, output: dict | None = None, deadline: float | None = None) -> str | None:
+    _transport.clear_last_error()
+    start = time.monotonic()
+    with _tracked_call(name, background):
+        out = fn(prompt, key, output, deadline)
+    elapsed_ms = (time.monotonic() - start) * 1000
+    if out:
+        _router.record_success(name, elapsed_ms)
+    else:
+        _router.record_failure(name, _transport.last_error() or "empty", elapsed_ms)
+    return out
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    if _hedge_pool is None:
+        with _hedge_lock:
+            if _hedge_pool is None:
+                workers = int(os.environ.get("LLM_HEDGE_WORKERS", 8))
+                _hedge_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-hedge")
+    return _hedge_pool
+
+
+def _record_hedge(winner: str | None, position: int, fired: int, latency_ms: float):
+    with _hedge_lock:
+        _hedge_stats["requests"] += 1
+        _hedge_stats["hedges_fired"] += max(0, fired - 1)
+        if winner:
+            _hedge_stats["wins"][winner] = _hedge_stats["wins"].get(winner, 0) + 1
+            _hedge_stats["win_position"][position] = _hedge_stats["win_position"].get(position, 0) + 1
+            if position == 0:
+                _hedge_stats["primary_latency_ms"].append(latency_ms)
+
+
+def hedge_stats() -> dict:
+    """Which providers win hedged races, and primary-win latency percentiles for tuning LLM_HEDGE_DELAY_MS."""
+    with _hedge_lock:
+        lat = list(_hedge_stats["primary_latency_ms"])
+        return {
+            "enabled": HEDGE_ENABLED,
+            "delay_ms": HEDGE_DELAY_MS,
+            "requests": _hedge_stats["requests"],
+            "hedges_fired": _hedge_stats["hedges_fired"],
+            "wins": dict(_hedge_stats["wins"]),
+            "wins_by_position": {str(k): v for k, v in _hedge_stats["win_position"].items()},
+            "primary_win_p50_ms": percentile(lat, 0.50, 1),
+            "primary_win_p95_ms": percentile(lat, 0.95, 1),
+        }
+
+
+def _call_llm_hedged(prompt: str, providers: dict, order: list, validate, delay_ms: float, background: bool = False, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """
+    Race providers: start the best one, then start the next after delay_ms (or as soon as
+    an attempt fails), keeping at most HEDGE_MAX_PARALLEL in flight. The first response that
+    passes validate() wins; slower in-flight calls are left to finish in the background.
+    No new attempt starts once the deadline is (nearly) up, and the race is abandoned at it.
+    """
+    pool = _get_hedge_pool()
+    start = time.monotonic()
+    pending = {}
+    next_idx = 0
+    launched = 0
+
+    def launch():
+        nonlocal next_idx, launched
+        name = order[next_idx]
+        fn, key = providers[name]
+        pending[pool.submit(_attempt, name, fn, key, prompt, background, output, deadline)] = (name, next_idx)
+        next_idx += 1
+        launched += 1
+
+    shed = []
+    launch()
     try:
-        import requests
-        resp = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-            },
-            json={
-                "model": "gpt-3.5-turbo",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.8,
-                "max_tokens": 8192,
-            },
-            timeout=60,
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            msg = data.get("choices", [{}])[0].get("message", {})
-            return msg.get("content")
+        while pending:
+            can_hedge = next_idx < len(order) and len(pending) < HEDGE_MAX_PARALLEL and not _deadline.exhausted(deadline)
+            timeout = delay_ms / 1000.0 if can_hedge else None
+            left = _deadline.remaining(deadline)
+            if left is not None:
+                timeout = max(0.0, left if timeout is None else min(timeout, left))
+            done, _ = wait(list(pending.keys()), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if not can_hedge:
+                    print(f"[AI] Request deadline reached with {len(pending)} hedged call(s) in flight")
+                    break
+                launch()
+                continue
+            for fut in done:
+                name, position = pending.pop(fut)
+                try:
+                    out = fut.result()
+                except _transport.Saturated as e:
+                    _router.release([name])
+                    shed.append(e)
+                    out = None
+                except _deadline.Exceeded:
+                    _router.release([name])
+                    out = None
+                except Exception as e:
+                    print(f"[AI] Hedged call to {name} raised: {e}")
+                    out = None
+                if out and (validate is None or validate(out)):
+                    elapsed_ms = (time.monotonic() - start) * 1000
+                    _record_hedge(name, position, launched, elapsed_ms)
+                    return out
+            # Every completed attempt failed: replace it with the next provider right away
+            if next_idx < len(order) and len(pending) < HEDGE_MAX_PARALLEL and not _deadline.exhausted(deadline):
+                launch()
+        _record_hedge(None, -1, launched, (time.monotonic() - start) * 1000)
+        _raise_if_all_shed(shed, launched)
         return None
-    except Exception as e:
-        print(f"OpenAI API error: {e}")
+    finally:
+        _router.release(order[next_idx:])
+
+
+def call_llm(prompt: str, hedge: bool | None = None, validate=None, hedge_delay_ms: float | None = None, prefer: str | None = None, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """
+    Call the best available LLM (see _call_llm_uncoalesced). Identical prompts already in
+    flight are coalesced: later callers wait for the first call's result (singleflight).
+    deadline defaults to the current request's (deadline.current()).
+    """
+    if deadline is None:
+        deadline = _deadline.current()
+
+    def run():
+        return _call_llm_uncoalesced(prompt, hedge, validate, hedge_delay_ms, prefer, output, deadline)
+
+    if not _singleflight.ENABLED:
+        return run()
+    background = getattr(_call_ctx, "background", False)
+    if not background:
+        # A prefetch already generating this prompt is as good as a fresh call
+        shared = _singleflight.flight.attach(_flight_key(prompt, output, background=True), deadline)
+        if shared:
+            return shared
+    try:
+        key = _flight_key(prompt, output, background)
+        return _singleflight.flight.do(key, run, deadline)
+    except _deadline.Exceeded:
+        print("[AI] Request deadline reached waiting for an identical in-flight call")
         return None
 
 
-def call_llm(prompt: str) -> str | None:
+def _flight_key(prompt: str, output: dict | None, background: bool = False) -> str:
     """
-    Call first available LLM: Hugging Face -> Gemini -> Cohere -> Claude -> Groq -> OpenAI.
-    Returns raw text response or None if all fail.
+    Single-flight key: the prompt, plus the structured output requested for it. Background
+    calls get their own keys: they can be shed (LLMOverloaded) or limited to some providers,
+    which an interactive request must not inherit. call_llm still lets an interactive call
+    attach to a background flight, falling back to its own when that produces nothing;
+    background calls never wait on interactive ones.
     """
-    hf_token = os.environ.get("HF_TOKEN", os.environ.get("HF_API_KEY", "")).strip()
-    gemini_key = os.environ.get("GEMINI_API_KEY", "").strip()
-    cohere_key = os.environ.get("COHERE_API_KEY", "").strip()
-    anthropic_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-    groq_key = os.environ.get("GROQ_API_KEY", "").strip()
-    openai_key = os.environ.get("OPENAI_API_KEY", "").strip()
+    if output:
+        prompt = f"{output['name']}\n{prompt}"
+    return _singleflight.prompt_key(f"background\n{prompt}" if background else prompt)
 
-    if hf_token:
-        out = _call_huggingface(prompt, hf_token)
-        if out:
-            return out
-    if gemini_key:
-        out = _call_gemini(prompt, gemini_key)
-        if out:
-            return out
-    if cohere_key:
-        out = _call_cohere(prompt, cohere_key)
-        if out:
-            return out
-    if anthropic_key:
-        out = _call_claude(prompt, anthropic_key)
-        if out:
-            return out
-    if groq_key:
-        out = _call_groq(prompt, groq_key)
-        if out:
-            return out
-    if openai_key:
-        out = _call_openai(prompt, openai_key)
-        if out:
-            return out
 
+def _call_llm_uncoalesced(prompt: str, hedge: bool | None = None, validate=None, hedge_delay_ms: float | None = None, prefer: str | None = None, output: dict | None = None, deadline: float | None = None) -> str | None:
+    """
+    Call the best available LLM. Providers are ranked by llm_router (observed latency and
+    success rate, open breakers skipped); with no history the order is
+    Hugging Face -> Gemini -> Cohere -> Claude -> Groq -> OpenAI.
+    With hedge=True (or LLM_HEDGE=1) the same prompt is raced across providers, see _call_llm_hedged.
+    validate(text) -> bool rejects responses so the next provider is tried.
+    prefer moves a healthy provider to the front (used to spread fan-out calls).
+    output ({"name", "schema", "max_tokens"}) asks for structured JSON and caps the response length.
+    deadline (absolute time.monotonic()) caps provider timeouts and slot waits; once too little
+    time is left no further provider is tried.
+    Returns raw text response or None if all fail; raises LLMOverloaded when every
+    provider was skipped because its in-flight cap was reached.
+    """
+    providers = {name: (fn, key) for name, fn, key in _configured_providers()}
+    background = getattr(_call_ctx, "background", False)
+    allow = getattr(_call_ctx, "allow", None)
+    if allow is not None:
+        providers = {name: v for name, v in providers.items() if allow(name)}
+    order = _router.order(list(providers.keys()))
+    if prefer in order:
+        order.remove(prefer)
+        order.insert(0, prefer)
+    if hedge is None:
+        hedge = HEDGE_ENABLED
+    if hedge and len(order) > 1:
+        delay = HEDGE_DELAY_MS if hedge_delay_ms is None else hedge_delay_ms
+        return _call_llm_hedged(prompt, providers, order, validate, delay, background, output, deadline)
+    shed = []
+    for i, name in enumerate(order):
+        fn, key = providers[name]
+        try:
+            out = _attempt(name, fn, key, prompt, background, output, deadline)
+        except _transport.Saturated as e:
+            _router.release([name])
+            shed.append(e)
+            continue
+        except _deadline.Exceeded:
+            print(f"[AI] Request deadline reached; skipping {', '.join(order[i:])}")
+            _router.release(order[i:])
+            return None
+        if out and (validate is None or validate(out)):
+            _router.release(order[i + 1:])
+            return out
+    _raise_if_all_shed(shed, len(order))
     return None
 
 
-def generate_roadmap_via_ai(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 3) -> dict | None:
+def would_shed() -> bool:
+    """True when every configured provider is at its in-flight cap with a queue longer than LLM_QUEUE_BUDGET_S."""
+    return _transport.limiter.would_shed(configured_provider_names())
+
+
+def routing_snapshot() -> dict:
+    """Current provider order and per-provider health, for diagnostics."""
+    names = configured_provider_names()
+    return {"order": _router.order_preview(names), "providers": _router.snapshot(names), "hedge": hedge_stats(), "streaming": stream_stats(), "singleflight": _singleflight.flight.describe(), "limits": _transport.limiter.snapshot(), "repair": repair_stats(), "timeouts_s": timeout_snapshot()}
+
+
+# ========== Streaming (time-to-first-token) ==========
+STREAM_TIMEOUT = (10, 60)  # (connect, read-between-chunks) seconds
+
+_stream_lock = threading.Lock()
+_stream_stats = {"streams": 0, "fallbacks": 0, "ttft_ms": deque(maxlen=200)}
+
+
+def _iter_sse_data(resp):
+    """Yield the data payload of each server-sent event line."""
+    for line in resp.iter_lines(decode_unicode=True):
+        if line and line.startswith("data:"):
+            data = line[5:].strip()
+            if data and data != "[DONE]":
+                yield data
+
+
+def _stream_openai_compatible(provider: str, url: str, model: str, prompt: str, api_key: str, max_tokens: int = 8192):
+    with _transport.post(
+        provider,
+        url,
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        json={
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.8,
+            "max_tokens": max_tokens,
+            "stream": True,
+        },
+        timeout=STREAM_TIMEOUT,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"{provider} stream HTTP {resp.status_code}")
+        for data in _iter_sse_data(resp):
+            choices = json.loads(data).get("choices") or [{}]
+            text = (choices[0].get("delta") or {}).get("content")
+            if text:
+                yield text
+
+
+def _stream_huggingface(prompt: str, api_key: str):
+    model = os.environ.get("HF_MODEL", "Qwen/Qwen3-Coder-Next:novita")
+    yield from _stream_openai_compatible("huggingface", f"{_transport.origin('huggingface')}/v1/chat/completions", model, prompt, api_key)
+
+
+def _stream_groq(prompt: str, api_key: str):
+    yield from _stream_openai_compatible("groq", f"{_transport.origin('groq')}/openai/v1/chat/completions", "llama-3.3-70b-versatile", prompt, api_key)
+
+
+def _stream_openai(prompt: str, api_key: str):
+    yield from _stream_openai_compatible("openai", f"{_transport.origin('openai')}/v1/chat/completions", "gpt-3.5-turbo", prompt, api_key)
+
+
+def _stream_gemini(prompt: str, api_key: str):
+    """Gemini streamGenerateContent over SSE (alt=sse)."""
+    url = f"{_transport.origin('gemini')}/v1beta/models/gemini-2.0-flash:streamGenerateContent?alt=sse"
+    with _transport.post(
+        "gemini",
+        url,
+        headers={"Content-Type": "application/json", "X-goog-api-key": api_key},
+        json={
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0.8, "maxOutputTokens": 8192},
+        },
+        timeout=STREAM_TIMEOUT,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"gemini stream HTTP {resp.status_code}")
+        for data in _iter_sse_data(resp):
+            for cand in json.loads(data).get("candidates") or []:
+                for part in (cand.get("content") or {}).get("parts") or []:
+                    if part.get("text"):
+                        yield part["text"]
+
+
+def _stream_cohere(prompt: str, api_key: str):
+    """Cohere Chat API v2 streaming (content-delta events)."""
+    with _transport.post(
+        "cohere",
+        f"{_transport.origin('cohere')}/v2/chat",
+        headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        json={
+            "model": os.environ.get("COHERE_MODEL", "command-r-plus"),
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.8,
+            "max_tokens": 8192,
+            "stream": True,
+        },
+        timeout=STREAM_TIMEOUT,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"cohere stream HTTP {resp.status_code}")
+        for data in _iter_sse_data(resp):
+            event = json.loads(data)
+            if event.get("type") == "content-delta":
+                text = ((event.get("delta") or {}).get("message") or {}).get("content", {}).get("text")
+                if text:
+                    yield text
+
+
+def _stream_claude(prompt: str, api_key: str):
+    """Anthropic Messages API streaming (content_block_delta events)."""
+    with _transport.post(
+        "claude",
+        f"{_transport.origin('claude')}/v1/messages",
+        headers={"x-api-key": api_key, "anthropic-version": "2023-06-01", "Content-Type": "application/json"},
+        json={
+            "model": os.environ.get("ANTHROPIC_MODEL", "claude-3-5-sonnet-20241022"),
+            "max_tokens": 8192,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.8,
+            "stream": True,
+        },
+        timeout=STREAM_TIMEOUT,
+        stream=True,
+    ) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"claude stream HTTP {resp.status_code}")
+        for data in _iter_sse_data(resp):
+            event = json.loads(data)
+            if event.get("type") == "content_block_delta":
+                text = (event.get("delta") or {}).get("text")
+                if text:
+                    yield text
+
+
+_STREAMERS = {
+    "huggingface": _stream_huggingface,
+    "gemini": _stream_gemini,
+    "cohere": _stream_cohere,
+    "claude": _stream_claude,
+    "groq": _stream_groq,
+    "openai": _stream_openai,
+}
+
+
+def stream_llm(prompt: str, meta: dict | None = None):
     """
-    Generate roadmap units using AI. Returns dict with 'units' list or None on failure.
-    Each unit has: unit_number, title, level, tasks, mcqs.
-    When proficiency is beginner, chapters MUST start from absolute basics of the domain.
+    Stream text chunks from the best available provider using its native streaming API.
+    Falls back to the next provider only while no token has arrived yet; once the first
+    token is out the stream is committed to that provider. meta (if given) receives
+    'provider' and 'ttft_ms'. Yields nothing if every provider fails before its first token.
     """
+    meta = meta if meta is not None else {}
+    providers = {name: key for name, _, key in _configured_providers()}
+    order = _router.order(list(providers.keys()))
+    for i, name in enumerate(order):
+        try:
+            slot = _transport.limiter.acquire(name, _transport.QUEUE_BUDGET_S)
+        except _transport.Saturated:
+            _router.release([name])
+            continue
+        _transport.clear_last_error()
+        start = time.monotonic()
+        chunks = _STREAMERS[name](prompt, providers[name])
+        try:
+            first = next(chunks)
+        except StopIteration:
+            _transport.limiter.release(name, slot)
+            _router.record_failure(name, "empty", (time.monotonic() - start) * 1000)
+            continue
+        except Exception as e:
+            _transport.limiter.release(name, slot)
+            print(f"[AI] Stream from {name} failed before first token: {e}")
+            _router.record_failure(name, _transport.last_error() or "network", (time.monotonic() - start) * 1000)
+            continue
+        ttft_ms = (time.monotonic() - start) * 1000
+        _router.release(order[i + 1:])
+        meta.update({"provider": name, "ttft_ms": round(ttft_ms, 1)})
+        with _stream_lock:
+            _stream_stats["streams"] += 1
+            _stream_stats["fallbacks"] += i
+            _stream_stats["ttft_ms"].append(ttft_ms)
+        try:
+            # The consumer may stop (or the client disconnect) at the first token already
+            yield first
+            yield from chunks
+        except Exception as e:
+            # Tokens already went out; a mid-stream failure cannot be retried elsewhere
+            print(f"[AI] Stream from {name} interrupted: {e}")
+            _router.record_failure(name, _transport.last_error() or "network", (time.monotonic() - start) * 1000)
+            return
+        finally:
+            chunks.close()
+            _transport.limiter.release(name, slot)
+        _router.record_success(name, (time.monotonic() - start) * 1000)
+        return
+
+
+def stream_stats() -> dict:
+    with _stream_lock:
+        ttft = list(_stream_stats["ttft_ms"])
+        return {
+            "streams": _stream_stats["streams"],
+            "fallbacks_before_first_token": _stream_stats["fallbacks"],
+            "ttft_p50_ms": percentile(ttft, 0.50, 1),
+            "ttft_p95_ms": percentile(ttft, 0.95, 1),
+        }
+
+
+def _learner_hints(domain: str, proficiency_level: str, professional_goal: str, current_status: str, start_unit: int):
+    """Prompt fragments describing the learner; beginners starting at chapter 1 get a basics-first instruction."""
     level_hint = f"Proficiency: {proficiency_level}. " if proficiency_level else ""
     goal_hint = f"Professional goal: {professional_goal}. " if professional_goal else ""
     status_hint = f"Current status: {current_status}. " if current_status else ""
@@ -292,6 +917,91 @@ def generate_roadmap_via_ai(domain: str, proficiency_level: str = "", profession
         )
     else:
         order_instruction = ""
+    return level_hint, goal_hint, status_hint, order_instruction
+
+
+# JSON schemas for structured output (also keeps the compact prompts short: the format is
+# enforced by the provider instead of spelled out by example).
+_UNIT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "unit_number": {"type": "integer"},
+        "title": {"type": "string"},
+        "level": {"type": "string", "enum": ["beginner", "intermediate", "advanced"]},
+        "tasks": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"task_id": {"type": "string"}, "task_name": {"type": "string"}},
+                "required": ["task_id", "task_name"],
+            },
+            "minItems": 4,
+            "maxItems": 4,
+        },
+        "mcqs": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "question": {"type": "string"},
+                    "options": {"type": "array", "items": {"type": "string"}, "minItems": 4, "maxItems": 4},
+                    "correctIndex": {"type": "integer"},
+                },
+                "required": ["question", "options", "correctIndex"],
+            },
+            "minItems": 4,
+            "maxItems": 5,
+        },
+    },
+    "required": ["unit_number", "title", "level", "tasks", "mcqs"],
+}
+ROADMAP_SCHEMA = {"type": "object", "properties": {"units": {"type": "array", "items": _UNIT_SCHEMA}}, "required": ["units"]}
+OUTLINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "chapters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"unit_number": {"type": "integer"}, "title": {"type": "string"}},
+                "required": ["unit_number", "title"],
+            },
+        },
+    },
+    "required": ["chapters"],
+}
+
+# Output token budget per requested chapter (4 tasks + 5 MCQs is ~500 tokens of JSON) and per call
+TOKENS_PER_CHAPTER = int(os.environ.get("LLM_TOKENS_PER_CHAPTER", 700))
+TOKENS_PER_OUTLINE_CHAPTER = 48
+TOKENS_BASE = 256
+
+
+def _roadmap_output(count: int, full_prompt: str | None = None) -> dict:
+    """Structured output for roadmap units; full_prompt replaces a compact prompt where the schema is not sent."""
+    output = {"name": "roadmap_units", "schema": ROADMAP_SCHEMA, "max_tokens": min(DEFAULT_MAX_TOKENS, TOKENS_BASE + TOKENS_PER_CHAPTER * count)}
+    if full_prompt:
+        output["full_prompt"] = full_prompt
+    return output
+
+
+def _outline_output(count: int) -> dict:
+    return {"name": "roadmap_outline", "schema": OUTLINE_SCHEMA, "max_tokens": min(DEFAULT_MAX_TOKENS, TOKENS_BASE + TOKENS_PER_OUTLINE_CHAPTER * count)}
+
+
+def _learner_context(domain: str, proficiency_level: str, professional_goal: str, current_status: str, start_unit: int) -> str:
+    """_learner_hints as one block, for the short follow-up prompts (fan-out chapters, repairs)."""
+    level_hint, goal_hint, status_hint, order_instruction = _learner_hints(domain, proficiency_level, professional_goal, current_status, start_unit)
+    return f"{level_hint}{goal_hint}{status_hint}\n{order_instruction}".strip()
+
+
+def _roadmap_prompt(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 3, compact: bool = False) -> str:
+    """
+    Build the roadmap generation prompt (shared by the blocking and streaming paths).
+    compact=True drops the worked JSON example, for calls that request ROADMAP_SCHEMA as structured output;
+    pass the full prompt along as _roadmap_output(full_prompt=...) for providers that do not get the schema.
+    """
+    level_hint, goal_hint, status_hint, order_instruction = _learner_hints(domain, proficiency_level, professional_goal, current_status, start_unit)
 
     unit_nums = list(range(start_unit, start_unit + count))
     def _level(n):
@@ -299,6 +1009,13 @@ def generate_roadmap_via_ai(domain: str, proficiency_level: str = "", profession
         return ["beginner", "intermediate", "advanced"][r]
     levels_desc = ", ".join([f"Chapter {n}: {_level(n)}" for n in unit_nums])
 
+    if compact:
+        return f"""Design chapters {start_unit} through {start_unit + count - 1} of a learning roadmap for "{domain}". {level_hint}{goal_hint}{status_hint}
+{order_instruction}
+Levels: {levels_desc}.
+Each chapter: a specific title (not generic like "Getting started"), 4 short concrete tasks, and 4-5 MCQs unique across chapters about {domain}-specific concepts, each with exactly 4 options and correctIndex 0-3.
+Reply with JSON only: {{"units": [{{"unit_number", "title", "level", "tasks": [{{"task_id": "u{start_unit}_t1", "task_name"}}], "mcqs": [{{"question", "options", "correctIndex"}}]}}]}}"""
+
     prompt = f"""You are an expert career coach and learning path designer. Generate a structured learning roadmap for the domain "{domain}".
 {level_hint}{goal_hint}{status_hint}
 {order_instruction}
@@ -337,20 +1054,405 @@ Output ONLY valid JSON in this exact format (no markdown, no extra text):
 
 Use unit_number {start_unit} for first chapter, {start_unit + 1} for second, etc. correctIndex is 0-3 (index of correct option). Each MCQ must have exactly 4 options. Generate UNIQUE questions per chapter - no repetition."""
 
-    raw = call_llm(prompt)
+    return prompt
+
+
+def generate_roadmap_via_ai(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 3, hedge: bool | None = None, fanout: bool | None = None) -> dict | None:
+    """
+    Generate roadmap units using AI. Returns dict with 'units' list or None on failure.
+    Each unit has: unit_number, title, level, tasks, mcqs.
+    When proficiency is beginner, chapters MUST start from absolute basics of the domain.
+    hedge: race providers (see call_llm); None uses LLM_HEDGE. A response only wins if it parses.
+    fanout: outline first, then chapter bodies in parallel (see generate_roadmap_fanout);
+    None uses ROADMAP_FANOUT.
+    Calls stop once the request deadline (deadline.current()) is nearly up; None is returned
+    so the caller falls back to its template.
+    """
+    if fanout is None:
+        fanout = FANOUT_ENABLED
+    deadline = _deadline.current()
+    context = _learner_context(domain, proficiency_level, professional_goal, current_status, start_unit)
+    if fanout and count > FANOUT_GROUP_SIZE:
+        result = generate_roadmap_fanout(domain, proficiency_level, professional_goal, current_status, start_unit, count, hedge=hedge, deadline=deadline)
+        if result:
+            return {"units": repair_units(result["units"], domain, context, start_unit, count, deadline)}
+    args = (domain, proficiency_level, professional_goal, current_status, start_unit, count)
+    prompt = _roadmap_prompt(*args, compact=True)
+    output = _roadmap_output(count, full_prompt=_roadmap_prompt(*args))
+    raw = call_llm(prompt, hedge=hedge, validate=lambda text: _parse_units(text, quiet=True) is not None, output=output, deadline=deadline)
     if not raw:
         return None
+    units = _parse_units(raw)
+    return {"units": repair_units(units, domain, context, start_unit, count, deadline)} if units else None
+
+
+# ========== Fan-out: outline, then chapters in parallel ==========
+FANOUT_ENABLED = os.environ.get("ROADMAP_FANOUT", "0") == "1"
+FANOUT_GROUP_SIZE = int(os.environ.get("ROADMAP_FANOUT_GROUP_SIZE", 2))
+FANOUT_WORKERS = int(os.environ.get("ROADMAP_FANOUT_WORKERS", 4))
+
+_fanout_pool = None
+
 
+def _get_fanout_pool():
+    global _fanout_pool
+    if _fanout_pool is None:
+        with _hedge_lock:
+            if _fanout_pool is None:
+                _fanout_pool = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="roadmap-fanout")
+    return _fanout_pool
+
+
+def _outline_prompt(domain: str, context: str, start_unit: int, count: int) -> str:
+    end = start_unit + count - 1
+    return f"""You are an expert learning path designer. Plan chapters {start_unit} through {end} of a learning roadmap for "{domain}".
+{context}
+Each chapter needs a unique, specific title (not generic like "Getting started"), ordered from fundamentals to advanced.
+
+Output ONLY valid JSON (no markdown): {{"chapters": [{{"unit_number": {start_unit}, "title": "..."}}]}} with exactly {count} entries."""
+
+
+def _chapter_prompt(domain: str, context: str, outline: list, numbers: list) -> str:
+    plan = "\n".join(f"{c['unit_number']}. {c['title']}" for c in outline)
+    wanted = ", ".join(str(n) for n in numbers)
+    return f"""You are an expert career coach writing a learning roadmap for "{domain}".
+{context}
+Full chapter plan (for context, so chapters do not overlap):
+{plan}
+
+Write ONLY chapters {wanted}. For each: four short concrete learning tasks and 4 or 5 UNIQUE multiple-choice questions
+specific to that chapter's title (each with exactly 4 options, correctIndex 0-3).
+
+Output ONLY valid JSON (no markdown):
+{{"units": [{{"unit_number": N, "title": "...", "level": "beginner|intermediate|advanced",
+  "tasks": [{{"task_id": "uN_t1", "task_name": "..."}}],
+  "mcqs": [{{"question": "...", "options": ["a", "b", "c", "d"], "correctIndex": 0}}]}}]}}"""
+
+
+def _parse_outline(raw: str, start_unit: int, count: int) -> list | None:
     try:
-        json_str = _extract_json(raw)
-        data = json.loads(json_str)
-        units = data.get("units") or data.get("roadmap", {}).get("units") or []
-        if not units:
-            return None
-        return {"units": units}
-    except json.JSONDecodeError as e:
-        print(f"LLM JSON parse error: {e}")
+        data = parse_json(raw)
+        chapters = data.get("chapters") or data.get("units") or []
+        titles = [str(c.get("title") or "").strip() for c in chapters if isinstance(c, dict)]
+        titles = [t for t in titles if t][:count]
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if len(titles) < count:
+        return None
+    return [{"unit_number": start_unit + i, "title": t} for i, t in enumerate(titles)]
+
+
+def _mcq_key(question: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", str(question).lower()).strip()
+
+
+def _dedupe_mcqs(units: list) -> list:
+    """Drop MCQs whose normalized question text already appeared in an earlier chapter."""
+    seen = set()
+    out = []
+    for u in units:
+        mcqs = []
+        for m in u.get("mcqs") or []:
+            key = _mcq_key(m.get("question", "")) if isinstance(m, dict) else ""
+            if key and key in seen:
+                continue
+            seen.add(key)
+            mcqs.append(m)
+        out.append({**u, "mcqs": mcqs})
+    return out
+
+
+def generate_roadmap_fanout(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 8, hedge: bool | None = None, deadline: float | None = None) -> dict | None:
+    """
+    Fan-out roadmap generation: one cheap call for chapter titles, then chapter bodies in
+    groups of ROADMAP_FANOUT_GROUP_SIZE generated concurrently (bounded pool, groups spread
+    over healthy providers). Results are merged in chapter order and MCQs are de-duplicated
+    across chapters. Returns {'units': [...]} or None if the outline could not be generated.
+    deadline defaults to the current request's; it is passed explicitly to the pool threads.
+    """
+    if deadline is None:
+        deadline = _deadline.current()
+    context = _learner_context(domain, proficiency_level, professional_goal, current_status, start_unit)
+    outline_raw = call_llm(
+        _outline_prompt(domain, context, start_unit, count),
+        hedge=hedge,
+        validate=lambda text: _parse_outline(text, start_unit, count) is not None,
+        output=_outline_output(count),
+        deadline=deadline,
+    )
+    outline = _parse_outline(outline_raw, start_unit, count) if outline_raw else None
+    if not outline:
+        return None
+
+    providers = _router.order_preview(configured_provider_names()) or [None]
+    groups = [outline[i : i + FANOUT_GROUP_SIZE] for i in range(0, len(outline), FANOUT_GROUP_SIZE)]
+
+    def run_group(idx, group):
+        numbers = [c["unit_number"] for c in group]
+        raw = call_llm(
+            _chapter_prompt(domain, context, outline, numbers),
+            hedge=hedge,
+            validate=lambda text: _parse_units(text, quiet=True) is not None,
+            prefer=providers[idx % len(providers)],
+            output=_roadmap_output(len(numbers)),
+            deadline=deadline,
+        )
+        units = _parse_units(raw) if raw else None
+        by_number = {u.get("unit_number"): u for u in units or [] if isinstance(u, dict)}
+        out = []
+        for pos, chapter in enumerate(group):
+            unit = by_number.get(chapter["unit_number"])
+            if unit is None and units and pos < len(units) and isinstance(units[pos], dict):
+                unit = {**units[pos], "unit_number": chapter["unit_number"]}
+            if unit is not None:
+                out.append({**unit, "title": unit.get("title") or chapter["title"]})
+        return out
+
+    pool = _get_fanout_pool()
+    futures = [pool.submit(run_group, i, g) for i, g in enumerate(groups)]
+    units = []
+    for fut in futures:
+        try:
+            units.extend(fut.result())
+        except Exception as e:
+            print(f"[AI] Fan-out chapter group failed: {e}")
+    if not units:
+        return None
+    return {"units": _dedupe_mcqs(units)}
+
+
+# ========== Targeted repair of incomplete units ==========
+# Units missing MCQs or tasks get a small follow-up call for just the missing parts; chapters
+# missing altogether are generated with the fan-out chapter prompt. Calls run concurrently and
+# are merged back, instead of _ensure_unit_format padding ("Option 3", "Task 2") or templates.
+REPAIR_ENABLED = os.environ.get("ROADMAP_REPAIR", "1") == "1"
+REPAIR_MAX_CALLS = int(os.environ.get("ROADMAP_REPAIR_MAX_CALLS", 4))
+MIN_MCQS = 4
+TASKS_PER_UNIT = 4
+
+_REPAIR_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tasks": {"type": "array", "items": {"type": "object", "properties": {"task_name": {"type": "string"}}, "required": ["task_name"]}},
+        "mcqs": {"type": "array", "items": _UNIT_SCHEMA["properties"]["mcqs"]["items"]},
+    },
+    "required": ["tasks", "mcqs"],
+}
+_repair_stats = {"roadmaps": 0, "incomplete": 0, "calls": 0, "units_completed": 0, "chapters_added": 0}
+
+
+def _valid_mcq(m) -> bool:
+    if not isinstance(m, dict) or not str(m.get("question") or "").strip():
+        return False
+    options = m.get("options")
+    if not isinstance(options, list) or sum(1 for o in options[:4] if str(o).strip()) < 4:
+        return False
+    try:
+        return 0 <= int(m.get("correctIndex", 0)) < 4
+    except (TypeError, ValueError):
+        return False
+
+
+def _valid_task(t) -> bool:
+    if isinstance(t, dict):
+        return bool(str(t.get("task_name") or "").strip())
+    return isinstance(t, str) and bool(t.strip())
+
+
+def _index_units(units: list, start_unit: int, count: int):
+    """Requested chapter number -> unit (by unit_number, else by position), plus units beyond the request."""
+    wanted = range(start_unit, start_unit + count)
+    by_number, loose = {}, []
+    for u in units or []:
+        if not isinstance(u, dict):
+            continue
+        try:
+            n = int(u.get("unit_number"))
+        except (TypeError, ValueError):
+            n = None
+        if n in wanted and n not in by_number:
+            by_number[n] = {**u, "unit_number": n}
+        else:
+            loose.append(u)
+    for n in wanted:
+        if n not in by_number and loose:
+            by_number[n] = {**loose.pop(0), "unit_number": n}
+    return by_number, loose
+
+
+def _unit_repair_prompt(domain: str, context: str, unit: dict, mcqs_needed: int, tasks_needed: int) -> str:
+    wanted = []
+    if tasks_needed:
+        wanted.append(f"{tasks_needed} more short concrete learning task(s)")
+    if mcqs_needed:
+        wanted.append(f"{mcqs_needed} more multiple-choice question(s) with exactly 4 options and correctIndex 0-3")
+    existing = "\n".join(f"- {m['question']}" for m in unit.get("mcqs") or [] if _valid_mcq(m))
+    avoid = f"\nDo not repeat these existing questions:\n{existing}" if existing else ""
+    return f"""Chapter {unit['unit_number']} "{unit.get('title')}" ({unit.get('level') or 'any'} level) of a learning roadmap for "{domain}" is incomplete.
+{context}
+Write {" and ".join(wanted)} specific to this chapter.{avoid}
+Reply with JSON only: {{"tasks": [{{"task_name"}}], "mcqs": [{{"question", "options", "correctIndex"}}]}}"""
+
+
+def _repair_plan(units: list, domain: str, context: str, start_unit: int, count: int):
+    """
+    Score each requested chapter. Returns (by_number, loose, calls): units keyed by chapter
+    number, units beyond the request, and up to REPAIR_MAX_CALLS follow-up calls as
+    (kind, target, prompt, output). kind "chapters" targets a list of missing chapter numbers
+    (these go first), kind "unit" one chapter missing tasks or MCQs.
+    """
+    by_number, loose = _index_units(units, start_unit, count)
+    missing, partial = [], []
+    for n in range(start_unit, start_unit + count):
+        unit = by_number.get(n)
+        if unit is None or not str(unit.get("title") or "").strip():
+            by_number.pop(n, None)
+            missing.append(n)
+            continue
+        tasks_needed = max(0, TASKS_PER_UNIT - sum(1 for t in unit.get("tasks") or [] if _valid_task(t)))
+        mcqs_needed = max(0, MIN_MCQS - sum(1 for m in unit.get("mcqs") or [] if _valid_mcq(m)))
+        if tasks_needed or mcqs_needed:
+            partial.append((mcqs_needed + tasks_needed, n, mcqs_needed, tasks_needed))
+
+    calls = []
+    if missing:
+        outline = [{"unit_number": n, "title": by_number[n]["title"] if n in by_number else "(choose a fitting title)"}
+                   for n in range(start_unit, start_unit + count)]
+        for i in range(0, len(missing), FANOUT_GROUP_SIZE):
+            numbers = missing[i : i + FANOUT_GROUP_SIZE]
+            calls.append(("chapters", numbers, _chapter_prompt(domain, context, outline, numbers), _roadmap_output(len(numbers))))
+    for _, n, mcqs_needed, tasks_needed in sorted(partial, reverse=True):
+        budget = TOKENS_BASE + 120 * mcqs_needed + 40 * tasks_needed
+        output = {"name": "unit_parts", "schema": _REPAIR_SCHEMA, "max_tokens": budget}
+        calls.append(("unit", n, _unit_repair_prompt(domain, context, by_number[n], mcqs_needed, tasks_needed), output))
+    return by_number, loose, calls[:REPAIR_MAX_CALLS]
+
+
+def _parse_unit_parts(raw: str) -> dict | None:
+    try:
+        data = parse_json(raw)
+    except json.JSONDecodeError:
         return None
+    return data if isinstance(data, dict) and (data.get("mcqs") or data.get("tasks")) else None
+
+
+def _repair_merge(by_number: dict, loose: list, calls: list, results: list, start_unit: int, count: int) -> list:
+    """
+    Merge follow-up results (raw text or None, in calls order) into the units; returns the unit
+    list. A repaired unit keeps its valid tasks/MCQs plus the new ones; on a failed call it is unchanged.
+    """
+    seen = {_mcq_key(m["question"]) for u in by_number.values() for m in u.get("mcqs") or [] if _valid_mcq(m)}
+    added_chapters = completed = 0
+    for (kind, target, _, _), raw in zip(calls, results):
+        if not raw:
+            continue
+        if kind == "chapters":
+            added, _ = _index_units(_parse_units(raw, quiet=True) or [], start_unit, count)
+            for n in target:
+                if n in added:
+                    by_number[n] = added[n]
+                    added_chapters += 1
+            continue
+        parts = _parse_unit_parts(raw)
+        if not parts:
+            continue
+        unit = by_number[target]
+        tasks = [t if isinstance(t, dict) else {"task_id": f"u{target}_t{i + 1}", "task_name": t}
+                 for i, t in enumerate(unit.get("tasks") or []) if _valid_task(t)][:TASKS_PER_UNIT]
+        mcqs = [m for m in unit.get("mcqs") or [] if _valid_mcq(m)]
+        for t in parts.get("tasks") or []:
+            if len(tasks) < TASKS_PER_UNIT and _valid_task(t):
+                name = t["task_name"] if isinstance(t, dict) else t
+                tasks.append({"task_id": f"u{target}_t{len(tasks) + 1}", "task_name": str(name).strip()})
+        for m in parts.get("mcqs") or []:
+            key = _mcq_key(m.get("question", "")) if isinstance(m, dict) else ""
+            if len(mcqs) < MIN_MCQS and _valid_mcq(m) and key not in seen:
+                seen.add(key)
+                mcqs.append(m)
+        by_number[target] = {**unit, "tasks": tasks, "mcqs": mcqs}
+        completed += int(len(tasks) >= TASKS_PER_UNIT and len(mcqs) >= MIN_MCQS)
+    with _hedge_lock:
+        _repair_stats["chapters_added"] += added_chapters
+        _repair_stats["units_completed"] += completed
+    return [by_number[n] for n in sorted(by_number)] + loose
+
+
+def _repair_validate(kind: str):
+    if kind == "chapters":
+        return lambda text: _parse_units(text, quiet=True) is not None
+    return lambda text: _parse_unit_parts(text) is not None
+
+
+def _count_repair(calls: list):
+    with _hedge_lock:
+        _repair_stats["roadmaps"] += 1
+        if calls:
+            _repair_stats["incomplete"] += 1
+            _repair_stats["calls"] += len(calls)
+
+
+def repair_units(units: list, domain: str, context: str, start_unit: int, count: int, deadline: float | None = None) -> list:
+    """
+    Complete the generated units for chapters start_unit..start_unit+count-1 with targeted
+    follow-up calls (run concurrently on the fan-out pool). Returns the merged unit list;
+    units that could not be repaired are left for _ensure_unit_format to pad as before.
+    Skipped when the request deadline leaves no time for another call.
+    """
+    if deadline is None:
+        deadline = _deadline.current()
+    if not REPAIR_ENABLED or not units or _deadline.exhausted(deadline):
+        return units
+    by_number, loose, calls = _repair_plan(units, domain, context, start_unit, count)
+    _count_repair(calls)
+    if not calls:
+        return units
+    background = getattr(_call_ctx, "background", False)
+    allow = getattr(_call_ctx, "allow", None)
+
+    def run(kind, prompt, output):
+        # Pool threads do not inherit this thread's background_calls() marking
+        if background:
+            with background_calls(allow):
+                return call_llm(prompt, validate=_repair_validate(kind), output=output, deadline=deadline)
+        return call_llm(prompt, validate=_repair_validate(kind), output=output, deadline=deadline)
+
+    print(f"[AI] Repairing roadmap for '{domain}': {len(calls)} follow-up call(s)")
+    pool = _get_fanout_pool()
+    futures = [pool.submit(run, kind, prompt, output) for kind, _, prompt, output in calls]
+    results = []
+    for fut in futures:
+        try:
+            results.append(fut.result())
+        except Exception as e:
+            print(f"[AI] Roadmap repair call failed: {e}")
+            results.append(None)
+    return _repair_merge(by_number, loose, calls, results, start_unit, count)
+
+
+def repair_stats() -> dict:
+    with _hedge_lock:
+        return dict(_repair_stats)
+
+
+def stream_roadmap_units(domain: str, proficiency_level: str = "", professional_goal: str = "", current_status: str = "", start_unit: int = 1, count: int = 3, meta: dict | None = None):
+    """
+    Stream the roadmap generation and yield each raw unit dict as soon as its JSON object
+    closes (see llm_json.UnitStreamParser). Stops after `count` units. meta receives the
+    stream_llm provider/ttft fields. Yields nothing if no provider could stream.
+    """
+    prompt = _roadmap_prompt(domain, proficiency_level, professional_goal, current_status, start_unit, count)
+    parser = UnitStreamParser()
+    emitted = 0
+    chunks = stream_llm(prompt, meta)
+    try:
+        for chunk in chunks:
+            for unit in parser.feed(chunk):
+                yield unit
+                emitted += 1
+                if emitted >= count:
+                    return
+    finally:
+        chunks.close()
 
 
 def generate_next_chapters_via_ai(domain: str, last_unit_number: int, count: int = 2) -> dict | None:
@@ -0,0 +1,210 @@
+"""
+JSON helpers for LLM output.
+parse_json finds the JSON object in a complete response (prose and code fences
+around it are fine) and, when it does not parse, repairs the usual model defects:
+trailing commas, smart quotes, and output cut off mid-unit or before the closing
+brackets, keeping every complete unit.
+UnitStreamParser consumes a roadmap response token-by-token and hands back each
+unit object as soon as its closing brace arrives, so units can be validated and
+sent to the client while the rest of the generation is still streaming.
+"""
+import json
+import re
+
+# Skips everything up to the next bracket outside a string literal (escapes included) in one
+# match, so scans loop once per bracket. Group 1 is the bracket, '"' for a string cut off by
+# the end of the text, or None at the end.
+_NEXT_BRACKET = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*(.)?', re.S)
+_TRAILING_COMMA = re.compile(r'("[^"\\]*(?:\\.[^"\\]*)*")|,(?=\s*[}\]])', re.S)
+_MAYBE_TRAILING_COMMA = re.compile(r',\s*[}\]]')
+_SMART_QUOTES = str.maketrans({"\u201c": '"', "\u201d": '"', "\u201e": '"', "\u201f": '"'})
+_decoder = json.JSONDecoder(strict=False)  # strict=False: raw newlines/tabs inside strings are common
+MAX_CANDIDATES = 8
+
+
+def _scan(text: str, start: int):
+    """
+    Walk the object or array opening at text[start], skipping string literals whole.
+    Returns (end, cut, closers): end is the index after its closing bracket, or None when
+    the text ends first. cut is the index after the last complete object/array element at
+    the shallowest array level seen (a unit, in a roadmap), and closers the brackets that
+    close everything still open there; cut is None if no element completed.
+    """
+    stack = []
+    cut, closers, cut_depth = None, "", None
+    pos, n = start, len(text)
+    while pos < n:
+        m = _NEXT_BRACKET.match(text, pos)
+        c, pos = m.group(1), m.end()
+        if c is None or c == '"':
+            break  # end of text, or truncated inside a string
+        if c == "{" or c == "[":
+            stack.append(c)
+            continue
+        if stack:
+            stack.pop()
+        if not stack:
+            return pos, cut, closers
+        if stack[-1] == "[" and (cut_depth is None or len(stack) <= cut_depth):
+            cut, cut_depth = pos, len(stack)
+            closers = "".join("]" if b == "[" else "}" for b in reversed(stack))
+    return None, cut, closers
+
+
+def _locate(text: str):
+    """
+    Find the JSON object in an LLM response. Returns (obj, start, end): obj is the parsed
+    object when text[start:end] is valid as-is; otherwise obj is None and text[start:end]
+    (end None: the rest of the text, i.e. truncated) is the best candidate for repair.
+    start is -1 when there is no '{' at all.
+    """
+    fence = text.find("```")
+    start = text.find("{", fence + 3) if fence >= 0 else -1
+    if start < 0:
+        start = text.find("{")
+    best, best_len = (None, start, None), -1
+    for _ in range(MAX_CANDIDATES):
+        if start < 0:
+            break
+        try:
+            obj, end = _decoder.raw_decode(text, start)
+            if isinstance(obj, dict) and obj:
+                return obj, start, end
+        except json.JSONDecodeError:
+            pass
+        end = _scan(text, start)[0]
+        if end is None:
+            return None, start, None
+        # Balanced but invalid (trailing comma, or braces in leading prose): keep looking
+        if end - start > best_len:
+            best, best_len = (None, start, end), end - start
+        start = text.find("{", end)
+    return best
+
+
+def extract_json(text: str) -> str:
+    """The JSON object text in an LLM response (may be wrapped in prose or a markdown code block)."""
+    text = (text or "").strip()
+    _, start, end = _locate(text)
+    return text if start < 0 else text[start:end]
+
+
+def repair_json(text: str) -> str | None:
+    """
+    Fix common defects in the text of a JSON object: trailing commas, and output cut off
+    mid-element or before its closing brackets (cut back to the last complete unit, then
+    close what is still open). Returns the repaired text, or None if nothing is salvageable.
+    """
+    if _MAYBE_TRAILING_COMMA.search(text):
+        text = _TRAILING_COMMA.sub(lambda m: m.group(1) or "", text)
+    start = text.find("{")
+    if start < 0:
+        return None
+    end, cut, closers = _scan(text, start)
+    if end is not None:
+        return text[start:end]
+    if cut is None:
+        return None
+    return text[start:cut] + closers
+
+
+def parse_json(text: str):
+    """
+    Parse the JSON object in an LLM response, repairing it (repair_json, then with smart
+    quotes straightened) if it does not parse as-is. Raises json.JSONDecodeError.
+    """
+    text = text or ""
+    obj, start, end = _locate(text)
+    if obj is not None:
+        return obj
+    if start < 0:
+        raise json.JSONDecodeError("No JSON object in response", text, 0)
+    candidate = text[start:end]
+    attempts = [candidate]
+    if "\u201c" in candidate or "\u201d" in candidate:
+        attempts.append(candidate.translate(_SMART_QUOTES))
+    for attempt in attempts:
+        repaired = repair_json(attempt)
+        if repaired is None:
+            continue
+        try:
+            return json.loads(repaired, strict=False)
+        except json.JSONDecodeError:
+            pass
+    return json.loads(candidate, strict=False)  # raises with the original error position
+
+
+class UnitStreamParser:
+    """
+    Incremental parser for {"units": [ {...}, {...} ]} (also a bare array or a
+    nested "roadmap" wrapper). A unit is any object that sits directly inside an
+    array and is not itself nested inside another such object, so tasks and MCQs
+    stay part of their unit. String literals and escapes are tracked, so braces
+    inside titles or MCQ options do not confuse the depth count.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._started = False
+        self._stack = []  # '{' / '[' for open containers
+        self._in_string = False
+        self._escape = False
+        self._unit_start = None
+        self._unit_depth = 0
+        self.errors = 0
+
+    def feed(self, chunk: str) -> list:
+        """Add text; return the unit dicts completed by it (in order)."""
+        if not chunk:
+            return []
+        self._buf += chunk
+        units = []
+        buf = self._buf
+        i = self._pos
+        if not self._started:
+            start = buf.find("{", i)
+            if start < 0:
+                # Still in leading prose / code fence; nothing to keep
+                self._buf, self._pos = "", 0
+                return []
+            self._started = True
+            i = start
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c == "{" or c == "[":
+                if c == "{" and self._unit_start is None and self._stack and self._stack[-1] == "[":
+                    self._unit_start = i
+                    self._unit_depth = len(self._stack)
+                self._stack.append(c)
+            elif c == "}" or c == "]":
+                if self._stack:
+                    self._stack.pop()
+                if c == "}" and self._unit_start is not None and len(self._stack) == self._unit_depth:
+                    text = buf[self._unit_start : i + 1]
+                    self._unit_start = None
+                    try:
+                        obj = json.loads(text)
+                        if isinstance(obj, dict):
+                            units.append(obj)
+                    except json.JSONDecodeError:
+                        self.errors += 1
+            i += 1
+        # Keep only the text of a unit still in progress
+        if self._unit_start is not None:
+            self._buf = buf[self._unit_start :]
+            self._pos = i - self._unit_start
+            self._unit_start = 0
+        else:
+            self._buf, self._pos = "", 0
+        return units
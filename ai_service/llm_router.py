@@ -0,0 +1,186 @@
+"""
+Health tracking, circuit breaking and latency-aware ordering for LLM providers.
+call_llm asks the router which providers to try (and in what order) and reports
+every outcome back, so a provider that is down or rate-limiting is skipped instead
+of holding the worker for its full timeout on every request.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from stats import percentile
+
+BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 3))
+BREAKER_COOLDOWN_S = float(os.environ.get("LLM_BREAKER_COOLDOWN_S", 30))
+BREAKER_MAX_COOLDOWN_S = float(os.environ.get("LLM_BREAKER_MAX_COOLDOWN_S", 300))
+WINDOW_SIZE = int(os.environ.get("LLM_HEALTH_WINDOW", 50))
+MIN_LATENCY_SAMPLES = 3
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+ERROR_CLASSES = ("rate_limited", "server_error", "client_error", "timeout", "network", "empty")
+
+
+def classify_status(status_code: int) -> str | None:
+    """Map an HTTP status to an error class (None for success)."""
+    if status_code is None or status_code < 400:
+        return None
+    if status_code == 429:
+        return "rate_limited"
+    if status_code >= 500:
+        return "server_error"
+    return "client_error"
+
+
+class ProviderHealth:
+    def __init__(self, name: str):
+        self.name = name
+        self.outcomes = deque(maxlen=WINDOW_SIZE)  # True/False per call
+        self.latencies = deque(maxlen=WINDOW_SIZE)  # ms, successful calls only
+        self.errors = {c: 0 for c in ERROR_CLASSES}
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.cooldown_s = BREAKER_COOLDOWN_S
+        self.probe_in_flight = False
+        self.total_calls = 0
+        self.last_error = None
+
+    def success_rate(self):
+        if not self.outcomes:
+            return None
+        return sum(1 for ok in self.outcomes if ok) / len(self.outcomes)
+
+    def latency_percentiles(self):
+        values = list(self.latencies)
+        return percentile(values, 0.50, None), percentile(values, 0.95, None)
+
+
+class ProviderRouter:
+    def __init__(self):
+        self._providers = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> ProviderHealth:
+        h = self._providers.get(name)
+        if h is None:
+            h = self._providers[name] = ProviderHealth(name)
+        return h
+
+    def _refresh_state(self, h: ProviderHealth, now: float):
+        if h.state == OPEN and now - h.opened_at >= h.cooldown_s:
+            h.state = HALF_OPEN
+            h.probe_in_flight = False
+
+    def _rank(self, names: list, claim_probe: bool) -> list:
+        now = time.monotonic()
+        ranked = []
+        with self._lock:
+            for idx, name in enumerate(names):
+                h = self._get(name)
+                self._refresh_state(h, now)
+                if h.state == OPEN:
+                    continue
+                if h.state == HALF_OPEN:
+                    if h.probe_in_flight:
+                        continue
+                    if claim_probe:
+                        h.probe_in_flight = True
+                p50, _ = h.latency_percentiles()
+                if p50 is not None and len(h.latencies) >= MIN_LATENCY_SAMPLES:
+                    score = p50 / max(h.success_rate() or 0.0, 0.1)
+                else:
+                    score = float("inf")
+                ranked.append((score, idx, name))
+        ranked.sort()
+        return [name for _, _, name in ranked]
+
+    def order(self, names: list) -> list:
+        """
+        Return the providers to try, best first. Open breakers are skipped; a half-open
+        provider is included once as a probe (call release() if it ends up not being tried).
+        Healthy providers are ranked by p50 latency weighted by success rate; providers
+        without enough samples keep chain order after them.
+        """
+        return self._rank(names, claim_probe=True)
+
+    def order_preview(self, names: list) -> list:
+        """Same ranking as order() without claiming half-open probe slots."""
+        return self._rank(names, claim_probe=False)
+
+    def release(self, names):
+        """Give back probe slots claimed by order() for providers that were not called."""
+        with self._lock:
+            for name in names:
+                h = self._providers.get(name)
+                if h is not None and h.state == HALF_OPEN:
+                    h.probe_in_flight = False
+
+    def record_success(self, name: str, latency_ms: float):
+        with self._lock:
+            h = self._get(name)
+            h.total_calls += 1
+            h.outcomes.append(True)
+            h.latencies.append(latency_ms)
+            h.consecutive_failures = 0
+            h.probe_in_flight = False
+            if h.state != CLOSED:
+                print(f"[AI] Router: {name} breaker closed after successful probe")
+            h.state = CLOSED
+            h.cooldown_s = BREAKER_COOLDOWN_S
+
+    def record_failure(self, name: str, error_class: str | None, latency_ms: float):
+        error_class = error_class if error_class in ERROR_CLASSES else "empty"
+        with self._lock:
+            h = self._get(name)
+            h.total_calls += 1
+            h.outcomes.append(False)
+            h.errors[error_class] += 1
+            h.last_error = error_class
+            h.consecutive_failures += 1
+            h.probe_in_flight = False
+            if h.state == HALF_OPEN:
+                # Failed probe: reopen with exponential backoff
+                h.cooldown_s = min(h.cooldown_s * 2, BREAKER_MAX_COOLDOWN_S)
+                h.state = OPEN
+                h.opened_at = time.monotonic()
+            elif h.state == CLOSED and h.consecutive_failures >= BREAKER_FAILURES:
+                h.state = OPEN
+                h.opened_at = time.monotonic()
+                print(f"[AI] Router: {name} breaker opened after {h.consecutive_failures} failures ({error_class})")
+
+    def snapshot(self, names: list = None) -> dict:
+        """Routing state for the introspection endpoint."""
+        now = time.monotonic()
+        providers = {}
+        with self._lock:
+            for name in (names if names is not None else list(self._providers.keys())):
+                h = self._get(name)
+                self._refresh_state(h, now)
+                p50, p95 = h.latency_percentiles()
+                rate = h.success_rate()
+                providers[name] = {
+                    "state": h.state,
+                    "calls": h.total_calls,
+                    "success_rate": round(rate, 3) if rate is not None else None,
+                    "p50_ms": round(p50, 1) if p50 is not None else None,
+                    "p95_ms": round(p95, 1) if p95 is not None else None,
+                    "errors": dict(h.errors),
+                    "consecutive_failures": h.consecutive_failures,
+                    "last_error": h.last_error,
+                    "retry_in_s": round(max(0.0, h.cooldown_s - (now - h.opened_at)), 1) if h.state == OPEN else None,
+                }
+        return providers
+
+    def reset(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._providers.clear()
+            else:
+                self._providers.pop(name, None)
+
+
+router = ProviderRouter()
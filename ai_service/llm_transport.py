@@ -0,0 +1,279 @@
+"""
+Pooled HTTP transport for LLM providers.
+Keeps one keep-alive requests.Session per provider so repeated calls reuse
+DNS/TCP/TLS instead of paying a fresh handshake on every roadmap or chat request.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_router import classify_status
+
+# Provider name -> API origin (used for pool mounting and connection prewarming).
+PROVIDER_ORIGINS = {
+    "huggingface": "https://router.huggingface.co",
+    "gemini": "https://generativelanguage.googleapis.com",
+    "cohere": "https://api.cohere.com",
+    "claude": "https://api.anthropic.com",
+    "groq": "https://api.groq.com",
+    "openai": "https://api.openai.com",
+}
+
+
+
+def origin(provider: str) -> str:
+    """API origin for a provider; LLM_BASE_URL_<PROVIDER> overrides it (e.g. a local stub server)."""
+    override = os.environ.get(f"LLM_BASE_URL_{provider.upper()}", "").strip().rstrip("/")
+    return override or PROVIDER_ORIGINS[provider]
+
+
+POOL_CONNECTIONS = int(os.environ.get("LLM_POOL_CONNECTIONS", 4))
+POOL_MAXSIZE = int(os.environ.get("LLM_POOL_MAXSIZE", 16))
+
+# Outbound concurrency cap per provider, and how long an interactive call may queue for a slot
+MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", 8))
+QUEUE_BUDGET_S = float(os.environ.get("LLM_QUEUE_BUDGET_S", 5))
+
+_sessions = {}
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+class Saturated(Exception):
+    """A provider's outbound slots are all busy and the expected wait exceeds the caller's budget."""
+
+    def __init__(self, provider: str, retry_after_s: float):
+        super().__init__(f"{provider} saturated")
+        self.provider = provider
+        self.retry_after_s = retry_after_s
+
+
+class ProviderLimiter:
+    """
+    Bounded semaphore per provider (LLM_MAX_INFLIGHT, or LLM_MAX_INFLIGHT_<PROVIDER>).
+    A caller that would wait longer than its budget is rejected immediately instead of
+    queueing, estimating the wait from how long calls have recently held a slot.
+    acquire()/try_acquire() return a token that must be passed back to release().
+    """
+
+    def __init__(self):
+        self._slots = {}
+        self._active = {}
+        self._waiting = {}
+        self._shed = {}
+        self._hold_s = {}  # provider -> moving average of slot hold time
+        self._lock = threading.Lock()
+
+    def limit(self, provider: str) -> int:
+        return int(os.environ.get(f"LLM_MAX_INFLIGHT_{provider.upper()}", MAX_INFLIGHT))
+
+    def _semaphore(self, provider: str):
+        with self._lock:
+            sem = self._slots.get(provider)
+            if sem is None:
+                sem = self._slots[provider] = threading.BoundedSemaphore(self.limit(provider))
+            return sem
+
+    def estimated_wait_s(self, provider: str) -> float:
+        """Expected queueing time for a new call: rounds of waiters ahead x average call latency."""
+        limit = self.limit(provider)
+        with self._lock:
+            active = self._active.get(provider, 0)
+            waiting = self._waiting.get(provider, 0)
+            hold_s = self._hold_s.get(provider, 0.0)
+        if active < limit and not waiting:
+            return 0.0
+        return (waiting // limit + 1) * hold_s
+
+    def _taken(self, provider: str) -> float:
+        with self._lock:
+            self._active[provider] = self._active.get(provider, 0) + 1
+        return time.monotonic()
+
+    def add_waiter(self, provider: str, delta: int):
+        with self._lock:
+            self._waiting[provider] = self._waiting.get(provider, 0) + delta
+
+    def reject(self, provider: str, retry_after_s: float):
+        """Count a shed call and raise Saturated."""
+        with self._lock:
+            self._shed[provider] = self._shed.get(provider, 0) + 1
+        raise Saturated(provider, retry_after_s)
+
+    def try_acquire(self, provider: str) -> float | None:
+        """Take a slot only if one is free right now; None otherwise."""
+        if self._semaphore(provider).acquire(blocking=False):
+            return self._taken(provider)
+        return None
+
+    def acquire(self, provider: str, budget_s: float) -> float:
+        """Take a slot within budget_s (0 = only if free right now); raises Saturated otherwise."""
+        token = self.try_acquire(provider)
+        if token is not None:
+            return token
+        estimate = self.estimated_wait_s(provider)
+        if budget_s <= 0 or estimate > budget_s:
+            self.reject(provider, estimate or max(budget_s, 1.0))
+        self.add_waiter(provider, 1)
+        try:
+            acquired = self._semaphore(provider).acquire(timeout=budget_s)
+        finally:
+            self.add_waiter(provider, -1)
+        if not acquired:
+            self.reject(provider, max(estimate, budget_s))
+        return self._taken(provider)
+
+    def release(self, provider: str, token: float):
+        held = time.monotonic() - token
+        with self._lock:
+            self._active[provider] -= 1
+            prev = self._hold_s.get(provider)
+            self._hold_s[provider] = held if prev is None else 0.8 * prev + 0.2 * held
+        self._semaphore(provider).release()
+
+    def would_shed(self, providers, budget_s: float | None = None) -> bool:
+        """True when every given provider is full and its estimated wait exceeds budget_s (default LLM_QUEUE_BUDGET_S)."""
+        budget_s = QUEUE_BUDGET_S if budget_s is None else budget_s
+        providers = list(providers)
+        return bool(providers) and all(self.estimated_wait_s(p) > budget_s for p in providers)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "limit": self.limit(name),
+                    "in_flight": self._active.get(name, 0),
+                    "waiting": self._waiting.get(name, 0),
+                    "shed": self._shed.get(name, 0),
+                    "avg_hold_s": round(self._hold_s[name], 3) if name in self._hold_s else None,
+                }
+                for name in self._slots
+            }
+
+
+limiter = ProviderLimiter()
+
+
+def _new_stats():
+    return {"requests": 0, "errors": 0, "total_time_ms": 0.0, "last_status": None, "prewarmed": False}
+
+
+def get_session(provider: str) -> requests.Session:
+    """Return the shared keep-alive session for a provider (created on first use)."""
+    session = _sessions.get(provider)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            _sessions[provider] = session
+            _stats.setdefault(provider, _new_stats())
+    return session
+
+
+def post(provider: str, url: str, **kwargs) -> requests.Response:
+    """POST through the provider's pooled session, recording timing and errors."""
+    session = get_session(provider)
+    start = time.monotonic()
+    try:
+        resp = session.post(url, **kwargs)
+    except Exception as e:
+        _local.last_error = "timeout" if isinstance(e, requests.Timeout) else "network"
+        record_call(provider, (time.monotonic() - start) * 1000)
+        raise
+    _local.last_error = classify_status(resp.status_code)
+    record_call(provider, (time.monotonic() - start) * 1000, resp.status_code)
+    return resp
+
+
+def record_call(provider: str, elapsed_ms: float, status_code: int | None = None):
+    """Add one request to the provider's stats (status_code None = network error or timeout)."""
+    with _lock:
+        st = _stats.setdefault(provider, _new_stats())
+        st["requests"] += 1
+        st["total_time_ms"] += elapsed_ms
+        if status_code is not None:
+            st["last_status"] = status_code
+        if status_code is None or status_code >= 400:
+            st["errors"] += 1
+
+
+def last_error() -> str | None:
+    """Error class of the most recent post() on this thread (None after a 2xx)."""
+    return getattr(_local, "last_error", None)
+
+
+def clear_last_error():
+    _local.last_error = None
+
+
+def prewarm(providers=None, timeout: float = 5.0):
+    """
+    Open a pooled connection to each provider's origin so the first real request
+    skips DNS/TCP/TLS setup. Any HTTP status counts as warm; only network errors fail.
+    """
+    warmed = []
+    for provider in providers or PROVIDER_ORIGINS.keys():
+        if provider not in PROVIDER_ORIGINS:
+            continue
+        try:
+            get_session(provider).head(origin(provider), timeout=timeout, allow_redirects=False)
+            with _lock:
+                _stats[provider]["prewarmed"] = True
+            warmed.append(provider)
+        except Exception as e:
+            print(f"[AI] Prewarm {provider} failed: {e}")
+    return warmed
+
+
+def prewarm_async(providers=None, timeout: float = 5.0):
+    """Run prewarm() in a daemon thread so service startup is not delayed."""
+    t = threading.Thread(target=prewarm, args=(providers, timeout), daemon=True, name="llm-prewarm")
+    t.start()
+    return t
+
+
+def connection_stats() -> dict:
+    """Per-provider request counts and urllib3 pool usage (new connections vs reused)."""
+    out = {}
+    with _lock:
+        items = list(_sessions.items())
+        stats = {k: dict(v) for k, v in _stats.items()}
+    for provider, session in items:
+        st = stats.get(provider, _new_stats())
+        new_conns = 0
+        pool_requests = 0
+        open_pools = 0
+        # http:// and https:// share one adapter; count its pools once
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            manager = getattr(adapter, "poolmanager", None)
+            if manager is None:
+                continue
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                open_pools += 1
+                new_conns += getattr(pool, "num_connections", 0)
+                pool_requests += getattr(pool, "num_requests", 0)
+        calls = st["requests"]
+        out[provider] = {
+            "requests": calls,
+            "errors": st["errors"],
+            "avg_latency_ms": round(st["total_time_ms"] / calls, 1) if calls else None,
+            "last_status": st["last_status"],
+            "prewarmed": st["prewarmed"],
+            "pools": open_pools,
+            "connections_opened": new_conns,
+            "connection_reuse_ratio": round(1 - new_conns / pool_requests, 3) if pool_requests else None,
+        }
+    return out
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Load test for the concurrent worker model and LLM load shedding.
+
+By default the app is served in-process on a threaded WSGI server (like gunicorn gthread)
+with providers replaced by a fake one that sleeps --latency seconds, so no API keys are used.
+Pass --url to run the same phases against a running service instead.
+
+Phase 1 sends /ask_ai requests at increasing concurrency and reports throughput; with an
+I/O-bound provider it should grow roughly linearly until LLM_MAX_INFLIGHT is reached.
+Phase 2 saturates the provider and checks that excess requests are shed with 503 +
+Retry-After while /health keeps answering quickly.
+
+    python load_test.py
+    python load_test.py --url http://localhost:10000 --levels 1,4,8
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from stats import percentile
+
+
+# Read once when application is first imported
+_IMPORT_ENV = {"LLM_PREWARM": "0", "JOBS_ENABLED": "0"}
+
+
+def _start_local_server(latency_s, max_inflight, budget_s):
+    """Serve application in-process with a fake provider; returns (base_url, stop), stop() undoes it all."""
+    saved_env = {name: os.environ.get(name) for name in _IMPORT_ENV}
+    os.environ.update(_IMPORT_ENV)
+    try:
+        import application
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+    from werkzeug.serving import make_server
+
+    import deadline as _deadline
+    import llm_client
+    import llm_transport
+
+    def fake_provider(prompt, api_key, output=None, deadline=None):
+        # Same calling convention as the real providers in llm_client._configured_providers(),
+        # which cap their HTTP timeout by the request deadline
+        left = _deadline.remaining(deadline)
+        time.sleep(latency_s if left is None else max(0.0, min(latency_s, left)))
+        return "ok" if left is None or left >= latency_s else None
+
+    # The limits are read at import; set them on the module and start from empty semaphores
+    saved = (llm_client._configured_providers, llm_transport.MAX_INFLIGHT, llm_transport.QUEUE_BUDGET_S, llm_transport.limiter)
+    llm_client._configured_providers = lambda: [("groq", fake_provider, "fake-key")]
+    llm_transport.MAX_INFLIGHT, llm_transport.QUEUE_BUDGET_S = max_inflight, budget_s
+    llm_transport.limiter = llm_transport.ProviderLimiter()
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, application.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        (llm_client._configured_providers, llm_transport.MAX_INFLIGHT,
+         llm_transport.QUEUE_BUDGET_S, llm_transport.limiter) = saved
+
+    return f"http://127.0.0.1:{server.server_port}", stop
+
+
+def _ask(base_url, i, timeout_s=60):
+    start = time.monotonic()
+    try:
+        # Like the backend, tell the service how long this client waits
+        resp = requests.post(f"{base_url}/ask_ai", json={"question": f"load test question {i} {time.time()}"},
+                             headers={"X-Request-Timeout-Ms": str(int(timeout_s * 1000))}, timeout=timeout_s)
+        return resp.status_code, time.monotonic() - start, resp.headers.get("Retry-After")
+    except requests.RequestException:
+        return None, time.monotonic() - start, None
+
+
+def run_throughput(base_url, levels, per_level):
+    print("Throughput by concurrency")
+    print(f"{'concurrency':>11} {'requests':>8} {'ok':>4} {'shed':>4} {'req/s':>7} {'p50 s':>6} {'p95 s':>6}")
+    for level in levels:
+        n = max(per_level, level)
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            results = list(pool.map(lambda i: _ask(base_url, i), range(n)))
+        elapsed = time.monotonic() - start
+        ok = [r for r in results if r[0] == 200]
+        shed = sum(1 for r in results if r[0] == 503)
+        lat = [r[1] for r in ok]
+        p50, p95 = percentile(lat, 0.5, None), percentile(lat, 0.95, None)
+        print(f"{level:>11} {n:>8} {len(ok):>4} {shed:>4} {len(ok) / elapsed:>7.1f} "
+              f"{p50 or 0:>6.2f} {p95 or 0:>6.2f}")
+
+
+def run_saturation(base_url, concurrency, duration_s):
+    print(f"\nSaturation: {concurrency} concurrent clients for {duration_s:.0f}s, probing /health")
+    stop = time.monotonic() + duration_s
+    results, health = [], []
+    lock = threading.Lock()
+
+    def client(worker):
+        i = 0
+        while time.monotonic() < stop:
+            r = _ask(base_url, f"{worker}-{i}")
+            i += 1
+            with lock:
+                results.append(r)
+            if r[0] == 503:
+                time.sleep(0.05)
+
+    threads = [threading.Thread(target=client, args=(w,), daemon=True) for w in range(concurrency)]
+    for t in threads:
+        t.start()
+    while time.monotonic() < stop:
+        start = time.monotonic()
+        try:
+            code = requests.get(f"{base_url}/health", timeout=5).status_code
+        except requests.RequestException:
+            code = None
+        health.append((code, time.monotonic() - start))
+        time.sleep(0.2)
+    for t in threads:
+        t.join()
+
+    ok = sum(1 for r in results if r[0] == 200)
+    shed = [r for r in results if r[0] == 503]
+    health_ok = [h[1] for h in health if h[0] == 200]
+    print(f"  /ask_ai: {len(results)} requests, {ok} ok, {len(shed)} shed with 503, "
+          f"{len(results) - ok - len(shed)} other")
+    if shed:
+        print(f"  shed latency p95: {percentile([r[1] for r in shed], 0.95, None):.3f}s, "
+              f"Retry-After present: {all(r[2] for r in shed)}")
+    if health_ok:
+        print(f"  /health: {len(health_ok)}/{len(health)} ok, p50 {percentile(health_ok, 0.5, None) * 1000:.0f}ms, "
+              f"p95 {percentile(health_ok, 0.95, None) * 1000:.0f}ms")
+    else:
+        print("  /health: no successful responses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Base URL of a running service (default: serve the app in-process)")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--per-level", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake provider latency in seconds (in-process only)")
+    parser.add_argument("--max-inflight", type=int, default=8, help="LLM_MAX_INFLIGHT (in-process only)")
+    parser.add_argument("--budget", type=float, default=1.0, help="LLM_QUEUE_BUDGET_S (in-process only)")
+    parser.add_argument("--saturate", type=int, default=64, help="Concurrent clients in the saturation phase")
+    parser.add_argument("--duration", type=float, default=5.0, help="Saturation phase length in seconds")
+    args = parser.parse_args()
+
+    stop = None
+    base_url = args.url
+    if not base_url:
+        base_url, stop = _start_local_server(args.latency, args.max_inflight, args.budget)
+        print(f"In-process server at {base_url}: provider latency {args.latency}s, "
+              f"LLM_MAX_INFLIGHT={args.max_inflight}, LLM_QUEUE_BUDGET_S={args.budget}\n")
+    try:
+        run_throughput(base_url, [int(x) for x in args.levels.split(",") if x.strip()], args.per_level)
+        run_saturation(base_url, args.saturate, args.duration)
+    finally:
+        if stop is not None:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Content-addressed cache for generate_roadmap_via_ai results.
+Keyed on the normalized generation parameters. Two tiers:
+  - in-process LRU with TTL (always on)
+  - optional SQLite tier (ROADMAP_CACHE_DB) that survives restarts and is shared by workers
+Entries past their TTL but inside the stale window are served immediately while a
+background refresh regenerates them (stale-while-revalidate). During a brownout (see
+brownout.py) a miss is answered at once from an expired entry, or with no result so the
+caller serves its template, and the generation is queued in the background instead.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+CACHE_VERSION = 2  # bump when the roadmap prompt changes so old generations are not served
+MAX_ENTRIES = int(os.environ.get("ROADMAP_CACHE_SIZE", 512))
+TTL_S = float(os.environ.get("ROADMAP_CACHE_TTL_S", 24 * 3600))
+STALE_S = float(os.environ.get("ROADMAP_CACHE_STALE_S", 7 * 24 * 3600))
+DB_PATH = os.environ.get("ROADMAP_CACHE_DB", "").strip()
+DISK_MAX_ENTRIES = int(os.environ.get("ROADMAP_CACHE_DISK_SIZE", 10000))
+ENABLED = os.environ.get("ROADMAP_CACHE", "1") == "1"
+
+HIT = "HIT"
+STALE = "STALE"
+MISS = "MISS"
+BYPASS = "BYPASS"
+EXPIRED = "EXPIRED"  # past the stale window, served during a brownout
+BROWNOUT = "BROWNOUT"  # nothing cached, generation skipped during a brownout
+
+
+def _norm(value) -> str:
+    return " ".join(str(value or "").split()).lower()
+
+
+def normalize_params(domain, proficiency_level="", professional_goal="", current_status="", start_unit=1, count=3) -> dict:
+    """Canonical form of the generation parameters (case and whitespace insensitive)."""
+    return {
+        "domain": _norm(domain),
+        "proficiency_level": _norm(proficiency_level),
+        "professional_goal": _norm(professional_goal),
+        "current_status": _norm(current_status),
+        "start_unit": int(start_unit),
+        "count": int(count),
+    }
+
+
+def cache_key(params: dict) -> str:
+    blob = json.dumps({"v": CACHE_VERSION, **params}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-backed tier; one short-lived connection per operation so it is safe across threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS roadmap_cache (
+                    key TEXT PRIMARY KEY,
+                    params TEXT,
+                    value TEXT,
+                    created_at REAL,
+                    last_access REAL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_roadmap_cache_access ON roadmap_cache(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT params, value, created_at FROM roadmap_cache WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute("UPDATE roadmap_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        if not row:
+            return None
+        return {"params": json.loads(row[0]), "value": json.loads(row[1]), "created_at": row[2]}
+
+    def put(self, key, params, value, created_at):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO roadmap_cache (key, params, value, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(params), json.dumps(value), created_at, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM roadmap_cache WHERE key IN (SELECT key FROM roadmap_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (DISK_MAX_ENTRIES,),
+            )
+
+    def delete(self, key=None):
+        with self._connect() as conn:
+            if key is None:
+                return conn.execute("DELETE FROM roadmap_cache").rowcount
+            return conn.execute("DELETE FROM roadmap_cache WHERE key = ?", (key,)).rowcount
+
+    def entries(self, limit=100):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, params, created_at, last_access FROM roadmap_cache ORDER BY last_access DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"key": r[0], "params": json.loads(r[1]), "created_at": r[2], "last_access": r[3]} for r in rows]
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM roadmap_cache").fetchone()[0]
+
+
+class RoadmapCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl_s=TTL_S, stale_s=STALE_S, db_path=DB_PATH):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.stale_s = stale_s
+        self._mem = OrderedDict()  # key -> {"params", "value", "created_at"}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "disk_hits": 0, "refreshes": 0, "evictions": 0}
+        self._disk = None
+        if db_path:
+            try:
+                self._disk = _DiskTier(db_path)
+            except Exception as e:
+                print(f"[AI] Roadmap cache: disk tier disabled ({e})")
+
+    def _put_mem(self, key, entry):
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                return entry
+        if self._disk is not None:
+            try:
+                entry = self._disk.get(key)
+            except Exception as e:
+                print(f"[AI] Roadmap cache disk read failed: {e}")
+                entry = None
+            if entry is not None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                self._put_mem(key, entry)
+                return entry
+        return None
+
+    def store(self, params, value):
+        key = cache_key(params)
+        entry = {"params": params, "value": value, "created_at": time.time()}
+        self._put_mem(key, entry)
+        if self._disk is not None:
+            try:
+                self._disk.put(key, params, value, entry["created_at"])
+            except Exception as e:
+                print(f"[AI] Roadmap cache disk write failed: {e}")
+        return key
+
+    def _refresh_async(self, key, params, generate):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self.stats["refreshes"] += 1
+
+        def run():
+            try:
+                value = generate(params)
+                if value and value.get("units"):
+                    self.store(params, value)
+            except Exception as e:
+                print(f"[AI] Roadmap cache refresh failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True, name="roadmap-cache-refresh").start()
+
+    def lookup(self, params: dict, generate):
+        """(value, HIT|STALE) for a usable entry, else None (counted as a miss). generate refreshes stale entries."""
+        key = cache_key(params)
+        entry = self._lookup(key)
+        if entry is not None:
+            age = time.time() - entry["created_at"]
+            if age <= self.ttl_s:
+                with self._lock:
+                    self.stats["hits"] += 1
+                return entry["value"], HIT
+            if age <= self.ttl_s + self.stale_s:
+                with self._lock:
+                    self.stats["stale_hits"] += 1
+                self._refresh_async(key, params, generate)
+                return entry["value"], STALE
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def peek(self, params: dict):
+        """Stored value for params whatever its age (None if absent); not counted in the stats."""
+        entry = self._lookup(cache_key(params))
+        return entry["value"] if entry is not None else None
+
+    def evict(self, key=None):
+        """Remove one entry by key, or everything when key is None. Returns number removed."""
+        with self._lock:
+            if key is None:
+                removed = len(self._mem)
+                self._mem.clear()
+            else:
+                removed = 1 if self._mem.pop(key, None) is not None else 0
+        if self._disk is not None:
+            try:
+                removed = max(removed, self._disk.delete(key))
+            except Exception as e:
+                print(f"[AI] Roadmap cache disk delete failed: {e}")
+        return removed
+
+    def describe(self, limit=100) -> dict:
+        now = time.time()
+        with self._lock:
+            mem = [
+                {"key": k, "params": e["params"], "age_s": round(now - e["created_at"], 1), "units": len(e["value"].get("units") or [])}
+                for k, e in reversed(self._mem.items())
+            ][:limit]
+            stats = dict(self.stats)
+            size = len(self._mem)
+        out = {"stats": stats, "memory": {"size": size, "max_entries": self.max_entries, "entries": mem},
+               "ttl_s": self.ttl_s, "stale_s": self.stale_s, "disk": None}
+        if self._disk is not None:
+            try:
+                out["disk"] = {"path": self._disk.path, "size": self._disk.count(), "entries": self._disk.entries(limit)}
+            except Exception as e:
+                out["disk"] = {"path": self._disk.path, "error": str(e)}
+        return out
+
+
+cache = RoadmapCache()
+
+
+def _degraded(params, generate):
+    """Brownout answer for a miss: (expired value or None, status), with an AI generation queued to upgrade the entry."""
+    from brownout import brownout
+    if params is None:
+        brownout.count("degraded")
+        return None, BROWNOUT
+
+    def upgrade():
+        from llm_client import background_calls
+        # Background calls never queue for a provider slot, so upgrades only use spare capacity
+        with background_calls():
+            value = generate(params)
+        if value and value.get("units"):
+            cache.store(params, value)
+            return True
+        return False
+
+    brownout.upgrade(cache_key(params), upgrade)
+    value = cache.peek(params)
+    brownout.count("served_cached" if value is not None else "degraded")
+    return value, EXPIRED if value is not None else BROWNOUT
+
+
+def get_roadmap(domain, proficiency_level="", professional_goal="", current_status="", start_unit=1, count=3, hedge=None, fanout=None, degrade=True):
+    """
+    Cached generate_roadmap_via_ai. Returns (result_or_None, cache_status): HIT, STALE (served
+    while refreshing in background), MISS (generated now; only non-empty results are cached),
+    or during a brownout EXPIRED / BROWNOUT (None: serve the template). degrade=False always
+    generates on a miss (async jobs, where nobody is waiting on the response).
+    """
+    from brownout import brownout
+    from llm_client import generate_roadmap_via_ai
+
+    def generate(_params):
+        return generate_roadmap_via_ai(domain, proficiency_level, professional_goal, current_status,
+                                       start_unit=start_unit, count=count, hedge=hedge, fanout=fanout)
+
+    params = None
+    if ENABLED:
+        params = normalize_params(domain, proficiency_level, professional_goal, current_status, start_unit, count)
+        cached = cache.lookup(params, generate)
+        if cached is not None:
+            return cached
+    if degrade and brownout.active():
+        return _degraded(params, generate)
+    with brownout.track(interactive=degrade):
+        value = generate(params)
+    if not ENABLED:
+        return value, BYPASS
+    if value and value.get("units"):
+        cache.store(params, value)
+    return value, MISS
+
+
+async def aget_roadmap(domain, proficiency_level="", professional_goal="", current_status="", start_unit=1, count=3):
+    """get_roadmap for the ASGI path: misses are generated with llm_async (stale refreshes and upgrades still use a thread)."""
+    from brownout import brownout
+    from llm_async import generate_roadmap_via_ai_async
+    from llm_client import generate_roadmap_via_ai
+    args = (domain, proficiency_level, professional_goal, current_status)
+
+    def generate(_params):
+        return generate_roadmap_via_ai(*args, start_unit=start_unit, count=count)
+
+    params = None
+    if ENABLED:
+        params = normalize_params(*args, start_unit, count)
+        cached = cache.lookup(params, generate)
+        if cached is not None:
+            return cached
+    if brownout.active():
+        return _degraded(params, generate)
+    with brownout.track():
+        value = await generate_roadmap_via_ai_async(*args, start_unit=start_unit, count=count)
+    if not ENABLED:
+        return value, BYPASS
+    if value and value.get("units"):
+        cache.store(params, value)
+    return value, MISS
+
+
+def warm(requests_list) -> list:
+    """Generate and store entries for a list of parameter dicts (used by the admin warm endpoint)."""
+    from llm_client import generate_roadmap_via_ai
+    keys = []
+    for r in requests_list:
+        domain = (r.get("domain") or "General").strip()
+        args = (domain, r.get("proficiency_level", ""), r.get("professional_goal", ""), r.get("current_status", ""))
+        start_unit, count = int(r.get("start_unit", 1)), int(r.get("count", 8))
+        value = generate_roadmap_via_ai(*args, start_unit=start_unit, count=count)
+        if value and value.get("units"):
+            keys.append(cache.store(normalize_params(*args, start_unit, count), value))
+    return keys
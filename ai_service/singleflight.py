@@ -0,0 +1,235 @@
+"""
+Single-flight coalescing for identical in-flight LLM generations.
+When many identical requests arrive together (e.g. a cohort onboarding to the same
+domain), only the first caller runs the provider call; later callers with the same
+normalized prompt wait for that result instead of starting their own generation.
+
+Within a worker this uses threading primitives. With SINGLEFLIGHT_DB set, a SQLite
+lease table also coalesces across gunicorn workers on the same host: the worker holding
+the lease publishes its result, and other workers poll for it until the lease expires.
+
+Waiting callers give up when their request deadline runs out (deadline.Exceeded) and never
+wait longer than SINGLEFLIGHT_LEASE_S; past the lease without a deadline they run fn() themselves.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import deadline as _deadline
+
+ENABLED = os.environ.get("LLM_SINGLEFLIGHT", "1") == "1"
+DB_PATH = os.environ.get("SINGLEFLIGHT_DB", "").strip()
+LEASE_S = float(os.environ.get("SINGLEFLIGHT_LEASE_S", 180))
+RESULT_TTL_S = float(os.environ.get("SINGLEFLIGHT_RESULT_TTL_S", 30))
+POLL_S = 0.1
+
+_MISSING = object()
+
+
+def wait_s(deadline: float | None) -> float:
+    """How long a caller may wait for another's result: until its deadline, at most LEASE_S."""
+    left = _deadline.remaining(deadline)
+    return LEASE_S if left is None else max(0.0, min(left, LEASE_S))
+
+
+def prompt_key(prompt: str) -> str:
+    """Key for a prompt, insensitive to whitespace differences."""
+    return hashlib.sha256(" ".join((prompt or "").split()).encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _LeaseStore:
+    """Cross-process leases and published results in a local SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_singleflight (key TEXT PRIMARY KEY, owner TEXT, expires_at REAL, result TEXT, done_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def acquire(self, key: str):
+        """Return ("leader", None), ("done", result) or ("follower", None)."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT owner, expires_at, done_at, result FROM llm_singleflight WHERE key = ?", (key,)).fetchone()
+                if row and row[2] is not None and now - row[2] <= RESULT_TTL_S:
+                    return "done", row[3]
+                if row and row[2] is None and row[1] > now and row[0] != self.owner:
+                    return "follower", None
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_singleflight (key, owner, expires_at, result, done_at) VALUES (?, ?, ?, NULL, NULL)",
+                    (key, self.owner, now + LEASE_S),
+                )
+                # Opportunistic cleanup of old rows
+                conn.execute("DELETE FROM llm_singleflight WHERE done_at IS NOT NULL AND done_at < ?", (now - RESULT_TTL_S,))
+                return "leader", None
+            finally:
+                conn.execute("COMMIT")
+
+    def publish(self, key: str, result):
+        """Share a result with other workers; a failed call (None) just releases the lease."""
+        with self._connect() as conn:
+            if result is None:
+                conn.execute("DELETE FROM llm_singleflight WHERE key = ? AND done_at IS NULL", (key,))
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_singleflight (key, owner, expires_at, result, done_at) VALUES (?, ?, ?, ?, ?)",
+                (key, self.owner, time.time(), result, time.time()),
+            )
+
+    def wait(self, key: str, timeout: float):
+        """Poll for another worker's result; _MISSING if the lease expired or timed out."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._connect() as conn:
+                row = conn.execute("SELECT expires_at, done_at, result FROM llm_singleflight WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is None and row[0] <= time.time()):
+                return _MISSING
+            if row[1] is not None:
+                return row[2]
+            time.sleep(POLL_S)
+        return _MISSING
+
+
+class SingleFlight:
+    def __init__(self, db_path: str = DB_PATH):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "coalesced_waiters": 0, "cross_process_waits": 0, "cross_process_hits": 0,
+                      "wait_timeouts": 0, "attached": 0}
+        self._leases = None
+        if db_path:
+            try:
+                self._leases = _LeaseStore(db_path)
+            except Exception as e:
+                print(f"[AI] Single-flight: cross-worker leases disabled ({e})")
+
+    def do(self, key: str, fn, deadline: float | None = None):
+        """
+        Run fn() once per key at a time; concurrent callers with the same key share its result
+        (or exception). A caller waiting on another raises deadline.Exceeded once its own
+        deadline (absolute time.monotonic()) leaves no time for a call.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["coalesced_waiters"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats["leaders"] += 1
+                leader = True
+        if not leader:
+            if not call.done.wait(wait_s(deadline)):
+                self._timed_out(deadline)
+                return fn()  # the leader outlived its lease: generate independently
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._run_leader(key, fn, deadline)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def attach(self, key: str, deadline: float | None = None):
+        """
+        Wait for a call already in flight under key in this worker and return its result; None
+        when there is none, it failed, or it outlasted this caller's wait (see wait_s). Never
+        starts a call itself.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                return None
+            call.waiters += 1
+            self.stats["attached"] += 1
+        if not call.done.wait(wait_s(deadline)):
+            with self._lock:
+                self.stats["wait_timeouts"] += 1
+            return None
+        return call.result if call.error is None else None
+
+    def _timed_out(self, deadline: float | None):
+        with self._lock:
+            self.stats["wait_timeouts"] += 1
+        if _deadline.exhausted(deadline):
+            raise _deadline.Exceeded("request deadline reached waiting for an identical call")
+
+    def _run_leader(self, key: str, fn, deadline: float | None = None):
+        if self._leases is None:
+            return fn()
+        try:
+            state, result = self._leases.acquire(key)
+        except Exception as e:
+            print(f"[AI] Single-flight lease error: {e}")
+            return fn()
+        if state == "done":
+            with self._lock:
+                self.stats["cross_process_hits"] += 1
+            return result
+        if state == "follower":
+            with self._lock:
+                self.stats["cross_process_waits"] += 1
+            result = self._leases.wait(key, wait_s(deadline))
+            if result is not _MISSING:
+                with self._lock:
+                    self.stats["cross_process_hits"] += 1
+                return result
+            if _deadline.exhausted(deadline):
+                self._timed_out(deadline)
+        result = None
+        try:
+            result = fn()
+        finally:
+            self._publish(key, result)
+        return result
+
+    def _publish(self, key: str, result):
+        try:
+            self._leases.publish(key, result)
+        except Exception as e:
+            print(f"[AI] Single-flight publish error: {e}")
+
+    def describe(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": ENABLED,
+                "cross_process": self._leases is not None,
+                "in_flight": len(self._calls),
+                "waiting": sum(c.waiters for c in self._calls.values()),
+                **self.stats,
+            }
+
+
+flight = SingleFlight()
@@ -0,0 +1,12 @@
+"""
+Small statistics helpers for the latency figures the service reports and acts on.
+"""
+
+
+def percentile(values, p, ndigits=2):
+    """The p-quantile (0-1) of values by nearest rank; rounded to ndigits unless that is None."""
+    if not values:
+        return None
+    values = sorted(values)
+    value = values[min(len(values) - 1, int(len(values) * p))]
+    return value if ndigits is None else round(value, ndigits)
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Local stub LLM provider for benchmarks and offline testing.
+
+Answers the request shapes llm_client sends, both blocking and streaming (SSE):
+  POST .../chat/completions                    OpenAI-compatible (OpenAI, Groq, Hugging Face)
+  POST .../models/<model>:generateContent      Gemini (:streamGenerateContent?alt=sse when streaming)
+  POST .../v2/chat                             Cohere v2
+  POST .../v1/messages                         Anthropic
+  GET  /stats                                  request counts per shape and outcome
+
+Roadmap, outline, chapter and unit-repair prompts get well-formed JSON for what they ask for;
+anything else gets a short chat answer. Latency, HTTP error rate and malformed-JSON rate
+are configurable. Point the service at it with LLM_BASE_URL_<PROVIDER>, e.g.
+
+    python stub_llm_server.py --port 8900 --latency-ms 800 --latency-dist lognormal --error-rate 0.05
+    LLM_BASE_URL_OPENAI=http://127.0.0.1:8900 OPENAI_API_KEY=stub python application.py
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(self, latency_ms=500.0, latency_dist="fixed", latency_sigma=0.5, error_rate=0.0,
+                 error_status=500, malformed_rate=0.0, chunk_ms=5.0, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.chunk_ms = chunk_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self):
+        """(latency_s, fail, malformed) for one request."""
+        with self._lock:
+            r = self._random
+            if self.latency_dist == "uniform":
+                ms = r.uniform(0, 2 * self.latency_ms)
+            elif self.latency_dist == "exponential":
+                ms = r.expovariate(1 / self.latency_ms) if self.latency_ms > 0 else 0
+            elif self.latency_dist == "lognormal":
+                # latency_ms is the median
+                ms = self.latency_ms * r.lognormvariate(0, self.latency_sigma)
+            else:
+                ms = self.latency_ms
+            return ms / 1000, r.random() < self.error_rate, r.random() < self.malformed_rate
+
+
+# ---------- Synthetic content ----------
+
+def _unit(n, topic):
+    level = ["beginner", "intermediate", "advanced"][(n - 1) % 3]
+    return {
+        "unit_number": n,
+        "title": f"{topic} chapter {n}: core concept {n}",
+        "level": level,
+        "tasks": [{"task_id": f"u{n}_t{t}", "task_name": f"Practice {topic} skill {n}.{t}"} for t in range(1, 5)],
+        "mcqs": [
+            {
+                "question": f"Which statement about {topic} concept {n}.{q} is correct?",
+                "options": [f"Correct {n}.{q}", f"Wrong A {n}.{q}", f"Wrong B {n}.{q}", f"Wrong C {n}.{q}"],
+                "correctIndex": 0,
+            }
+            for q in range(1, 5)
+        ],
+    }
+
+
+def completion_text(prompt):
+    """Model output for a prompt: roadmap/outline/chapter JSON, or a chat answer."""
+    topic_match = re.search(r'"([^"]{1,80})"', prompt)
+    topic = topic_match.group(1) if topic_match else "General"
+    repair = re.search(r"Chapter (\d+) .* is incomplete", prompt)
+    if repair:
+        n = int(repair.group(1))
+        unit = _unit(n, topic)
+        return json.dumps({"tasks": [{"task_name": f"Extra {t['task_name']}"} for t in unit["tasks"]],
+                           "mcqs": [{**m, "question": f"Follow-up: {m['question']}"} for m in unit["mcqs"]]})
+    only = re.search(r"Write ONLY chapters ([\d,\s]+)\.", prompt)
+    span = re.search(r"chapters (\d+) through (\d+)", prompt)
+    if only:
+        numbers = [int(x) for x in re.findall(r"\d+", only.group(1))]
+    elif span:
+        numbers = list(range(int(span.group(1)), int(span.group(2)) + 1))
+    else:
+        return f"Here is some guidance about {topic}. Start with the fundamentals, practise daily and build a small project."
+    if '{"chapters":' in prompt:
+        return json.dumps({"chapters": [{"unit_number": n, "title": f"{topic} chapter {n}"} for n in numbers]})
+    return json.dumps({"units": [_unit(n, topic) for n in numbers]})
+
+
+def malformed(text):
+    """Truncate JSON mid-object, as a model hitting max_tokens would."""
+    return text[: max(1, len(text) * 2 // 3)] if text.lstrip().startswith("{") else text + ' {"units": ['
+
+
+def _prompt_of(shape, body):
+    if shape == "gemini":
+        parts = ((body.get("contents") or [{}])[0].get("parts") or [{}])
+        return parts[0].get("text", "")
+    messages = body.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    if isinstance(content, list):
+        content = " ".join(b.get("text", "") for b in content if isinstance(b, dict))
+    return content
+
+
+def _envelope(shape, text, tool=None):
+    if shape == "gemini":
+        return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}]}
+    if shape == "cohere":
+        return {"message": {"role": "assistant", "content": [{"type": "text", "text": text}]}, "finish_reason": "COMPLETE"}
+    if shape == "anthropic":
+        if tool:
+            # Forced tool call (structured output): the JSON arrives as the tool input
+            try:
+                return {"type": "message", "role": "assistant", "stop_reason": "tool_use",
+                        "content": [{"type": "tool_use", "id": "toolu_stub", "name": tool, "input": json.loads(text)}]}
+            except ValueError:
+                pass
+        return {"type": "message", "role": "assistant", "content": [{"type": "text", "text": text}], "stop_reason": "end_turn"}
+    return {"choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]}
+
+
+def _stream_events(shape, text, pieces=20):
+    step = max(1, len(text) // pieces)
+    chunks = [text[i : i + step] for i in range(0, len(text), step)]
+    for chunk in chunks:
+        if shape == "gemini":
+            yield {"candidates": [{"content": {"parts": [{"text": chunk}], "role": "model"}}]}
+        elif shape == "cohere":
+            yield {"type": "content-delta", "index": 0, "delta": {"message": {"content": {"text": chunk}}}}
+        elif shape == "anthropic":
+            yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}}
+        else:
+            yield {"choices": [{"index": 0, "delta": {"content": chunk}}]}
+    if shape == "anthropic":
+        yield {"type": "message_stop"}
+    elif shape == "cohere":
+        yield {"type": "message-end"}
+
+
+def _shape_of(path):
+    if path.endswith("/chat/completions"):
+        return "openai"
+    if ":generateContent" in path or ":streamGenerateContent" in path:
+        return "gemini"
+    if path.endswith("/v2/chat"):
+        return "cohere"
+    if path.endswith("/v1/messages"):
+        return "anthropic"
+    return None
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = StubConfig()
+    stats = {}
+    stats_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            with self.stats_lock:
+                return self._send_json(200, dict(self.stats))
+        self._send_json(404, {"error": "not found"})
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = self.path.split("?")[0]
+        shape = _shape_of(path)
+        if shape is None:
+            return self._send_json(404, {"error": f"unknown endpoint {path}"})
+        streaming = bool(body.get("stream")) or ":streamGenerateContent" in path
+        latency_s, fail, bad = self.config.roll()
+        time.sleep(latency_s)
+        if fail:
+            self._count(f"{shape}.error")
+            return self._send_json(self.config.error_status, {"error": {"message": "stub injected failure"}})
+        text = completion_text(_prompt_of(shape, body))
+        if bad:
+            text = malformed(text)
+        self._count(f"{shape}.{'malformed' if bad else 'ok'}{'.stream' if streaming else ''}")
+        if not streaming:
+            tool = (body.get("tool_choice") or {}).get("name") if shape == "anthropic" else None
+            return self._send_json(200, _envelope(shape, text, tool))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event in _stream_events(shape, text):
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+            if self.config.chunk_ms:
+                time.sleep(self.config.chunk_ms / 1000)
+        if shape == "openai":
+            self.wfile.write(b"data: [DONE]\n\n")
+
+
+def make_server(config, host="127.0.0.1", port=0):
+    """Threaded stub server (call serve_forever()); port 0 picks a free port."""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config, "stats": {}})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=500.0, help="Fixed latency, or mean (uniform/exponential) / median (lognormal)")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="fixed")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal shape parameter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of 200 responses with truncated JSON content")
+    parser.add_argument("--chunk-ms", type=float, default=5.0, help="Delay between streamed chunks")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency_ms, args.latency_dist, args.latency_sigma, args.error_rate,
+                        args.error_status, args.malformed_rate, args.chunk_ms, args.seed)
+    server = make_server(config, args.host, args.port)
+    print(f"Stub LLM server on http://{args.host}:{server.server_port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
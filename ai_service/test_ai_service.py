@@ -8,9 +8,9 @@ import json
 BASE_URL = "http://localhost:5001"
 
 def test_health_endpoint():
-    """Test the root health endpoint"""
+    """Test the health endpoint"""
     try:
-        response = requests.get(f"{BASE_URL}/")
+        response = requests.get(f"{BASE_URL}/health")
         print(f"✅ Health Check ({response.status_code}):")
         print(json.dumps(response.json(), indent=2))
         return True
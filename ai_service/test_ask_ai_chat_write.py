@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+/ask_ai must not report success when the chat exchange could not be stored.
+
+    python -m pytest -q test_ask_ai_chat_write.py
+"""
+import free_ai_service
+
+
+def _ask(monkeypatch, stored):
+    submitted = []
+
+    def submit(*row):
+        submitted.append(row)
+        return stored
+
+    monkeypatch.setattr(free_ai_service, "get_free_ai_response", lambda question, engine: "an answer")
+    monkeypatch.setattr(free_ai_service, "get_learning_resources", lambda question: [])
+    monkeypatch.setattr(free_ai_service.chat_writer, "submit", submit)
+    resp = free_ai_service.app.test_client().post("/ask_ai", json={"question": "how do I learn design", "uid": "u1"})
+    assert submitted == [("u1", "how do I learn design", "an answer", "fallback")]
+    return resp
+
+
+def test_stored_chat_returns_the_answer(monkeypatch):
+    resp = _ask(monkeypatch, stored=True)
+    assert resp.status_code == 200
+    assert resp.get_json() == {"answer": "an answer"}
+
+
+def test_failed_chat_write_is_an_error(monkeypatch):
+    resp = _ask(monkeypatch, stored=False)
+    assert resp.status_code == 500
+    assert resp.get_json()["error"].startswith("Database Error")
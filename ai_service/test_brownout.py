@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Brownout controller: slow interactive generations trip it, and it recovers once their
+samples age out, even while background upgrades are still slow.
+
+    python -m pytest -q test_brownout.py
+"""
+import brownout
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _controller(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(brownout, "ENABLED", True)
+    monkeypatch.setattr(brownout, "FORCE", False)
+    monkeypatch.setattr(brownout, "P95_MS", 1000.0)
+    monkeypatch.setattr(brownout, "MIN_SAMPLES", 3)
+    monkeypatch.setattr(brownout, "WINDOW_S", 60.0)
+    monkeypatch.setattr(brownout, "HOLD_S", 30.0)
+    monkeypatch.setattr(brownout, "_waiting_for_slots", lambda: 0)
+    monkeypatch.setattr(brownout, "time", clock)
+    return brownout.BrownoutController(), clock
+
+
+def _generation(controller, clock, ms, interactive=True):
+    with controller.track(interactive=interactive):
+        clock.now += ms / 1000
+
+
+def test_slow_generations_trip_brownout_and_it_recovers(monkeypatch):
+    controller, clock = _controller(monkeypatch)
+    for _ in range(3):
+        _generation(controller, clock, 200)
+    assert not controller.active()
+
+    for _ in range(3):
+        _generation(controller, clock, 5000)
+    assert controller.active()
+    assert controller.stats["entered"] == 1
+
+    # Background upgrades keep running slow; they must not hold the brownout up
+    clock.now += 61
+    for _ in range(5):
+        _generation(controller, clock, 5000, interactive=False)
+    assert not controller.active()
+    assert controller.describe()["samples"] == 0
+
+
+def test_brownout_holds_for_its_minimum_duration(monkeypatch):
+    controller, clock = _controller(monkeypatch)
+    for _ in range(3):
+        _generation(controller, clock, 5000)
+    assert controller.active()
+    for _ in range(60):
+        _generation(controller, clock, 100)
+    assert controller.active()  # p95 is back down, but HOLD_S has not passed
+    clock.now += 31
+    assert not controller.active()
+
+
+def test_queue_depth_trips_brownout(monkeypatch):
+    controller, _ = _controller(monkeypatch)
+    monkeypatch.setattr(brownout, "_waiting_for_slots", lambda: brownout.MAX_QUEUE + 1)
+    assert controller.active()
+    assert controller.describe()["reason"].startswith("queue depth")
+
+
+def test_disabled_controller_never_degrades(monkeypatch):
+    controller, clock = _controller(monkeypatch)
+    monkeypatch.setattr(brownout, "ENABLED", False)
+    for _ in range(5):
+        _generation(controller, clock, 5000)
+    assert not controller.active()
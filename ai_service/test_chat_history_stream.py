@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+/get_chat_history streams its JSON body; a database failure part way through must still
+end in valid JSON that says the history is incomplete, not a truncated document.
+
+    python -m pytest -q test_chat_history_stream.py
+"""
+import json
+from datetime import datetime
+
+import pytest
+
+import free_ai_service
+import repository
+
+
+def _chat(i):
+    return {"id": i, "question": f"q{i}", "answer": f"a{i}", "engine": "test", "timestamp": datetime(2025, 1, 1)}
+
+
+class _History:
+    def __init__(self, rows, fail_after):
+        self.rows, self.fail_after = rows, fail_after
+
+    def page(self, uid, before=None, after=None, limit=None):
+        for n, row in enumerate(self.rows):
+            if n == self.fail_after:
+                raise repository.PoolTimeout("connection lost")
+            yield row
+
+
+class _Repo:
+    def __init__(self, history):
+        self.chat_history = history
+
+
+def _get(monkeypatch, rows, fail_after=None):
+    monkeypatch.setattr(free_ai_service, "get_repository", lambda: _Repo(_History(rows, fail_after)))
+    monkeypatch.setattr(free_ai_service, "CHAT_HISTORY_CHUNK_BYTES", 64)  # several chunks before the failure
+    return free_ai_service.app.test_client().get("/get_chat_history?uid=u1")
+
+
+def test_complete_history(monkeypatch):
+    resp = _get(monkeypatch, [_chat(i) for i in range(1, 6)])
+    body = json.loads(resp.get_data(as_text=True))
+    assert resp.status_code == 200
+    assert len(body["chat_history"]) == 10
+    assert "error" not in body
+    assert (body["next_before"], body["next_after"]) == (1, 5)
+
+
+def test_failure_mid_stream_ends_in_valid_json(monkeypatch):
+    resp = _get(monkeypatch, [_chat(i) for i in range(1, 6)], fail_after=3)
+    body = json.loads(resp.get_data(as_text=True))  # must still parse
+    assert resp.status_code == 200  # headers were already sent
+    assert "incomplete" in body["error"]
+    assert [e["id"] for e in body["chat_history"] if e["type"] == "user"] == [1, 2, 3]
+    assert body["next_after"] == 3  # where a retry resumes
+
+
+def test_failure_before_first_row_is_an_error_response(monkeypatch):
+    resp = _get(monkeypatch, [_chat(1)], fail_after=0)
+    assert resp.status_code == 500
+
+
+def test_sqlite_stream_raises_instead_of_ending_early():
+    repo = repository.open_repository("sqlite://", init_schema=True)
+    try:
+        with pytest.raises(repository.sqlite3.Error):
+            list(repo.driver.stream("SELECT * FROM no_such_table"))
+    finally:
+        repo.close()
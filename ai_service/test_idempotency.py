@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key handling on the native ASGI routes: concurrent retries with one key share
+a single run without tying up the event loop, and different keys still run in parallel.
+
+    python -m pytest -q test_idempotency.py
+"""
+import asyncio
+import time
+
+import httpx
+
+import asgi
+import idempotency
+
+HANDLER_S = 0.3
+
+
+def _client():
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.app), base_url="http://test")
+
+
+def _slow_handler(calls):
+    async def handler(data):
+        calls.append(data)
+        await asyncio.sleep(HANDLER_S)
+        return 200, {"answer": f"run {len(calls)}"}, {"X-Cache": "MISS"}
+    return handler
+
+
+def _setup(monkeypatch):
+    calls = []
+    monkeypatch.setitem(asgi.NATIVE_ROUTES, "/ask_ai", _slow_handler(calls))
+    monkeypatch.setattr(idempotency, "store", idempotency.IdempotencyStore(db_path=""))
+    return calls
+
+
+def test_concurrent_requests_with_one_key_run_once(monkeypatch):
+    calls = _setup(monkeypatch)
+
+    async def main():
+        async with _client() as client:
+            return await asyncio.gather(*[
+                client.post("/ask_ai", json={"question": "q"}, headers={"Idempotency-Key": "k-1"})
+                for _ in range(10)
+            ])
+
+    responses = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(r.status_code == 200 for r in responses)
+    assert {r.json()["answer"] for r in responses} == {"run 1"}
+    assert sum(r.headers.get("Idempotent-Replayed") == "true" for r in responses) == 9
+    assert all(r.headers["X-Cache"] == "MISS" for r in responses)
+
+
+def test_distinct_keys_are_not_serialized(monkeypatch):
+    calls = _setup(monkeypatch)
+
+    async def main():
+        async with _client() as client:
+            return await asyncio.gather(*[
+                client.post("/ask_ai", json={"question": "q"}, headers={"Idempotency-Key": f"k-{i}"})
+                for i in range(8)
+            ])
+
+    start = time.monotonic()
+    responses = asyncio.run(main())
+    elapsed = time.monotonic() - start
+    assert len(calls) == 8
+    assert all(r.status_code == 200 and "Idempotent-Replayed" not in r.headers for r in responses)
+    assert elapsed < HANDLER_S * 3  # one after another would take 8 x HANDLER_S
+
+
+def test_key_reused_with_another_body_is_rejected(monkeypatch):
+    _setup(monkeypatch)
+
+    async def main():
+        async with _client() as client:
+            first = await client.post("/ask_ai", json={"question": "a"}, headers={"Idempotency-Key": "k-2"})
+            second = await client.post("/ask_ai", json={"question": "b"}, headers={"Idempotency-Key": "k-2"})
+            return first, second
+
+    first, second = asyncio.run(main())
+    assert first.status_code == 200
+    assert second.status_code == 422
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Async job queue: importing the app starts no job workers; once started, a submitted job
+runs and its status is visible at /jobs/<id> and /llm/jobs.
+
+    python -m pytest -q test_jobs.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+import application
+import jobs
+
+
+def test_import_starts_no_workers(tmp_path):
+    db = tmp_path / "jobs.db"
+    code = ("import threading, application; "
+            "print(sorted(t.name for t in threading.enumerate() if t.name.startswith('job-worker')))")
+    out = subprocess.run([sys.executable, "-c", code], env={**os.environ, "JOBS_DB": str(db), "LLM_PREWARM": "0"},
+                         cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == "[]"
+    assert not db.exists()
+
+
+def test_submitted_job_runs_and_is_reported(monkeypatch, tmp_path):
+    queue = jobs.JobQueue(db_path=str(tmp_path / "jobs.db"))
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    monkeypatch.setattr(application, "_run_roadmap_job", lambda params: {"domain": params["domain"]})
+    assert application.start_job_queue()
+    client = application.app.test_client()
+
+    resp = client.post("/generate-roadmap?async=1", json={"domain": "Python"})
+    assert resp.status_code == 202
+    job_id = resp.get_json()["job_id"]
+    give_up = time.monotonic() + 10
+    while client.get(f"/jobs/{job_id}").get_json()["status"] != "done" and time.monotonic() < give_up:
+        time.sleep(0.05)
+    assert client.get(f"/jobs/{job_id}").get_json()["result"] == {"domain": "Python"}
+    stats = client.get("/llm/jobs").get_json()
+    assert stats["workers"] == jobs.WORKERS
+    assert stats["counts"] == {"done": 1}
+
+
+def test_async_request_is_refused_when_jobs_are_disabled(monkeypatch):
+    monkeypatch.setenv("JOBS_ENABLED", "0")
+    resp = application.app.test_client().post("/generate-roadmap?async=1", json={"domain": "Python"})
+    assert resp.status_code == 503
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+LLM JSON parsing: objects wrapped in prose or code fences, brackets inside strings, and the
+usual model defects (trailing commas, smart quotes, output cut off mid-unit), plus the
+streaming unit parser.
+
+    python -m pytest -q test_llm_json.py
+"""
+import json
+
+import pytest
+
+from llm_json import UnitStreamParser, extract_json, parse_json, repair_json
+
+UNIT_1 = {"unit_number": 1, "title": "Sets {and} [lists]", "tasks": [{"task_id": "u1_t1", "task_name": "Say \"hi\""}]}
+UNIT_2 = {"unit_number": 2, "title": "Functions", "tasks": []}
+ROADMAP = json.dumps({"units": [UNIT_1, UNIT_2]})
+
+
+def test_object_in_prose_and_code_fence():
+    text = f"Here is your roadmap:\n```json\n{ROADMAP}\n```\nGood luck!"
+    assert parse_json(text) == {"units": [UNIT_1, UNIT_2]}
+    assert extract_json(text) == ROADMAP
+
+
+def test_trailing_commas_are_removed_but_not_inside_strings():
+    text = '{"units": [{"unit_number": 1, "title": "a, ]", "tasks": [],},],}'
+    assert parse_json(text) == {"units": [{"unit_number": 1, "title": "a, ]", "tasks": []}]}
+
+
+def test_smart_quotes_are_straightened():
+    text = "{“units”: [{“unit_number”: 1}]}"
+    assert parse_json(text) == {"units": [{"unit_number": 1}]}
+
+
+def test_truncated_output_keeps_complete_units():
+    cut = ROADMAP[: ROADMAP.index('"Functions"') + 4]  # stops inside the second unit's title
+    assert parse_json(cut) == {"units": [UNIT_1]}
+    assert repair_json(ROADMAP[: ROADMAP.rindex("]")]) == ROADMAP  # only the closing brackets missing
+
+
+def test_nothing_salvageable_raises():
+    with pytest.raises(json.JSONDecodeError):
+        parse_json("no JSON here")
+    with pytest.raises(json.JSONDecodeError):
+        parse_json('{"units": [{"unit_number": 1, "title": "cut')
+    assert repair_json('{"units": [{"unit_number": 1') is None
+
+
+def test_stream_parser_yields_units_as_they_complete():
+    parser = UnitStreamParser()
+    text = "Sure!\n" + ROADMAP
+    split = text.index('{"unit_number": 2')
+    units = []
+    for i in range(0, split, 7):
+        units += parser.feed(text[i:min(i + 7, split)])
+    assert units == [UNIT_1]
+    assert parser.feed(text[split:]) == [UNIT_2]
+    assert parser.errors == 0
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Provider routing: latency/success ranking and the per-provider circuit breaker
+(open after repeated failures, one half-open probe after the cooldown, backoff on a failed probe).
+
+    python -m pytest -q test_llm_router.py
+"""
+import llm_router
+
+CHAIN = ["huggingface", "gemini", "groq"]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _router(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_router, "time", clock)
+    monkeypatch.setattr(llm_router, "BREAKER_FAILURES", 3)
+    monkeypatch.setattr(llm_router, "BREAKER_COOLDOWN_S", 30.0)
+    monkeypatch.setattr(llm_router, "BREAKER_MAX_COOLDOWN_S", 300.0)
+    return llm_router.ProviderRouter(), clock
+
+
+def _fail(router, name, n=1):
+    for _ in range(n):
+        router.record_failure(name, "server_error", 100)
+
+
+def test_without_history_the_chain_order_is_kept(monkeypatch):
+    router, _ = _router(monkeypatch)
+    assert router.order(CHAIN) == CHAIN
+
+
+def test_faster_reliable_providers_rank_first(monkeypatch):
+    router, _ = _router(monkeypatch)
+    for _ in range(4):
+        router.record_success("huggingface", 3000)
+        router.record_success("gemini", 800)
+        router.record_success("groq", 400)
+    router.record_failure("groq", "timeout", 100)
+    router.record_failure("groq", "timeout", 100)
+    # Score is p50 / success rate: groq 400 / (4/6) = 600 still beats gemini's 800
+    assert router.order(CHAIN) == ["groq", "gemini", "huggingface"]
+    router.record_failure("groq", "rate_limited", 100)  # third in a row: breaker opens
+    assert router.order(CHAIN) == ["gemini", "huggingface"]
+
+
+def test_breaker_opens_probes_and_closes(monkeypatch):
+    router, clock = _router(monkeypatch)
+    _fail(router, "gemini", 2)
+    assert "gemini" in router.order(CHAIN)
+    _fail(router, "gemini")
+    assert "gemini" not in router.order(CHAIN)
+    assert router.snapshot(["gemini"])["gemini"]["state"] == llm_router.OPEN
+
+    clock.now += 31
+    assert "gemini" in router.order(CHAIN)  # claims the single half-open probe
+    assert "gemini" not in router.order(CHAIN)
+    router.release(["gemini"])  # the probe was never sent
+    assert "gemini" in router.order(CHAIN)
+    router.record_success("gemini", 500)
+    assert router.snapshot(["gemini"])["gemini"]["state"] == llm_router.CLOSED
+
+
+def test_failed_probe_reopens_with_a_longer_cooldown(monkeypatch):
+    router, clock = _router(monkeypatch)
+    _fail(router, "groq", 3)
+    clock.now += 31
+    assert "groq" in router.order(CHAIN)
+    _fail(router, "groq")
+    state = router.snapshot(["groq"])["groq"]
+    assert state["state"] == llm_router.OPEN
+    assert state["retry_in_s"] == 60.0
+    clock.now += 31
+    assert "groq" not in router.order(CHAIN)
+    clock.now += 30
+    assert "groq" in router.order(CHAIN)
+
+
+def test_classify_status():
+    assert llm_router.classify_status(200) is None
+    assert llm_router.classify_status(429) == "rate_limited"
+    assert llm_router.classify_status(503) == "server_error"
+    assert llm_router.classify_status(400) == "client_error"
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Pooled provider sessions: sequential calls to one provider reuse a single keep-alive
+connection, and the per-provider stats at /llm/connections reflect it.
+
+    python -m pytest -q test_llm_transport.py
+"""
+import threading
+
+import pytest
+
+import llm_client
+import llm_transport
+import stub_llm_server
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = stub_llm_server.make_server(stub_llm_server.StubConfig(latency_ms=0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("LLM_BASE_URL_GROQ", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(llm_transport, "_sessions", {})
+    monkeypatch.setattr(llm_transport, "_stats", {})
+    yield server
+    server.shutdown()
+
+
+def test_calls_reuse_one_connection(stub):
+    for i in range(5):
+        assert llm_client._call_groq(f"say hello {i}", "stub-key")
+    stats = llm_transport.connection_stats()["groq"]
+    assert stats["requests"] == 5
+    assert stats["errors"] == 0
+    assert stats["connections_opened"] == 1
+    assert stats["connection_reuse_ratio"] == 0.8
+
+
+def test_sessions_are_per_provider(stub):
+    assert llm_transport.get_session("groq") is llm_transport.get_session("groq")
+    assert llm_transport.get_session("groq") is not llm_transport.get_session("openai")
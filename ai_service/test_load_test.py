@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Smoke test for load_test.py: the in-process server and its fake provider must still
+produce real answers, so a change to the provider calling convention cannot silently
+turn the whole load test into template fallbacks. Also checks that the limiter sheds
+excess calls and that the server leaves the process settings as it found them.
+
+    python -m pytest -q test_load_test.py
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import llm_client
+import llm_transport
+import load_test
+
+
+def test_in_process_server_answers_from_fake_provider():
+    base_url, stop = load_test._start_local_server(latency_s=0.01, max_inflight=4, budget_s=1.0)
+    try:
+        for i in range(3):
+            resp = requests.post(f"{base_url}/ask_ai", json={"question": f"smoke test {i}"}, timeout=10)
+            assert resp.status_code == 200
+            assert resp.json()["answer"] == "ok"
+        # With a request deadline, as the backend sends it
+        resp = requests.post(f"{base_url}/ask_ai", json={"question": "smoke test deadline"},
+                             headers={"X-Request-Timeout-Ms": "10000"}, timeout=10)
+        assert resp.json()["answer"] == "ok"
+        assert load_test._ask(base_url, "smoke")[0] == 200
+    finally:
+        stop()
+
+
+def test_saturated_provider_sheds_with_retry_after():
+    base_url, stop = load_test._start_local_server(latency_s=0.5, max_inflight=1, budget_s=0.1)
+    try:
+        assert llm_transport.limiter.limit("groq") == 1
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            results = list(pool.map(lambda i: load_test._ask(base_url, f"shed {i}", timeout_s=10), range(6)))
+        statuses = [status for status, _, _ in results]
+        assert statuses.count(200) >= 1
+        assert statuses.count(503) >= 1
+        assert all(retry_after for status, _, retry_after in results if status == 503)
+    finally:
+        stop()
+
+
+def test_stop_restores_process_settings():
+    before = (llm_client._configured_providers, llm_transport.MAX_INFLIGHT, llm_transport.limiter)
+    env = {name: os.environ.get(name) for name in ("LLM_MAX_INFLIGHT", "LLM_QUEUE_BUDGET_S", "LLM_PREWARM", "JOBS_ENABLED")}
+    _, stop = load_test._start_local_server(latency_s=0.01, max_inflight=2, budget_s=0.5)
+    assert llm_transport.MAX_INFLIGHT == 2
+    stop()
+    assert (llm_client._configured_providers, llm_transport.MAX_INFLIGHT, llm_transport.limiter) == before
+    assert {name: os.environ.get(name) for name in env} == env
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Roadmap cache: normalized keys, fresh hits within the TTL, stale-while-revalidate past it,
+misses past the stale window, LRU eviction and the SQLite tier surviving a restart.
+
+    python -m pytest -q test_roadmap_cache.py
+"""
+import time
+
+import llm_client
+import roadmap_cache
+
+TTL_S = 100.0
+STALE_S = 50.0
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def _cache(monkeypatch, **kwargs):
+    clock = _Clock()
+    monkeypatch.setattr(roadmap_cache, "time", clock)
+    return roadmap_cache.RoadmapCache(**{"max_entries": 10, "ttl_s": TTL_S, "stale_s": STALE_S, "db_path": "", **kwargs}), clock
+
+
+def _params(domain="Python"):
+    return roadmap_cache.normalize_params(domain, "Beginner", "", "", 1, 3)
+
+
+def _roadmap(title):
+    return {"units": [{"unit_number": 1, "title": title}]}
+
+
+def _wait_for_refresh(cache):
+    give_up = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < give_up:
+        time.sleep(0.01)
+
+
+def test_keys_ignore_case_and_whitespace():
+    a = roadmap_cache.normalize_params("  Machine   Learning", "BEGINNER")
+    b = roadmap_cache.normalize_params("machine learning", "beginner ")
+    assert roadmap_cache.cache_key(a) == roadmap_cache.cache_key(b)
+    assert roadmap_cache.cache_key(a) != roadmap_cache.cache_key(roadmap_cache.normalize_params("machine learning", "advanced"))
+
+
+def test_fresh_stale_and_expired_entries(monkeypatch):
+    cache, clock = _cache(monkeypatch)
+    params = _params()
+    refreshed = []
+
+    def generate(p):
+        refreshed.append(p)
+        return _roadmap("new")
+
+    assert cache.lookup(params, generate) is None
+    cache.store(params, _roadmap("old"))
+    assert cache.lookup(params, generate) == (_roadmap("old"), roadmap_cache.HIT)
+
+    clock.now += TTL_S + 1
+    assert cache.lookup(params, generate) == (_roadmap("old"), roadmap_cache.STALE)
+    _wait_for_refresh(cache)
+    assert refreshed == [params]
+    assert cache.lookup(params, generate) == (_roadmap("new"), roadmap_cache.HIT)
+
+    clock.now += TTL_S + STALE_S + 1
+    assert cache.lookup(params, generate) is None
+    assert cache.peek(params) == _roadmap("new")  # still there for a brownout to serve
+    assert cache.stats == {**cache.stats, "hits": 2, "stale_hits": 1, "misses": 2, "refreshes": 1}
+
+
+def test_failed_refresh_keeps_serving_the_stale_entry(monkeypatch):
+    cache, clock = _cache(monkeypatch)
+    params = _params()
+    cache.store(params, _roadmap("old"))
+    clock.now += TTL_S + 1
+    assert cache.lookup(params, lambda p: None)[1] == roadmap_cache.STALE
+    _wait_for_refresh(cache)
+    assert cache.lookup(params, lambda p: None) == (_roadmap("old"), roadmap_cache.STALE)
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    cache, _ = _cache(monkeypatch, max_entries=2)
+    for domain in ("a", "b"):
+        cache.store(_params(domain), _roadmap(domain))
+    cache.lookup(_params("a"), None)
+    cache.store(_params("c"), _roadmap("c"))
+    assert cache.peek(_params("b")) is None
+    assert cache.peek(_params("a")) == _roadmap("a")
+    assert cache.stats["evictions"] == 1
+
+
+def test_disk_tier_survives_a_restart(monkeypatch, tmp_path):
+    db = str(tmp_path / "roadmap_cache.db")
+    cache, _ = _cache(monkeypatch, db_path=db)
+    cache.store(_params(), _roadmap("persisted"))
+    restarted, _ = _cache(monkeypatch, db_path=db)
+    assert restarted.lookup(_params(), None) == (_roadmap("persisted"), roadmap_cache.HIT)
+    assert restarted.stats["disk_hits"] == 1
+
+
+def test_get_roadmap_generates_once_then_hits(monkeypatch):
+    cache, _ = _cache(monkeypatch)
+    monkeypatch.setattr(roadmap_cache, "cache", cache)
+    monkeypatch.setattr(roadmap_cache, "ENABLED", True)
+    calls = []
+
+    def generate(*args, **kwargs):
+        calls.append(args)
+        return _roadmap("generated")
+
+    monkeypatch.setattr(llm_client, "generate_roadmap_via_ai", generate)
+    assert roadmap_cache.get_roadmap("Python", "beginner", degrade=False) == (_roadmap("generated"), roadmap_cache.MISS)
+    assert roadmap_cache.get_roadmap(" python ", "Beginner") == (_roadmap("generated"), roadmap_cache.HIT)
+    assert len(calls) == 1
@@ -1,7 +1,7 @@
 import requests
 import json
 
-url = "http://localhost:5001/generate_career_roadmap_direct"
+url = "http://localhost:5001/generate-roadmap"
 payload = {
     "domain": "Full Stack",
     "proficiency_level": "Beginner",
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing: identical concurrent calls share one run, interactive calls
+reuse an in-flight prefetch, and background calls never wait on interactive ones.
+
+    python -m pytest -q test_singleflight.py
+"""
+import threading
+import time
+
+import llm_client
+import singleflight
+
+
+def _slow(calls, result="answer", delay_s=0.2):
+    def fn():
+        calls.append(threading.current_thread().name)
+        time.sleep(delay_s)
+        return result
+    return fn
+
+
+def _run_concurrently(targets):
+    results = [None] * len(targets)
+
+    def runner(i, target):
+        results[i] = target()
+
+    threads = [threading.Thread(target=runner, args=(i, t)) for i, t in enumerate(targets)]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)  # the first one becomes the leader
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_identical_calls_share_one_run():
+    flight = singleflight.SingleFlight(db_path="")
+    calls = []
+    fn = _slow(calls)
+    results = _run_concurrently([lambda: flight.do("k", fn)] * 5)
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.describe()["coalesced_waiters"] == 4
+
+
+def test_waiters_share_the_leaders_error():
+    flight = singleflight.SingleFlight(db_path="")
+
+    def fail():
+        time.sleep(0.1)
+        raise RuntimeError("provider down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    _run_concurrently([call] * 3)
+    assert len(errors) == 3
+
+
+def test_waiter_gives_up_at_its_deadline():
+    flight = singleflight.SingleFlight(db_path="")
+    calls = []
+    leader = threading.Thread(target=flight.do, args=("k", _slow(calls, delay_s=0.5)))
+    leader.start()
+    time.sleep(0.05)
+    try:
+        flight.do("k", _slow(calls), deadline=time.monotonic() + 0.1)
+        raise AssertionError("expected deadline.Exceeded")
+    except singleflight._deadline.Exceeded:
+        pass
+    leader.join()
+    assert len(calls) == 1
+
+
+def test_attach_returns_none_without_a_flight():
+    assert singleflight.SingleFlight(db_path="").attach("k") is None
+
+
+def _fake_uncoalesced(calls, delay_s=0.2):
+    def fake(prompt, hedge=None, validate=None, hedge_delay_ms=None, prefer=None, output=None, deadline=None):
+        kind = "background" if getattr(llm_client._call_ctx, "background", False) else "interactive"
+        calls.append(kind)
+        time.sleep(delay_s)
+        return f"{kind} answer"
+    return fake
+
+
+def _setup(monkeypatch):
+    calls = []
+    monkeypatch.setattr(singleflight, "ENABLED", True)
+    monkeypatch.setattr(singleflight, "flight", singleflight.SingleFlight(db_path=""))
+    monkeypatch.setattr(llm_client, "_call_llm_uncoalesced", _fake_uncoalesced(calls))
+    return calls
+
+
+def _prefetch(prompt):
+    with llm_client.background_calls():
+        return llm_client.call_llm(prompt)
+
+
+def test_interactive_call_attaches_to_a_prefetch(monkeypatch):
+    calls = _setup(monkeypatch)
+    results = _run_concurrently([lambda: _prefetch("p"), lambda: llm_client.call_llm("p")])
+    assert calls == ["background"]
+    assert results == ["background answer", "background answer"]
+
+
+def test_background_call_does_not_wait_on_an_interactive_one(monkeypatch):
+    calls = _setup(monkeypatch)
+    results = _run_concurrently([lambda: llm_client.call_llm("p"), lambda: _prefetch("p")])
+    assert sorted(calls) == ["background", "interactive"]
+    assert results == ["interactive answer", "background answer"]
+
+
+def test_interactive_call_runs_itself_when_the_prefetch_fails(monkeypatch):
+    calls = _setup(monkeypatch)
+
+    def fake(prompt, *args, **kwargs):
+        if getattr(llm_client._call_ctx, "background", False):
+            calls.append("background")
+            time.sleep(0.1)
+            raise llm_client.LLMOverloaded("shed")
+        calls.append("interactive")
+        return "interactive answer"
+
+    monkeypatch.setattr(llm_client, "_call_llm_uncoalesced", fake)
+
+    def prefetch():
+        try:
+            return _prefetch("p")
+        except llm_client.LLMOverloaded:
+            return None
+
+    results = _run_concurrently([prefetch, lambda: llm_client.call_llm("p")])
+    assert calls == ["background", "interactive"]
+    assert results == [None, "interactive answer"]
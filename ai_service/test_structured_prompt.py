@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Compact roadmap prompts rely on the provider enforcing ROADMAP_SCHEMA; every request that
+goes out without the schema must carry the full prompt with its worked example instead.
+
+    python -m pytest -q test_structured_prompt.py
+"""
+import llm_client
+
+ARGS = ("Python", "beginner", "", "", 1, 3)
+
+
+def _output():
+    return llm_client._roadmap_output(3, full_prompt=llm_client._roadmap_prompt(*ARGS))
+
+
+def _sent_prompt(provider):
+    build = llm_client.PROVIDER_API[provider][0]
+    body = build(llm_client._roadmap_prompt(*ARGS, compact=True), "key", _output())[0]["json"]
+    if provider == "gemini":
+        return body["contents"][0]["parts"][0]["text"]
+    return body["messages"][0]["content"]
+
+
+def test_schema_enforcing_providers_get_the_compact_prompt(monkeypatch):
+    monkeypatch.setattr(llm_client, "_structured_unsupported", {})
+    compact = llm_client._roadmap_prompt(*ARGS, compact=True)
+    for provider in ("huggingface", "gemini", "cohere", "claude"):
+        assert _sent_prompt(provider) == compact
+
+
+def test_json_mode_providers_get_the_full_prompt(monkeypatch):
+    monkeypatch.setattr(llm_client, "_structured_unsupported", {})
+    full = llm_client._roadmap_prompt(*ARGS)
+    for provider in ("groq", "openai"):
+        assert _sent_prompt(provider) == full
+
+
+def test_plain_retry_after_schema_rejection_gets_the_full_prompt(monkeypatch):
+    monkeypatch.setattr(llm_client, "_structured_unsupported", {})
+    assert llm_client._structured_rejected("gemini", _output(), 400, '{"error": "responseSchema not supported"}')
+    body = llm_client.PROVIDER_API["gemini"][0]("compact", "key", _output())[0]["json"]
+    assert "responseSchema" not in body["generationConfig"]
+    assert body["contents"][0]["parts"][0]["text"] == llm_client._roadmap_prompt(*ARGS)
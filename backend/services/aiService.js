@@ -1,4 +1,5 @@
 // backend/services/aiService.js
+const crypto = require("crypto");
 const axios = require("axios");
 
 const AI_SERVICE_URL = (process.env.AI_SERVICE_URL || "http://localhost:5001").replace(/\/$/, "");
@@ -20,13 +21,22 @@ const shouldRetry = (error) => {
 
 const postWithRetry = async (endpoint, data, config = {}, attempts = 3) => {
     const url = `${AI_SERVICE_URL}${endpoint}`;
+    // Same key on every attempt: the AI service attaches retries to the generation already running
+    const idempotencyKey = crypto.randomUUID();
     let lastError;
+    const timeout = config.timeout || 90000;
     for (let i = 0; i < attempts; i++) {
         try {
             return await axios.post(url, data, {
                 ...config,
-                timeout: config.timeout || 90000,
-                headers: { "Content-Type": "application/json", ...config.headers },
+                timeout,
+                headers: {
+                    "Content-Type": "application/json",
+                    "Idempotency-Key": idempotencyKey,
+                    // Lets the AI service stop calling providers and answer with its template fallback in time
+                    "X-Request-Timeout-Ms": String(timeout),
+                    ...config.headers,
+                },
             });
         } catch (err) {
             lastError = err;
@@ -176,6 +176,7 @@ CREATE INDEX IF NOT EXISTS idx_user_roadmaps_status ON user_roadmaps(status);
 CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id);
 CREATE INDEX IF NOT EXISTS idx_chat_history_user_id ON chat_history(user_id);
 CREATE INDEX IF NOT EXISTS idx_chat_history_uid ON chat_history(uid);
+CREATE INDEX IF NOT EXISTS idx_chat_history_uid_id ON chat_history(uid, id);
 CREATE INDEX IF NOT EXISTS idx_user_progress_user_id ON user_progress(user_id);
 CREATE INDEX IF NOT EXISTS idx_user_progress_roadmap_id ON user_progress(roadmap_id);
 CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON notifications(user_id);